@@ -0,0 +1,255 @@
+"""
+Командная строка Cone: пакетная обработка архивных кадров
+
+    python cli.py annotate archive/2024-05 --camera ZIF1 --output out/2024-05
+    python cli.py annotate "archive/**/*.jpg" --camera ZIF2 --output out --k-vol 0.6 --workers 8
+    python cli.py timelapse archive/2024-05-14 --camera ZIF1 -o zif1_2024-05-14.mp4
+    python cli.py index out/2024-05 -o index.csv
+    python cli.py export --camera ZIF1 --from 2024-05-01 --to 2024-06-01 -o may.csv
+
+Результаты дописываются в out/results.csv; повторный запуск с той же
+выходной директорией пропускает уже обработанные кадры (по хэшу
+содержимого). После перекалибровки камеры используйте новую директорию
+или --no-resume. С флагом --record успешные измерения записываются в
+историю измерений, которая выгружается командой export.
+"""
+import argparse
+import json
+import sys
+
+from core.batch import collect_images, run_batch
+from core.exporter import EXPORT_FORMATS, export_chunks, export_to_file
+from core.metadata import INDEX_FIELDS, index_records
+from core.store import open_store, parse_time
+from core.timelapse import VIDEO_CODECS, collect_frames, make_timelapse
+from utils.config import Config
+from utils.constants import EXPORT_CHUNK_ROWS, TIMELAPSE_FPS, TIMELAPSE_WIDTH
+
+# Интервал вывода прогресса, с
+PROGRESS_INTERVAL_S = 1.0
+
+
+def _camera_profile(args, config):
+    """Профиль камеры из config.json, файла профиля и переопределений командной строки"""
+    profile = dict(config.get(f"CAM_CONE_{args.camera}", {}))
+    if args.profile:
+        with open(args.profile, encoding='utf-8') as file:
+            profile.update(json.load(file))
+    overrides = {
+        'pixel_size_m': args.pixel_size,
+        'k_vol': args.k_vol,
+        'k_den': args.k_den,
+        'threshold': args.threshold,
+    }
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
+
+
+def _progress_printer():
+    """Обработчик прогресса: не чаще раза в PROGRESS_INTERVAL_S и на последнем кадре"""
+    last = [0.0]
+
+    def report(state, record):
+        if state.done < state.total and state.elapsed - last[0] < PROGRESS_INTERVAL_S:
+            return
+        last[0] = state.elapsed
+        eta = f", ETA {state.eta:.0f}s" if state.eta is not None and state.done < state.total else ""
+        print(
+            f"\r[{state.done}/{state.total}] {state.rate:.1f} frames/s, "
+            f"skipped {state.skipped}, not detected {state.not_detected}, errors {state.failed}{eta}",
+            end='' if state.done < state.total else '\n',
+            file=sys.stderr,
+            flush=True
+        )
+
+    return report
+
+
+def cmd_annotate(args):
+    """Распознать, рассчитать и аннотировать кадры"""
+    config = Config(args.config)
+    profile = _camera_profile(args, config)
+
+    paths = collect_images(args.inputs)
+    if not paths:
+        print("No images found", file=sys.stderr)
+        return 1
+
+    store = open_store(config) if args.record else None
+    try:
+        summary = run_batch(
+            paths,
+            args.camera,
+            profile,
+            args.output,
+            workers=args.workers,
+            image_format=args.format,
+            settings=config,
+            annotate=not args.no_annotate,
+            resume=not args.no_resume,
+            store=store,
+            progress=None if args.quiet else _progress_printer()
+        )
+    finally:
+        if store:
+            store.close()
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary['failed'] == 0 else 2
+
+
+def cmd_timelapse(args):
+    """Собрать таймлапс аннотированных кадров"""
+    config = Config(args.config)
+    profile = _camera_profile(args, config)
+
+    try:
+        paths = collect_frames(args.inputs, parse_time(args.start), parse_time(args.end))
+    except ValueError as e:
+        print(f"Invalid time range: {e}", file=sys.stderr)
+        return 1
+    if not paths:
+        print("No images found", file=sys.stderr)
+        return 1
+
+    try:
+        summary = make_timelapse(
+            paths,
+            args.camera,
+            profile,
+            args.output,
+            fps=args.fps or config.get('TIMELAPSE_FPS', TIMELAPSE_FPS),
+            width=args.width or config.get('TIMELAPSE_WIDTH', TIMELAPSE_WIDTH),
+            workers=args.workers,
+            codec=args.codec,
+            resample=config.get('SCREENSHOT_RESAMPLE', 'lanczos'),
+            progress=None if args.quiet else _progress_printer()
+        )
+    except ValueError as e:
+        print(f"Timelapse failed: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary['failed'] == 0 else 2
+
+
+def cmd_index(args):
+    """Собрать индекс измерений по метаданным сохранённых кадров"""
+    config = Config(args.config)
+    chunk_rows = config.get('EXPORT_CHUNK_ROWS', EXPORT_CHUNK_ROWS)
+    paths = collect_images(args.inputs)
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in index_records(paths):
+            count += 1
+            yield record
+
+    try:
+        if args.output:
+            export_to_file(counted(), args.output, args.format, chunk_rows, INDEX_FIELDS)
+        else:
+            for data in export_chunks(counted(), args.format or 'csv', chunk_rows, INDEX_FIELDS):
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+    except ValueError as e:
+        print(f"Index failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Indexed {count} of {len(paths)} images", file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    """Выгрузить историю измерений"""
+    config = Config(args.config)
+    store = open_store(config, args.store)
+    chunk_rows = config.get('EXPORT_CHUNK_ROWS', EXPORT_CHUNK_ROWS)
+
+    try:
+        records = store.records(args.camera, parse_time(args.start), parse_time(args.end))
+        if args.output:
+            count = export_to_file(records, args.output, args.format, chunk_rows)
+            print(f"Exported {count} measurements to {args.output}", file=sys.stderr)
+        else:
+            for data in export_chunks(records, args.format or 'csv', chunk_rows):
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+    except ValueError as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cone', description='Cone Volume Calculator — пакетная обработка')
+    parser.add_argument('--config', help='Путь к config.json (по умолчанию — в директории приложения)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    annotate = subparsers.add_parser('annotate', help='Распознать, рассчитать и аннотировать архивные кадры')
+    annotate.add_argument('inputs', nargs='+', help='Директории, glob-шаблоны или файлы кадров')
+    annotate.add_argument('--camera', required=True, type=str.upper, choices=['ZIF1', 'ZIF2'],
+                          help='Профиль камеры из config.json')
+    annotate.add_argument('--output', '-o', required=True, help='Выходная директория')
+    annotate.add_argument('--profile', help='JSON-файл с профилем камеры (дополняет config.json)')
+    annotate.add_argument('--pixel-size', type=float, help='Размер пикселя, м')
+    annotate.add_argument('--k-vol', type=float, help='Коэффициент объёма')
+    annotate.add_argument('--k-den', type=float, help='Плотность, т/м³')
+    annotate.add_argument('--threshold', type=int, help='Порог бинаризации')
+    annotate.add_argument('--workers', '-j', type=int, help='Количество процессов (по умолчанию — число ядер)')
+    annotate.add_argument('--format', default='jpeg', type=str.lower, choices=['jpeg', 'png', 'webp'],
+                          help='Формат аннотированных кадров')
+    annotate.add_argument('--no-annotate', action='store_true', help='Не сохранять аннотированные кадры')
+    annotate.add_argument('--no-resume', action='store_true', help='Обработать заново уже обработанные кадры')
+    annotate.add_argument('--quiet', '-q', action='store_true', help='Не выводить прогресс')
+    annotate.add_argument('--record', action='store_true', help='Записать успешные измерения в историю измерений')
+    annotate.set_defaults(handler=cmd_annotate)
+
+    timelapse = subparsers.add_parser('timelapse', help='Собрать видео из аннотированных кадров камеры')
+    timelapse.add_argument('inputs', nargs='+', help='Директории, glob-шаблоны или файлы кадров')
+    timelapse.add_argument('--camera', required=True, type=str.upper, choices=['ZIF1', 'ZIF2'],
+                           help='Профиль камеры из config.json')
+    timelapse.add_argument('--output', '-o', required=True,
+                           help=f"Видеофайл ({', '.join(VIDEO_CODECS)})")
+    timelapse.add_argument('--from', dest='start', help='Начало интервала (ISO 8601, по времени файла)')
+    timelapse.add_argument('--to', dest='end', help='Конец интервала (ISO 8601, не включительно)')
+    timelapse.add_argument('--fps', type=float, help='Кадров в секунду ролика')
+    timelapse.add_argument('--width', type=int, help='Ширина кадра видео, px')
+    timelapse.add_argument('--codec', help='FourCC кодека (по умолчанию — по расширению файла)')
+    timelapse.add_argument('--profile', help='JSON-файл с профилем камеры (дополняет config.json)')
+    timelapse.add_argument('--pixel-size', type=float, help='Размер пикселя, м')
+    timelapse.add_argument('--k-vol', type=float, help='Коэффициент объёма')
+    timelapse.add_argument('--k-den', type=float, help='Плотность, т/м³')
+    timelapse.add_argument('--threshold', type=int, help='Порог бинаризации')
+    timelapse.add_argument('--workers', '-j', type=int, help='Количество процессов (по умолчанию — число ядер)')
+    timelapse.add_argument('--quiet', '-q', action='store_true', help='Не выводить прогресс')
+    timelapse.set_defaults(handler=cmd_timelapse)
+
+    index = subparsers.add_parser('index', help='Собрать индекс измерений по метаданным сохранённых кадров')
+    index.add_argument('inputs', nargs='+', help='Директории, glob-шаблоны или файлы кадров')
+    index.add_argument('--format', type=str.lower, choices=list(EXPORT_FORMATS),
+                       help='Формат (по умолчанию — по расширению файла, для stdout — csv)')
+    index.add_argument('--output', '-o', help='Выходной файл (по умолчанию — stdout)')
+    index.set_defaults(handler=cmd_index)
+
+    export = subparsers.add_parser('export', help='Выгрузить историю измерений в CSV, JSON Lines или Parquet')
+    export.add_argument('--camera', type=str.upper, choices=['ZIF1', 'ZIF2'], help='Только измерения камеры')
+    export.add_argument('--from', dest='start', help='Начало интервала (ISO 8601, включительно)')
+    export.add_argument('--to', dest='end', help='Конец интервала (ISO 8601, не включительно)')
+    export.add_argument('--format', type=str.lower, choices=list(EXPORT_FORMATS),
+                        help='Формат (по умолчанию — по расширению файла, для stdout — csv)')
+    export.add_argument('--output', '-o', help='Выходной файл (по умолчанию — stdout)')
+    export.add_argument('--store', help='Путь к базе истории измерений (по умолчанию — из config.json)')
+    export.set_defaults(handler=cmd_export)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
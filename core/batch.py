@@ -0,0 +1,319 @@
+"""
+Пакетная обработка архивных кадров: распознавание, расчёт и аннотирование
+
+Кадры обрабатываются пулом процессов в детерминированном порядке, результаты
+дописываются в таблицу results.csv выходной директории. Повторный запуск с
+той же директорией пропускает кадры, содержимое которых уже обработано.
+"""
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from PIL import Image
+
+from core.metadata import build_metadata, metadata_options
+from core.render import render_annotated
+from core.store import MeasurementStore
+from core.stream import build_measurement
+from core.vision import auto_detect_triangle_with_confidence
+from utils.imaging import IMAGE_FORMATS, content_hash, encoder_options, resample_filter, save_atomic
+from utils.logger import app_logger
+from utils.trassir import scale_screenshot
+
+# Таблица результатов в выходной директории
+RESULTS_FILE = 'results.csv'
+RESULT_FIELDS = (
+    'file', 'hash', 'camera', 'timestamp', 'status', 'volume', 'mass',
+    'radius_m', 'height_m', 'confidence', 'triangle', 'annotated', 'error',
+)
+
+# Статусы обработки кадра; кадры с этими статусами при повторном запуске пропускаются
+STATUS_OK = 'ok'
+STATUS_NOT_DETECTED = 'not_detected'
+STATUS_ERROR = 'error'
+STATUS_SKIPPED = 'skipped'
+FINAL_STATUSES = (STATUS_OK, STATUS_NOT_DETECTED)
+
+# Расширение файла аннотированного кадра по формату PIL
+OUTPUT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+# Настройки, переданные рабочему процессу инициализатором пула
+_worker_settings: Dict[str, Any] = {}
+
+
+class BatchProgress:
+    """Счётчики хода пакетной обработки"""
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.not_detected = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Обработанных (не пропущенных) кадров в секунду"""
+        processed = self.done - self.skipped
+        return processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени, с"""
+        rate = self.rate
+        return (self.total - self.done) / rate if rate > 0 else None
+
+    def update(self, record: Dict[str, Any]) -> None:
+        self.done += 1
+        status = record.get('status')
+        if status == STATUS_SKIPPED:
+            self.skipped += 1
+        elif status == STATUS_ERROR:
+            self.failed += 1
+        elif status == STATUS_NOT_DETECTED:
+            self.not_detected += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'total': self.total,
+            'processed': self.done - self.skipped,
+            'skipped': self.skipped,
+            'not_detected': self.not_detected,
+            'failed': self.failed,
+            'elapsed_s': round(self.elapsed, 3),
+            'rate_per_s': round(self.rate, 3),
+        }
+
+
+def collect_images(inputs: Iterable[str]) -> List[str]:
+    """
+    Собрать список кадров по директориям, glob-шаблонам и путям к файлам.
+
+    Returns:
+        Отсортированный список уникальных путей (порядок обработки детерминирован)
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = (os.path.join(item, name) for name in os.listdir(item))
+        elif glob.has_magic(item):
+            candidates = glob.glob(item, recursive=True)
+        else:
+            candidates = [item]
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_FORMATS:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def frame_timestamp(path: str) -> datetime:
+    """Время кадра — время изменения файла"""
+    return datetime.fromtimestamp(os.stat(path).st_mtime)
+
+
+def decode_frame(content: bytes, resample: str = 'lanczos') -> Image.Image:
+    """
+    Декодировать кадр и привести к ширине калибровки.
+
+    Args:
+        content: Содержимое файла изображения
+        resample: Фильтр масштабирования
+
+    Returns:
+        RGB-изображение шириной 1920px
+    """
+    image = Image.open(io.BytesIO(content))
+    image.load()
+    # Калибровочные параметры камер заданы для кадров шириной 1920px
+    return scale_screenshot(image.convert('RGB'), resample=resample_filter(resample))
+
+
+def load_processed_hashes(results_path: str) -> set:
+    """Хэши кадров, уже обработанных в таблице результатов"""
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline='', encoding='utf-8') as file:
+        return {row['hash'] for row in csv.DictReader(file) if row.get('status') in FINAL_STATUSES}
+
+
+def process_image(path: str, camera: str, cam_config: Dict[str, Any], output_dir: Optional[str] = None,
+                  image_format: str = 'JPEG', encoder: Optional[Dict[str, Any]] = None,
+                  resample: str = 'lanczos', done_hashes: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Обработать один кадр: распознавание, расчёт конуса и аннотирование.
+
+    Args:
+        path: Путь к кадру
+        camera: Тип конуса ("ZIF1" или "ZIF2")
+        cam_config: Профиль камеры (roi, cone_center, threshold, pixel_size_m, k_vol, k_den)
+        output_dir: Директория аннотированных кадров (None — не сохранять)
+        image_format: Формат PIL аннотированных кадров
+        encoder: Параметры кодировщика (см. encoder_options)
+        resample: Фильтр приведения кадра к ширине 1920px
+        done_hashes: Хэши уже обработанных кадров (такие кадры пропускаются)
+
+    Returns:
+        Запись таблицы результатов (поля RESULT_FIELDS)
+    """
+    record = {'file': path, 'camera': camera}
+    try:
+        with open(path, 'rb') as file:
+            content = file.read()
+        record['hash'] = content_hash(content)
+        if record['hash'] in done_hashes:
+            record['status'] = STATUS_SKIPPED
+            return record
+
+        frame = decode_frame(content, resample)
+        timestamp = frame_timestamp(path)
+
+        vertices, confidence = auto_detect_triangle_with_confidence(frame, camera, cam_config=cam_config)
+        if vertices is None:
+            record.update(status=STATUS_NOT_DETECTED, timestamp=timestamp.isoformat(timespec='seconds'),
+                          confidence=confidence)
+            return record
+
+        record.update(build_measurement(camera, vertices, cam_config, confidence))
+        record.update(status=STATUS_OK, timestamp=timestamp.isoformat(timespec='seconds'))
+
+        if output_dir:
+            params = {
+                'pixel_size': cam_config.get('pixel_size_m', 0.1),
+                'k_vol': cam_config.get('k_vol', 1.0),
+                'k_den': cam_config.get('k_den', 1.7),
+                'cone_type': camera,
+                'timestamp': timestamp,
+            }
+            annotated = render_annotated(frame, vertices, params, record)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            output_path = os.path.join(
+                output_dir, f"{stem}_{record['hash'][:8]}{OUTPUT_EXTENSIONS.get(image_format, '.png')}"
+            )
+            options = dict(encoder or {})
+            options.update(metadata_options(
+                image_format, build_metadata(vertices, params, record, timestamp, confidence)
+            ))
+            save_atomic(annotated, output_path, image_format, **options)
+            record['annotated'] = output_path
+    except Exception as e:
+        app_logger.error(f"Batch processing failed for {path}: {e}")
+        record.update(status=STATUS_ERROR, error=str(e))
+    return record
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    """Инициализатор рабочего процесса пула"""
+    global _worker_settings
+    _worker_settings = settings
+
+
+def _process_in_worker(path: str) -> Dict[str, Any]:
+    return process_image(path, **_worker_settings)
+
+
+def _result_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка CSV по записи результата"""
+    row = {field: record.get(field, '') for field in RESULT_FIELDS}
+    if record.get('triangle'):
+        row['triangle'] = json.dumps(record['triangle'])
+    return row
+
+
+def _store_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Запись истории измерений по результату кадра"""
+    return {**record, 'source': 'batch', 'frame_hash': record['hash']}
+
+
+def run_batch(paths: List[str], camera: str, cam_config: Dict[str, Any], output_dir: str,
+              workers: Optional[int] = None, image_format: str = 'JPEG', settings: Any = None,
+              annotate: bool = True, resume: bool = True, store: Optional[MeasurementStore] = None,
+              progress: Optional[Callable[[BatchProgress, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Обработать кадры пулом процессов и дописать результаты в results.csv.
+
+    Результаты записываются в порядке paths независимо от порядка
+    завершения в рабочих процессах; таблица сбрасывается на диск после
+    каждой строки, поэтому прерванный запуск можно продолжить.
+
+    Args:
+        paths: Пути к кадрам (см. collect_images)
+        camera: Тип конуса ("ZIF1" или "ZIF2")
+        cam_config: Профиль камеры
+        output_dir: Выходная директория (аннотированные кадры и results.csv)
+        workers: Количество процессов (по умолчанию — число ядер; 1 — без пула)
+        image_format: Формат аннотированных кадров (JPEG, PNG, WEBP)
+        settings: Конфигурация с ключами SAVE_* для кодировщика (Config или dict)
+        annotate: Сохранять ли аннотированные кадры
+        resume: Пропускать кадры, уже обработанные в этой директории
+        store: Хранилище истории, в которое записываются успешные измерения
+        progress: Обработчик progress(BatchProgress, запись) после каждого кадра
+
+    Returns:
+        Сводка: количество обработанных, пропущенных, ошибок, время и скорость
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, RESULTS_FILE)
+    done_hashes = load_processed_hashes(results_path) if resume else set()
+
+    image_format = image_format.upper()
+    worker_settings = {
+        'camera': camera,
+        'cam_config': cam_config,
+        'output_dir': output_dir if annotate else None,
+        'image_format': image_format,
+        'encoder': encoder_options(image_format, settings),
+        'resample': (settings or {}).get('SCREENSHOT_RESAMPLE', 'lanczos'),
+        'done_hashes': frozenset(done_hashes),
+    }
+
+    workers = workers or os.cpu_count() or 1
+    state = BatchProgress(len(paths))
+    app_logger.info(
+        f"Batch started: {len(paths)} frames, camera {camera}, {workers} workers, "
+        f"{len(done_hashes)} already processed"
+    )
+
+    write_header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    with open(results_path, 'a', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        if write_header:
+            writer.writeheader()
+
+        if workers == 1 or len(paths) <= 1:
+            _init_worker(worker_settings)
+            records = map(_process_in_worker, paths)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(min(workers, len(paths)), _init_worker, (worker_settings,))
+            # imap сохраняет порядок входных путей
+            records = pool.imap(_process_in_worker, paths, chunksize=4)
+
+        try:
+            for record in records:
+                if record['status'] != STATUS_SKIPPED:
+                    writer.writerow(_result_row(record))
+                    file.flush()
+                if store and record['status'] == STATUS_OK:
+                    store.append(_store_record(record))
+                state.update(record)
+                if progress:
+                    progress(state, record)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    summary = state.summary()
+    app_logger.info(f"Batch finished: {summary}")
+    return summary
@@ -0,0 +1,61 @@
+"""
+Прореживание временных рядов для графиков (Largest-Triangle-Three-Buckets)
+
+LTTB сохраняет форму ряда: из каждой корзины выбирается точка, образующая
+наибольший треугольник с выбранной точкой предыдущей корзины и средней
+точкой следующей, поэтому пики и провалы массы не сглаживаются.
+Границы корзин и средние точки вычисляются векторно; выбор в корзине
+зависит от точки предыдущей, поэтому корзины обходятся по порядку, но
+площади внутри корзины считаются одной операцией NumPy.
+"""
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Индексы точек ряда, выбранных алгоритмом LTTB.
+
+    Args:
+        x: Координаты по оси времени, неубывающие
+        y: Значения
+        points: Количество точек результата (не меньше 3)
+
+    Returns:
+        Возрастающие индексы; первая и последняя точки ряда сохраняются.
+        Если точек не больше points, возвращаются все индексы.
+
+    Raises:
+        ValueError: Массивы разной длины или points < 3
+    """
+    n = len(x)
+    if len(y) != n:
+        raise ValueError(f"Series length mismatch: {n} != {len(y)}")
+    if points < 3:
+        raise ValueError(f"LTTB needs at least 3 points, got {points}")
+    if n <= points:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Внутренние точки 1..n-2 делятся на points-2 корзины; edges[i] — начало корзины i
+    edges = (np.arange(points - 1) * (n - 2) // (points - 2) + 1).astype(np.intp)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # Третья вершина треугольника: среднее следующей корзины, для последней — последняя точка
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        # Удвоенная площадь треугольника (a, p, next) для всех точек p корзины
+        area = np.abs((ax - next_x[i]) * (y[start:stop] - ay) - (ax - x[start:stop]) * (next_y[i] - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
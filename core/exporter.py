@@ -0,0 +1,226 @@
+"""
+Потоковый экспорт истории измерений в CSV, JSON Lines и Parquet
+
+Записи обрабатываются порциями по chunk_rows строк: в памяти находится
+только текущая порция, поэтому размер выгрузки не ограничен. Parquet
+требует необязательной зависимости pyarrow.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+from utils.constants import EXPORT_CHUNK_ROWS
+from utils.logger import app_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Форматы экспорта: имя → (MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'jsonl': ('application/x-ndjson', '.jsonl'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+# Столбцы выгрузки
+EXPORT_FIELDS = (
+    'timestamp', 'camera', 'source', 'volume', 'mass', 'radius_m', 'height_m',
+    'confidence', 'triangle', 'pixel_size_m', 'k_vol', 'k_den', 'frame_hash',
+)
+
+
+def parquet_available() -> bool:
+    """Установлен ли pyarrow"""
+    return pq is not None
+
+
+def format_from_path(path: str) -> str:
+    """
+    Формат экспорта по расширению файла.
+
+    Raises:
+        ValueError: Для неизвестного расширения
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, (_, fmt_extension) in EXPORT_FORMATS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f"Unsupported export file extension: {extension or '(none)'}")
+
+
+def _check_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == 'parquet' and not parquet_available():
+        raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+    return fmt
+
+
+def _chunks(records: Iterable[Dict[str, Any]], chunk_rows: int) -> Iterator[list]:
+    """Разбить поток записей на порции"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_chunks(records: Iterable[Dict[str, Any]], fmt: str,
+                  chunk_rows: int = EXPORT_CHUNK_ROWS, fields: Sequence[str] = EXPORT_FIELDS) -> Iterator[bytes]:
+    """
+    Закодировать записи в формат экспорта порциями.
+
+    Args:
+        records: Поток записей измерений
+        fmt: csv, jsonl или parquet
+        chunk_rows: Количество строк в порции
+        fields: Столбцы выгрузки
+
+    Yields:
+        Байты очередной порции (для CSV первая порция содержит заголовок)
+
+    Raises:
+        ValueError: Неизвестный формат или parquet без pyarrow
+    """
+    fmt = _check_format(fmt)
+    if fmt == 'csv':
+        return _csv_chunks(records, chunk_rows, fields)
+    if fmt == 'jsonl':
+        return _jsonl_chunks(records, chunk_rows, fields)
+    return _parquet_chunks(records, chunk_rows, fields)
+
+
+def _csv_chunks(records, chunk_rows, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for chunk in _chunks(records, chunk_rows):
+        writer.writerows(
+            {**record, 'triangle': json.dumps(record['triangle'])} if record.get('triangle') is not None else record
+            for record in chunk
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Пустая выгрузка — только заголовок
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(records, chunk_rows, fields):
+    for chunk in _chunks(records, chunk_rows):
+        yield ''.join(
+            json.dumps({field: record.get(field) for field in fields}, ensure_ascii=False) + '\n'
+            for record in chunk
+        ).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приёмник: накапливает записанные байты до выдачи"""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_schema(fields):
+    """Схема Parquet; столбцы без явного типа хранятся строками"""
+    types = {
+        'timestamp': pa.timestamp('s'),
+        'volume': pa.float64(),
+        'mass': pa.float64(),
+        'radius_m': pa.float64(),
+        'height_m': pa.float64(),
+        'confidence': pa.float64(),
+        'triangle': pa.list_(pa.list_(pa.float64())),
+        'pixel_size_m': pa.float64(),
+        'k_vol': pa.float64(),
+        'k_den': pa.float64(),
+    }
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+
+def _parquet_chunks(records, chunk_rows, fields):
+    schema = _parquet_schema(fields)
+    sink = _ChunkSink()
+    # Каждая порция — отдельная группа строк Parquet
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for chunk in _chunks(records, chunk_rows):
+            columns = {field: [record.get(field) for record in chunk] for field in fields}
+            if 'timestamp' in columns:
+                columns['timestamp'] = [
+                    datetime.fromisoformat(value) if value else None for value in columns['timestamp']
+                ]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    # Метаданные файла записываются при закрытии
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def export_to_file(records: Iterable[Dict[str, Any]], path: str, fmt: Optional[str] = None,
+                   chunk_rows: int = EXPORT_CHUNK_ROWS, fields: Sequence[str] = EXPORT_FIELDS) -> int:
+    """
+    Экспортировать записи в файл (атомарно: временный файл и переименование).
+
+    Args:
+        records: Поток записей измерений
+        path: Путь к файлу
+        fmt: Формат (по умолчанию по расширению файла)
+        chunk_rows: Количество строк в порции
+        fields: Столбцы выгрузки
+
+    Returns:
+        Количество выгруженных записей
+    """
+    fmt = _check_format(fmt or format_from_path(path))
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            for data in export_chunks(counted(), fmt, chunk_rows, fields):
+                file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    app_logger.info(f"Exported {count} measurements to {path} ({fmt})")
+    return count
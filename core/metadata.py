@@ -0,0 +1,165 @@
+"""
+Машиночитаемые метаданные измерения в сохранённых изображениях
+
+Блок JSON с вершинами треугольника (в пикселях оригинала), камерой,
+параметрами расчёта и результатами записывается в текстовый чанк PNG
+(tEXt) или в тег EXIF ImageDescription (JPEG, WebP). Чтение использует
+только заголовок файла — пиксели не декодируются.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from PIL import Image, PngImagePlugin
+
+from core.exporter import EXPORT_FIELDS
+from core.vision import DETECTOR_VERSION
+from utils.logger import app_logger
+
+# Ключ текстового чанка PNG
+METADATA_KEY = 'cone-measurement'
+# Версия формата блока метаданных
+METADATA_VERSION = 1
+# Тег EXIF ImageDescription
+_EXIF_IMAGE_DESCRIPTION = 0x010E
+
+# Столбцы индекса архива
+INDEX_FIELDS = ('file',) + EXPORT_FIELDS
+
+
+def build_metadata(vertices, params: Dict[str, Any], cone_result: Optional[Dict[str, Any]] = None,
+                   captured_at: Optional[datetime] = None, confidence: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Сформировать блок метаданных измерения.
+
+    Args:
+        vertices: Вершины треугольника в пикселях оригинала (0..3)
+        params: Параметры отрисовки (pixel_size, k_vol, k_den, cone_type, timestamp)
+        cone_result: Параметры конуса (volume, radius_m, height_m) или None
+        captured_at: Время съёмки кадра (по умолчанию — время подписи params['timestamp'])
+        confidence: Уверенность автоопределения 0..1 (если треугольник распознан)
+
+    Returns:
+        Словарь, пригодный для JSON
+    """
+    k_den = params.get('k_den', 1.7)
+    saved_at = datetime.now()
+    captured_at = captured_at or params.get('timestamp') or saved_at
+    metadata = {
+        'v': METADATA_VERSION,
+        'camera': params.get('cone_type'),
+        'vertices': [[round(float(x), 2), round(float(y), 2)] for x, y in vertices],
+        'pixel_size_m': params.get('pixel_size', 0.1),
+        'k_vol': params.get('k_vol', 1.0),
+        'k_den': k_den,
+        'detector': DETECTOR_VERSION,
+        'captured_at': captured_at.isoformat(timespec='seconds'),
+        'saved_at': saved_at.isoformat(timespec='seconds'),
+    }
+    if confidence is not None:
+        metadata['confidence'] = confidence
+    if cone_result and len(vertices) == 3:
+        metadata.update(
+            volume=cone_result['volume'],
+            mass=cone_result['volume'] * k_den,
+            radius_m=cone_result['radius_m'],
+            height_m=cone_result['height_m'],
+        )
+    return metadata
+
+
+def metadata_options(fmt: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Аргументы Image.save для записи блока метаданных.
+
+    Args:
+        fmt: Формат PIL (PNG, JPEG, WEBP; для остальных метаданные не пишутся)
+        metadata: Блок метаданных (см. build_metadata)
+
+    Returns:
+        Аргументы pnginfo или exif для Image.save
+    """
+    # ensure_ascii: EXIF ImageDescription — ASCII-строка
+    payload = json.dumps(metadata, separators=(',', ':'), ensure_ascii=True)
+    if fmt == 'PNG':
+        info = PngImagePlugin.PngInfo()
+        info.add_text(METADATA_KEY, payload)
+        return {'pnginfo': info}
+    if fmt in ('JPEG', 'WEBP'):
+        exif = Image.Exif()
+        exif[_EXIF_IMAGE_DESCRIPTION] = payload
+        return {'exif': exif.tobytes()}
+    return {}
+
+
+def read_metadata(source) -> Optional[Dict[str, Any]]:
+    """
+    Прочитать блок метаданных измерения.
+
+    Args:
+        source: Путь к файлу или открытое изображение PIL
+
+    Returns:
+        Блок метаданных или None, если его нет или он повреждён
+    """
+    if isinstance(source, Image.Image):
+        return _read_from_image(source)
+    try:
+        # Image.open читает только заголовок; пиксели не декодируются
+        with Image.open(source) as image:
+            return _read_from_image(image)
+    except OSError as e:
+        app_logger.warning(f"Failed to read metadata from {source}: {e}")
+        return None
+
+
+def _read_from_image(image: Image.Image) -> Optional[Dict[str, Any]]:
+    # Текстовые чанки PNG перед данными изображения уже разобраны в info
+    payload = image.info.get(METADATA_KEY)
+    if payload is None and 'exif' in image.info:
+        payload = image.getexif().get(_EXIF_IMAGE_DESCRIPTION)
+    if not payload:
+        return None
+
+    try:
+        metadata = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(metadata, dict) or metadata.get('v') != METADATA_VERSION:
+        return None
+
+    vertices = metadata.get('vertices')
+    if not isinstance(vertices, list) or len(vertices) > 3 or any(len(vertex) != 2 for vertex in vertices):
+        return None
+    metadata['vertices'] = [(float(x), float(y)) for x, y in vertices]
+    return metadata
+
+
+def index_records(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Записи измерений по метаданным файлов архива (без декодирования пикселей).
+
+    Файлы без блока метаданных пропускаются.
+
+    Yields:
+        Записи в формате истории измерений с путём к файлу
+    """
+    for path in paths:
+        metadata = read_metadata(path)
+        if metadata is None:
+            continue
+        yield {
+            'file': path,
+            'timestamp': metadata.get('captured_at'),
+            'camera': metadata.get('camera'),
+            'source': 'file',
+            'volume': metadata.get('volume'),
+            'mass': metadata.get('mass'),
+            'radius_m': metadata.get('radius_m'),
+            'height_m': metadata.get('height_m'),
+            'confidence': metadata.get('confidence'),
+            'triangle': [list(vertex) for vertex in metadata['vertices']],
+            'pixel_size_m': metadata.get('pixel_size_m'),
+            'k_vol': metadata.get('k_vol'),
+            'k_den': metadata.get('k_den'),
+        }
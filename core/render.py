@@ -0,0 +1,362 @@
+"""
+Отрисовка аннотированного изображения без зависимости от Tkinter
+
+Используется окном приложения при сохранении, веб-приложением и
+пакетной обработкой.
+"""
+import hashlib
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from PIL import Image, ImageDraw, ImageFont
+
+from core.cone_calculator import ConeCalculator
+from utils.cache import LRUCache
+from utils.constants import CANVAS_WIDTH, COLOR_TRIANGLE, COLOR_VERTEX, LINE_WIDTH, VERTEX_RADIUS
+from utils.metrics import STAGE_SECONDS
+
+_ANNOTATE_SECONDS = STAGE_SECONDS.labels(stage='annotate')
+
+# Загруженные шрифты по размеру: truetype читает файл с диска при каждом вызове
+_FONT_CACHE = LRUCache(8)
+
+SIDE_NAMES = ('AB', 'BC', 'CA')
+
+
+def annotation_scale(image_size: Sequence[int], display_width: Optional[float] = None) -> float:
+    """
+    Масштаб элементов разметки (толщина линий, шрифты) для изображения.
+
+    Args:
+        image_size: Размер изображения (ширина, высота)
+        display_width: Ширина, в которой изображение показывалось пользователю;
+            по умолчанию — ширина холста приложения
+
+    Returns:
+        Коэффициент масштаба от отображаемого к оригинальному изображению
+    """
+    display_width = display_width or min(image_size[0], CANVAS_WIDTH)
+    return image_size[0] / display_width
+
+
+def annotation_key(image_id: str, vertices_original, params: Dict[str, Any]) -> str:
+    """
+    Ключ аннотированного изображения для кэширования.
+
+    Args:
+        image_id: Идентификатор исходного изображения
+        vertices_original: Вершины в пикселях оригинала
+        params: Параметры отрисовки (см. render_annotated)
+
+    Returns:
+        Шестнадцатеричный SHA-1 от изображения, вершин и параметров
+    """
+    payload = json.dumps(
+        {
+            'image': image_id,
+            'vertices': [[round(float(x), 3), round(float(y), 3)] for x, y in vertices_original],
+            'params': params,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def get_font(size: int):
+    """
+    Получить шрифт заданного размера (загруженные шрифты кэшируются).
+
+    Args:
+        size: Размер шрифта
+
+    Returns:
+        Объект шрифта
+    """
+    font = _FONT_CACHE.get(size)
+    if font is None:
+        try:
+            font = ImageFont.truetype("arial.ttf", size)
+        except OSError:
+            font = ImageFont.load_default()
+        _FONT_CACHE.put(size, font)
+    return font
+
+
+def render_annotated(image: Image.Image, vertices_original, params: Dict[str, Any],
+                     cone_result: Optional[Dict[str, Any]] = None) -> Image.Image:
+    """
+    Нарисовать треугольник, подписи сторон и блок метаданных на копии изображения.
+
+    Args:
+        image: Исходное изображение (не изменяется)
+        vertices_original: Вершины треугольника в пикселях оригинала (0..3)
+        params: Параметры отрисовки:
+            pixel_size — размер пикселя, м (по умолчанию 0.1);
+            k_vol — коэффициент объёма (1.0); k_den — плотность, т/м³ (1.7);
+            cone_type — тип конуса для подписи (необязательно);
+            scale — масштаб разметки (по умолчанию annotation_scale());
+            timestamp — datetime для подписи (по умолчанию текущее время)
+        cone_result: Результат ConeCalculator.get_cone_parameters; если не
+            передан, вычисляется по вершинам
+
+    Returns:
+        Новое RGB-изображение с аннотациями
+    """
+    with _ANNOTATE_SECONDS.time():
+        # Копия изображения для наложения (единственное преобразование кадра)
+        output_image = image.convert('RGB')
+        scale_factor = params.get('scale') or annotation_scale(output_image.size)
+        vertices = [(float(x), float(y)) for x, y in vertices_original]
+
+        if len(vertices) == 3 and cone_result is None:
+            cone_result = ConeCalculator.get_cone_parameters(
+                vertices, params.get('pixel_size', 0.1), 1.0, params.get('k_vol', 1.0)
+            )
+
+        # Подписи собираются целиком, фоны накладываются за один проход
+        labels = []
+
+        # Наложение треугольника
+        if len(vertices) == 3:
+            labels.extend(_draw_triangle(output_image, vertices, params, scale_factor))
+
+        # Наложение текста
+        text_lines = metadata_lines(params, cone_result if len(vertices) == 3 else None)
+        if text_lines:
+            labels.append(_layout_metadata_text(output_image, text_lines, scale_factor))
+
+        _draw_labels(output_image, labels)
+    return output_image
+
+
+def metadata_lines(params: Dict[str, Any], cone_result: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Подготовить текст метаданных.
+
+    Args:
+        params: Параметры отрисовки (см. render_annotated)
+        cone_result: Параметры конуса или None
+
+    Returns:
+        Список строк текста
+    """
+    text_lines = []
+
+    # Дата-время
+    timestamp = params.get('timestamp') or datetime.now()
+    text_lines.append(timestamp.strftime("%d.%m.%Y %H:%M:%S"))
+
+    # Информация о конусе
+    if cone_result and cone_result['volume'] > 0:
+        pixel_size = params.get('pixel_size', 0.1)
+        k_vol = params.get('k_vol', 1.0)
+        k_den = params.get('k_den', 1.7)
+        cone_type = params.get('cone_type')
+
+        volume = cone_result['volume']
+        mass = volume * k_den
+        radius = cone_result['radius_m']
+        height = cone_result['height_m']
+
+        # Добавляем информацию о конусе
+        text_lines.append("")
+        if cone_type:
+            text_lines.append(f"Конус {cone_type}")
+        text_lines.append(f"Объём: {volume:.2f} м³")
+        text_lines.append(f"Масса: {mass:.2f} т")
+        text_lines.append(f"Радиус: {radius:.2f} м")
+        text_lines.append(f"Высота: {height:.2f} м")
+
+        # Добавляем параметры через разделитель
+        text_lines.append(" ")
+        text_lines.append("-" * 30)
+        text_lines.append(" ")
+        text_lines.append(f"Размер пикселя: {pixel_size:.4f} м")
+        text_lines.append(f"Коэффициент объёма: {k_vol:.2f}")
+        text_lines.append(f"Плотность: {k_den:.2f} т/м³")
+
+    return text_lines
+
+
+def _draw_triangle(output_image, vertices, params, scale_factor):
+    """
+    Нарисовать треугольник на изображении.
+
+    Returns:
+        Список подписей сторон для _draw_labels
+    """
+    draw = ImageDraw.Draw(output_image)
+
+    # Рисуем линии треугольника
+    line_width = max(2, int(LINE_WIDTH * scale_factor))
+    for i in range(3):
+        draw.line([vertices[i], vertices[(i + 1) % 3]], fill=COLOR_TRIANGLE, width=line_width)
+
+    # Рисуем вершины
+    vertex_radius = max(4, int(VERTEX_RADIUS * scale_factor))
+    for x, y in vertices:
+        draw.ellipse(
+            [x - vertex_radius, y - vertex_radius,
+             x + vertex_radius, y + vertex_radius],
+            fill=COLOR_VERTEX,
+            outline=COLOR_TRIANGLE
+        )
+
+    # Подписываем стороны
+    return _layout_side_labels(draw, vertices, params.get('pixel_size', 0.1), scale_factor)
+
+
+def _layout_side_labels(draw, vertices, pixel_size, scale_factor):
+    """
+    Разместить подписи сторон треугольника.
+
+    Returns:
+        Список подписей для _draw_labels
+    """
+    # Загружаем шрифт для подписей сторон
+    label_font = get_font(max(10, int(12 * scale_factor)))
+
+    labels = []
+    for i in range(3):
+        # Координаты середины стороны
+        start = vertices[i]
+        end = vertices[(i + 1) % 3]
+        mid_x = (start[0] + end[0]) / 2
+        mid_y = (start[1] + end[1]) / 2
+
+        # Вычисляем смещение для текста (перпендикулярно стороне)
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        length = math.hypot(dx, dy)
+
+        if length == 0:
+            continue
+
+        # Текст с размерами (длина в пикселях оригинала)
+        label_text = f"{SIDE_NAMES[i]}: {length:.0f}px ({length * pixel_size:.2f}м)"
+
+        # Нормализованный перпендикулярный вектор
+        perp_x = -dy / length
+        perp_y = dx / length
+
+        # Смещение текста от линии
+        offset = max(15, int(20 * scale_factor))
+        text_x = mid_x + perp_x * offset
+        text_y = mid_y + perp_y * offset
+
+        # Получаем размер текста для фона
+        bbox = draw.textbbox((0, 0), label_text, font=label_font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        # Полупрозрачный фон для текста
+        padding = max(3, int(4 * scale_factor))
+        labels.append({
+            'box': (
+                text_x - padding,
+                text_y - padding,
+                text_x + text_width + padding,
+                text_y + text_height + padding
+            ),
+            'background': (255, 255, 255, 200),
+            'lines': [((text_x, text_y), label_text)],
+            'color': (0, 0, 0),
+            'font': label_font
+        })
+
+    return labels
+
+
+def _layout_metadata_text(output_image, text_lines, scale_factor):
+    """
+    Разместить блок метаданных в левом нижнем углу изображения.
+
+    Returns:
+        Подпись для _draw_labels
+    """
+    draw = ImageDraw.Draw(output_image)
+
+    # Пытаемся загрузить шрифт
+    font = get_font(max(12, int(14 * scale_factor)))
+
+    # Размеры изображения
+    img_width, img_height = output_image.size
+
+    # Отступы
+    margin = max(10, int(15 * scale_factor))
+    line_spacing = max(2, int(5 * scale_factor))
+
+    # Вычисляем высоту текста
+    line_heights = []
+    max_width = 0
+    for line in text_lines:
+        bbox = draw.textbbox((0, 0), line, font=font)
+        line_heights.append(bbox[3] - bbox[1])
+        max_width = max(max_width, bbox[2] - bbox[0])
+    total_height = sum(line_heights) + line_spacing * len(text_lines)
+
+    # Позиция текста (левый нижний угол)
+    text_x = margin
+    text_y = img_height - total_height - margin
+
+    # Позиции строк
+    lines = []
+    current_y = text_y
+    for line, line_height in zip(text_lines, line_heights):
+        lines.append(((text_x, current_y), line))
+        current_y += line_height + line_spacing
+
+    # Полупрозрачный фон для текста
+    padding = max(5, int(8 * scale_factor))
+    return {
+        'box': (
+            text_x - padding,
+            text_y - padding,
+            text_x + max_width + padding * 2,
+            img_height - margin + padding
+        ),
+        'background': (0, 0, 0, 180),
+        'lines': lines,
+        'color': (255, 255, 255),
+        'font': font
+    }
+
+
+def _draw_labels(output_image, labels):
+    """
+    Нарисовать подписи: сначала все полупрозрачные фоны, затем текст.
+
+    Фон смешивается только в пределах своего прямоугольника, поэтому
+    полнокадровые слои RGBA и преобразования режима не нужны.
+    """
+    for label in labels:
+        _blend_box(output_image, label['box'], label['background'])
+
+    draw = ImageDraw.Draw(output_image)
+    for label in labels:
+        for position, text in label['lines']:
+            draw.text(position, text, fill=label['color'], font=label['font'])
+
+
+def _blend_box(image, box, rgba):
+    """
+    Наложить полупрозрачный прямоугольник на RGB-изображение.
+
+    Args:
+        image: RGB-изображение (изменяется на месте)
+        box: (left, top, right, bottom), границы включительно, как у ImageDraw.rectangle
+        rgba: Цвет заливки с альфа-каналом
+    """
+    left = max(0, math.floor(box[0]))
+    top = max(0, math.floor(box[1]))
+    right = min(image.width, math.floor(box[2]) + 1)
+    bottom = min(image.height, math.floor(box[3]) + 1)
+    if right <= left or bottom <= top:
+        return
+
+    region = image.crop((left, top, right, bottom))
+    fill = Image.new('RGB', region.size, rgba[:3])
+    image.paste(Image.blend(region, fill, rgba[3] / 255), (left, top))
@@ -0,0 +1,154 @@
+"""
+Агрегаты массы конуса по часам, сменам и суткам
+
+Агрегат интервала (количество, сумма, минимум, максимум и последнее
+значение массы) хранится в таблице rollups и обновляется в той же
+транзакции, что и вставка измерений: каждое измерение изменяет ровно
+одну строку на разрешение. Сумма, минимум и максимум не зависят от
+порядка измерений, а последнее значение заменяется только более
+поздним по времени измерения, поэтому опоздавшие и пришедшие не по
+порядку измерения учитываются верно.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from utils.constants import HISTORY_MAX_BUCKETS, SHIFT_START_HOURS
+
+# Разрешения от мелкого к крупному
+RESOLUTIONS = ('hour', 'shift', 'day')
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    camera TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum_mass REAL NOT NULL,
+    min_mass REAL NOT NULL,
+    max_mass REAL NOT NULL,
+    last_ts INTEGER NOT NULL,
+    last_mass REAL NOT NULL,
+    PRIMARY KEY (camera, resolution, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Правые части SET вычисляются по старым значениям строки
+ROLLUP_UPSERT = """
+INSERT INTO rollups (camera, resolution, bucket, count, sum_mass, min_mass, max_mass, last_ts, last_mass)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (camera, resolution, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    sum_mass = sum_mass + excluded.sum_mass,
+    min_mass = MIN(min_mass, excluded.min_mass),
+    max_mass = MAX(max_mass, excluded.max_mass),
+    last_mass = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_mass ELSE last_mass END,
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+def normalize_shift_hours(hours: Iterable[int]) -> Tuple[int, ...]:
+    """
+    Часы начала смен, упорядоченные по возрастанию.
+
+    Raises:
+        ValueError: Пустой список или час вне 0..23
+    """
+    hours = tuple(sorted({int(hour) for hour in hours}))
+    if not hours or hours[0] < 0 or hours[-1] > 23:
+        raise ValueError(f"Invalid shift start hours: {list(hours)}")
+    return hours
+
+
+def bucket_start(moment: datetime, resolution: str,
+                 shift_hours: Sequence[int] = SHIFT_START_HOURS) -> datetime:
+    """
+    Начало интервала агрегата, содержащего момент (местное время).
+
+    Часы до начала первой смены относятся к последней смене предыдущих суток.
+
+    Raises:
+        ValueError: Неизвестное разрешение
+    """
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return midnight
+    if resolution == 'shift':
+        started = [hour for hour in shift_hours if hour <= moment.hour]
+        if started:
+            return midnight.replace(hour=started[-1])
+        return (midnight - timedelta(days=1)).replace(hour=shift_hours[-1])
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def bucket_seconds(resolution: str, shift_hours: Sequence[int] = SHIFT_START_HOURS) -> float:
+    """Средняя длительность интервала агрегата в секундах"""
+    if resolution == 'hour':
+        return 3600
+    if resolution == 'shift':
+        return 86400 / len(shift_hours)
+    return 86400
+
+
+def pick_resolution(start: datetime, end: datetime, max_buckets: int = HISTORY_MAX_BUCKETS,
+                    shift_hours: Sequence[int] = SHIFT_START_HOURS) -> str:
+    """
+    Самое мелкое разрешение, при котором интервал укладывается в max_buckets
+    агрегатов (для длинных интервалов — сутки).
+    """
+    span = max((end - start).total_seconds(), 0)
+    for resolution in RESOLUTIONS:
+        if span / bucket_seconds(resolution, shift_hours) <= max_buckets:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def aggregate(rows: Iterable[Tuple[Optional[str], int, Optional[float]]],
+              shift_hours: Sequence[int] = SHIFT_START_HOURS,
+              into: Optional[Dict[tuple, list]] = None) -> Dict[tuple, list]:
+    """
+    Свернуть измерения в агрегаты всех разрешений.
+
+    Пачка измерений сворачивается заранее, чтобы на каждую затронутую
+    строку rollups приходилась одна операция UPSERT.
+
+    Args:
+        rows: Тройки (камера, время в секундах Unix, масса); измерения без
+            камеры или массы пропускаются
+        shift_hours: Часы начала смен
+        into: Словарь, в который добавляются агрегаты (для свёртки порциями)
+
+    Returns:
+        {(камера, разрешение, начало интервала): [count, sum, min, max, last_ts, last_mass]}
+    """
+    buckets = {} if into is None else into
+    for camera, ts, mass in rows:
+        if not camera or mass is None:
+            continue
+        moment = datetime.fromtimestamp(ts)
+        for resolution in RESOLUTIONS:
+            key = (camera, resolution, int(bucket_start(moment, resolution, shift_hours).timestamp()))
+            state = buckets.get(key)
+            if state is None:
+                buckets[key] = [1, mass, mass, mass, ts, mass]
+                continue
+            state[0] += 1
+            state[1] += mass
+            if mass < state[2]:
+                state[2] = mass
+            if mass > state[3]:
+                state[3] = mass
+            if ts >= state[4]:
+                state[4] = ts
+                state[5] = mass
+    return buckets
+
+
+def upsert_rows(buckets: Dict[tuple, list]) -> Iterable[tuple]:
+    """Параметры ROLLUP_UPSERT для агрегатов aggregate()"""
+    return (key + tuple(state) for key, state in buckets.items())
@@ -0,0 +1,537 @@
+"""
+Хранилище истории измерений (SQLite в режиме WAL)
+
+Запись идёт через очередь: append() только кладёт запись в очередь и не
+блокирует вызывающий поток (окно Tk, запросы Flask, поллер камеры), а
+отдельный поток-писатель забирает записи пачками и вставляет каждую
+пачку одной транзакцией. В той же транзакции обновляются агрегаты по
+часам, сменам и суткам (см. core.rollups). Чтение выполняется в
+собственном соединении и в режиме WAL не ждёт писателя.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.rollups import (
+    RESOLUTIONS, ROLLUP_SCHEMA, ROLLUP_UPSERT, aggregate, bucket_start, normalize_shift_hours, pick_resolution,
+    upsert_rows,
+)
+from utils.constants import HISTORY_MAX_BUCKETS, MEASUREMENT_STORE, SHIFT_START_HOURS, STORE_BATCH_SIZE
+from utils.logger import app_logger
+from utils.metrics import REGISTRY, STAGE_SECONDS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_WRITE_SECONDS = STAGE_SECONDS.labels(stage='store_write')
+_ROWS_WRITTEN = REGISTRY.counter('cone_store_rows_written_total', 'Measurements written to the history store')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    camera TEXT,
+    ts INTEGER NOT NULL,
+    source TEXT,
+    triangle TEXT,
+    pixel_size_m REAL,
+    k_vol REAL,
+    k_den REAL,
+    volume REAL,
+    mass REAL,
+    radius_m REAL,
+    height_m REAL,
+    confidence REAL,
+    frame_hash TEXT,
+    file TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_camera_ts ON measurements (camera, ts);
+CREATE INDEX IF NOT EXISTS measurements_ts ON measurements (ts);
+"""
+
+# Столбцы таблицы, заполняемые из записи измерения (кроме ts и triangle)
+_VALUE_COLUMNS = (
+    'camera', 'source', 'pixel_size_m', 'k_vol', 'k_den', 'volume', 'mass',
+    'radius_m', 'height_m', 'confidence', 'frame_hash', 'file',
+)
+_COLUMNS = ('ts', 'triangle') + _VALUE_COLUMNS
+# Положение камеры и массы в строке _INSERT
+_CAMERA_INDEX = _COLUMNS.index('camera')
+_MASS_INDEX = _COLUMNS.index('mass')
+_INSERT = (
+    f"INSERT INTO measurements ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNS)})"
+)
+
+# Сколько строк читать из курсора за раз при потоковом чтении
+_FETCH_ROWS = 1000
+
+# Маркер остановки потока-писателя
+_STOP = object()
+
+
+def store_path(config) -> str:
+    """
+    Путь к базе истории измерений из конфигурации.
+
+    Относительный путь отсчитывается от директории config.json.
+    """
+    path = config.get('MEASUREMENT_STORE', MEASUREMENT_STORE)
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(config.config_path)), path)
+
+
+def open_store(config, path: Optional[str] = None) -> 'MeasurementStore':
+    """
+    Хранилище истории с параметрами из конфигурации.
+
+    Все процессы, работающие с одной базой, должны открывать её с одинаковыми
+    часами смен, иначе агрегаты по сменам будут пересчитываться заново.
+
+    Args:
+        config: Конфигурация приложения
+        path: Путь к базе (по умолчанию — store_path(config))
+    """
+    return MeasurementStore(
+        path or store_path(config),
+        config.get('STORE_BATCH_SIZE', STORE_BATCH_SIZE),
+        config.get('SHIFT_START_HOURS', SHIFT_START_HOURS),
+    )
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Разобрать границу интервала времени (ISO 8601, дата или дата и время).
+
+    Raises:
+        ValueError: Если строка не в формате ISO 8601
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def to_epoch(value) -> int:
+    """
+    Время измерения (datetime, строка ISO 8601 или секунды Unix) в секундах Unix.
+
+    Raises:
+        ValueError: Строка не в формате ISO 8601
+        TypeError: Значение другого типа
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        raise TypeError(f"Unsupported timestamp type: {type(value).__name__}")
+    return int(value.timestamp())
+
+
+class ProducerLock:
+    """
+    Межпроцессная блокировка производителя измерений (flock на файле рядом с базой).
+
+    Нужна, когда одни и те же измерения получают несколько процессов
+    (рабочие процессы gunicorn с поллерами одной камеры): записывает только
+    владелец блокировки. Блокировка снимается при release() или завершении
+    процесса. Без fcntl (Windows, один процесс) блокировка всегда захвачена.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Путь к файлу блокировки
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        """
+        Захватить блокировку без ожидания.
+
+        Returns:
+            True, если блокировка захвачена (или уже принадлежит процессу)
+        """
+        if fcntl is None:
+            return True
+        if self._file is not None:
+            return True
+        file = open(self.path, 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        self._file = file
+        return True
+
+    def release(self) -> None:
+        """Освободить блокировку"""
+        if self._file is not None:
+            # Закрытие файла снимает flock
+            self._file.close()
+            self._file = None
+
+
+class MeasurementStore:
+    """История измерений: неблокирующая запись пачками и потоковое чтение с фильтрами"""
+
+    def __init__(self, path: str, batch_size: int = STORE_BATCH_SIZE,
+                 shift_hours: Sequence[int] = SHIFT_START_HOURS) -> None:
+        """
+        Args:
+            path: Путь к файлу базы SQLite
+            batch_size: Максимум записей в одной транзакции писателя
+            shift_hours: Часы начала смен для агрегатов по сменам
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.shift_hours = normalize_shift_hours(shift_hours)
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            # Режим WAL сохраняется в файле базы
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA + ROLLUP_SCHEMA)
+            self._ensure_rollups(connection)
+        finally:
+            connection.close()
+
+    def _ensure_rollups(self, connection: sqlite3.Connection) -> None:
+        """
+        Пересчитать агрегаты, если они построены для других часов смен
+        (или ещё не построены для базы с измерениями).
+        """
+        shift_key = json.dumps(list(self.shift_hours))
+        # BEGIN IMMEDIATE: при одновременном запуске пересчёт выполнит один процесс
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT value FROM store_meta WHERE key = 'shift_hours'").fetchone()
+            if row and row[0] == shift_key:
+                connection.rollback()
+                return
+            connection.execute("DELETE FROM rollups")
+            buckets = {}
+            cursor = connection.execute("SELECT camera, ts, mass FROM measurements")
+            while True:
+                rows = cursor.fetchmany(_FETCH_ROWS)
+                if not rows:
+                    break
+                aggregate(rows, self.shift_hours, buckets)
+            connection.executemany(ROLLUP_UPSERT, upsert_rows(buckets))
+            connection.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('shift_hours', ?)", (shift_key,)
+            )
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        if buckets:
+            app_logger.info(f"Measurement rollups rebuilt: {len(buckets)} buckets, shifts at {shift_key}")
+
+    def producer_lock(self, name: str) -> ProducerLock:
+        """Блокировка производителя измерений name для этой базы"""
+        return ProducerLock(f"{self.path}.{name}.lock")
+
+    def _ensure_writer(self) -> queue.Queue:
+        """
+        Очередь записи; поток-писатель запускается при первой записи.
+
+        Ленивый запуск нужен для gunicorn с предзагрузкой приложения: потоки
+        мастер-процесса не переживают fork(), поэтому каждый рабочий процесс
+        запускает собственного писателя.
+        """
+        with self._lock:
+            if self._writer_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(
+                    target=self._write_loop, args=(self._queue,), name='measurement-store', daemon=True
+                )
+                self._writer.start()
+                self._writer_pid = os.getpid()
+            return self._queue
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        # В режиме WAL synchronous=NORMAL не теряет целостность базы при сбое
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        Поставить измерение в очередь на запись (не блокирует).
+
+        Args:
+            record: Запись измерения: timestamp (ISO 8601 или datetime), camera,
+                source, triangle, pixel_size_m, k_vol, k_den, volume, mass,
+                radius_m, height_m, confidence, frame_hash, file
+        """
+        if self._closed:
+            app_logger.warning("Measurement store is closed, record dropped")
+            return
+        self._ensure_writer().put(record)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Дождаться записи всех поставленных в очередь измерений.
+
+        Returns:
+            True, если очередь записана до истечения таймаута
+        """
+        if self._writer_pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Записать очередь и остановить поток-писатель"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer_pid == os.getpid():
+            self._queue.put(_STOP)
+            self._writer.join(timeout)
+
+    @staticmethod
+    def _row(record: Dict[str, Any]) -> tuple:
+        """
+        Строка _INSERT по записи измерения.
+
+        Raises:
+            ValueError, TypeError: Неверное время или масса
+        """
+        timestamp = record.get('timestamp')
+        triangle = record.get('triangle')
+        row = (
+            to_epoch(datetime.now() if timestamp is None else timestamp),
+            json.dumps(triangle) if triangle is not None else None,
+        ) + tuple(record.get(column) for column in _VALUE_COLUMNS)
+        # Масса участвует в агрегатах, поэтому проверяется до записи
+        if row[_MASS_INDEX] is not None:
+            row = row[:_MASS_INDEX] + (float(row[_MASS_INDEX]),) + row[_MASS_INDEX + 1:]
+        return row
+
+    def _write_loop(self, records: queue.Queue) -> None:
+        connection = self._connect()
+        try:
+            while True:
+                batch = [records.get()]
+                # Всё, что накопилось, пишется одной транзакцией
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(records.get_nowait())
+                    except queue.Empty:
+                        break
+
+                rows = []
+                for item in batch:
+                    if isinstance(item, dict):
+                        try:
+                            rows.append(self._row(item))
+                        except Exception as e:
+                            # Одна неверная запись не должна останавливать писателя
+                            app_logger.error(f"Invalid measurement record skipped: {e!r}")
+                if rows:
+                    self._write_rows(connection, rows)
+
+                stop = False
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    elif item is _STOP:
+                        stop = True
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def _write_rows(self, connection: sqlite3.Connection, rows: list) -> None:
+        try:
+            with _WRITE_SECONDS.time(), connection:
+                connection.executemany(_INSERT, rows)
+                buckets = aggregate(
+                    ((row[_CAMERA_INDEX], row[0], row[_MASS_INDEX]) for row in rows), self.shift_hours
+                )
+                connection.executemany(ROLLUP_UPSERT, upsert_rows(buckets))
+            _ROWS_WRITTEN.inc(len(rows))
+        except Exception as e:
+            # Поток-писатель завершается только по _STOP: иначе последующие
+            # измерения копились бы в очереди без записи
+            app_logger.error(f"Failed to write {len(rows)} measurements to {self.path}: {e!r}")
+            if len(rows) > 1 and not isinstance(e, sqlite3.OperationalError):
+                # Пачка откатилась из-за неверной строки: остальные пишутся по одной
+                for row in rows:
+                    self._write_rows(connection, [row])
+
+    def _where(self, camera: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+        clauses, params = [], []
+        if camera:
+            clauses.append("camera = ?")
+            params.append(camera.upper())
+        if start:
+            clauses.append("ts >= ?")
+            params.append(to_epoch(start))
+        if end:
+            clauses.append("ts < ?")
+            params.append(to_epoch(end))
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def records(self, camera: Optional[str] = None, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Прочитать измерения в хронологическом порядке.
+
+        Строки читаются из курсора порциями, поэтому объём выборки не
+        ограничен памятью.
+
+        Args:
+            camera: Только измерения камеры (ZIF1, ZIF2)
+            start: Не раньше этого времени (включительно)
+            end: Раньше этого времени (не включительно)
+
+        Yields:
+            Записи измерений (timestamp — строка ISO 8601, triangle — список вершин)
+        """
+        where, params = self._where(camera, start, end)
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM measurements{where} ORDER BY ts, id", params
+            )
+            while True:
+                rows = cursor.fetchmany(_FETCH_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    record = dict(zip(_VALUE_COLUMNS, row[2:]))
+                    record['timestamp'] = datetime.fromtimestamp(row[0]).isoformat(timespec='seconds')
+                    record['triangle'] = json.loads(row[1]) if row[1] else None
+                    yield record
+        finally:
+            connection.close()
+
+    def count(self, camera: Optional[str] = None, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> int:
+        """Количество измерений с фильтрами records()"""
+        where, params = self._where(camera, start, end)
+        connection = self._connect()
+        try:
+            return connection.execute(f"SELECT COUNT(*) FROM measurements{where}", params).fetchone()[0]
+        finally:
+            connection.close()
+
+    def series(self, camera: str, start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ряд массы камеры для графика (измерения без массы пропускаются).
+
+        Returns:
+            (время в секундах Unix, int64; масса, float64) в хронологическом порядке
+        """
+        where, params = self._where(camera, start, end)
+        where += " AND mass IS NOT NULL" if where else " WHERE mass IS NOT NULL"
+        connection = self._connect()
+        try:
+            cursor = connection.execute(f"SELECT ts, mass FROM measurements{where} ORDER BY ts, id", params)
+            # Строки курсора разбираются сразу в массив без промежуточного списка
+            rows = np.fromiter(cursor, dtype=[('ts', np.int64), ('mass', np.float64)])
+        finally:
+            connection.close()
+        return rows['ts'], rows['mass']
+
+    def last_id(self) -> int:
+        """
+        Идентификатор последнего записанного измерения (0 для пустой базы).
+
+        Меняется при любой записи, в том числе из других процессов, поэтому
+        годится как версия данных для кэшей чтения.
+        """
+        connection = self._connect()
+        try:
+            return connection.execute("SELECT MAX(id) FROM measurements").fetchone()[0] or 0
+        finally:
+            connection.close()
+
+    def rollups(self, camera: Optional[str] = None, start: Optional[datetime] = None,
+                end: Optional[datetime] = None, resolution: Optional[str] = None,
+                max_buckets: int = HISTORY_MAX_BUCKETS) -> Dict[str, Any]:
+        """
+        Агрегаты массы по часам, сменам или суткам.
+
+        Без явного разрешения выбирается самое мелкое, при котором интервал
+        укладывается в max_buckets агрегатов на камеру. Первый агрегат
+        начинается не позже start, поэтому покрывает и его начало.
+
+        Args:
+            camera: Только агрегаты камеры (по умолчанию — всех камер)
+            start: Начало интервала (по умолчанию — первое измерение)
+            end: Конец интервала, не включительно (по умолчанию — сейчас)
+            resolution: hour, shift, day или None (выбрать автоматически)
+            max_buckets: Предел количества агрегатов для автоматического выбора
+
+        Returns:
+            {'resolution': разрешение, 'buckets': [{camera, bucket, count, min, max, mean, last, last_at}]}
+
+        Raises:
+            ValueError: Неизвестное разрешение
+        """
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+        connection = self._connect()
+        try:
+            clauses, params = [], []
+            if camera:
+                clauses.append("camera = ?")
+                params.append(camera.upper())
+            if start is None:
+                first = connection.execute(
+                    f"SELECT MIN(bucket) FROM rollups WHERE {' AND '.join(clauses + ['resolution = ?'])}",
+                    params + [RESOLUTIONS[-1]]
+                ).fetchone()[0]
+                if first is None:
+                    return {'resolution': resolution or RESOLUTIONS[-1], 'buckets': []}
+                start = datetime.fromtimestamp(first)
+            end = end or datetime.now()
+            resolution = resolution or pick_resolution(start, end, max_buckets, self.shift_hours)
+
+            clauses += ["resolution = ?", "bucket >= ?", "bucket < ?"]
+            params += [resolution, to_epoch(bucket_start(start, resolution, self.shift_hours)), to_epoch(end)]
+            cursor = connection.execute(
+                "SELECT camera, bucket, count, sum_mass, min_mass, max_mass, last_mass, last_ts FROM rollups "
+                f"WHERE {' AND '.join(clauses)} ORDER BY bucket, camera", params
+            )
+            buckets = [
+                {
+                    'camera': row[0],
+                    'bucket': datetime.fromtimestamp(row[1]).isoformat(timespec='seconds'),
+                    'count': row[2],
+                    'min': row[4],
+                    'max': row[5],
+                    'mean': row[3] / row[2],
+                    'last': row[6],
+                    'last_at': datetime.fromtimestamp(row[7]).isoformat(timespec='seconds'),
+                }
+                for row in cursor
+            ]
+            return {'resolution': resolution, 'buckets': buckets}
+        finally:
+            connection.close()
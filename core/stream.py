@@ -0,0 +1,316 @@
+"""
+Поток измерений: фоновый опрос камер и рассылка результатов подписчикам
+"""
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from core.cone_calculator import ConeCalculator
+from core.store import MeasurementStore, ProducerLock
+from core.vision import auto_detect_triangle_with_confidence
+from utils.constants import STREAM_POLL_INTERVAL_S, STREAM_QUEUE_SIZE
+from utils.imaging import content_hash
+from utils.logger import app_logger
+from utils.metrics import REGISTRY
+from utils.trassir import TrassirRegistry, img_to_pillow, scale_screenshot
+
+_SUBSCRIBERS = REGISTRY.gauge(
+    'cone_stream_subscribers', 'Active SSE subscribers by camera', labelnames=('camera',)
+)
+_EVENTS_DROPPED = REGISTRY.counter(
+    'cone_stream_events_dropped_total', 'Stream events dropped from slow client queues'
+)
+
+
+def build_measurement(camera: str, vertices, cam_config: Dict[str, Any], confidence: float) -> Dict[str, Any]:
+    """
+    Сформировать запись измерения по треугольнику в координатах оригинала.
+
+    Args:
+        camera: Тип конуса ("ZIF1" или "ZIF2")
+        vertices: Вершины треугольника в пикселях оригинального изображения
+        cam_config: Конфигурация камеры (pixel_size_m, k_vol, k_den)
+        confidence: Уверенность распознавания 0..1
+
+    Returns:
+        Словарь с параметрами измерения
+    """
+    pixel_size = cam_config.get("pixel_size_m", 0.1)
+    k_vol = cam_config.get("k_vol", 1.0)
+    k_den = cam_config.get("k_den", 1.7)
+
+    cone_params = ConeCalculator.get_cone_parameters(vertices, pixel_size, 1.0, k_vol)
+
+    return {
+        'camera': camera,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'triangle': [[float(x), float(y)] for x, y in vertices],
+        'pixel_size_m': pixel_size,
+        'k_vol': k_vol,
+        'k_den': k_den,
+        'volume': cone_params['volume'],
+        'mass': cone_params['volume'] * k_den,
+        'radius_m': cone_params['radius_m'],
+        'height_m': cone_params['height_m'],
+        'confidence': confidence,
+    }
+
+
+class Subscription:
+    """Подписка клиента на поток измерений с ограниченной очередью"""
+
+    def __init__(self, camera: str, maxlen: int = STREAM_QUEUE_SIZE) -> None:
+        """
+        Args:
+            camera: Тип конуса, на который оформлена подписка
+            maxlen: Максимальная длина очереди; старые события вытесняются
+        """
+        self.camera = camera
+        self.dropped = 0
+        self._events: deque = deque(maxlen=maxlen)
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, event: str) -> None:
+        """Положить событие в очередь, вытесняя самое старое при переполнении."""
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+                _EVENTS_DROPPED.inc()
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> Optional[str]:
+        """
+        Дождаться следующего события.
+
+        Returns:
+            Закодированное SSE-событие или None по таймауту/закрытию
+        """
+        with self._condition:
+            if not self._events and not self._closed:
+                self._condition.wait(timeout)
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        """Закрыть подписку и разбудить ожидающего читателя."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class MeasurementHub:
+    """
+    Рассылка измерений: один производитель на камеру, много подписчиков.
+
+    Событие кодируется в формат SSE один раз и раздаётся во все очереди
+    подписчиков без повторного расчёта. Поллер камеры запускается при
+    появлении первого подписчика и останавливается после ухода последнего.
+
+    Поллеры одной камеры могут работать сразу в нескольких рабочих процессах,
+    поэтому в историю записывает только владелец блокировки производителя
+    камеры; после остановки его поллера запись переходит к другому процессу.
+    """
+
+    def __init__(self, poller_factory: Optional[Callable[[str, 'MeasurementHub'], 'MeasurementPoller']] = None,
+                 store: Optional[MeasurementStore] = None) -> None:
+        """
+        Args:
+            poller_factory: Функция (camera, hub) -> MeasurementPoller
+            store: Хранилище, в которое записываются опубликованные измерения
+        """
+        self._poller_factory = poller_factory
+        self._store = store
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = {}
+        self._pollers: Dict[str, MeasurementPoller] = {}
+        self._last_event: Dict[str, str] = {}
+        self._persist_locks: Dict[str, ProducerLock] = {}
+        self._event_id = 0
+
+    def subscribe(self, camera: str, maxlen: int = STREAM_QUEUE_SIZE) -> Subscription:
+        """Оформить подписку на измерения камеры."""
+        subscription = Subscription(camera, maxlen)
+
+        with self._lock:
+            subscribers = self._subscribers.setdefault(camera, set())
+            subscribers.add(subscription)
+            _SUBSCRIBERS.labels(camera=camera).set(len(subscribers))
+            last_event = self._last_event.get(camera)
+
+            if camera not in self._pollers and self._poller_factory:
+                poller = self._poller_factory(camera, self)
+                self._pollers[camera] = poller
+                poller.start()
+
+        # Новый клиент сразу получает последнее известное измерение
+        if last_event:
+            subscription.put(last_event)
+
+        app_logger.info(f"Stream subscriber added for {camera} ({len(subscribers)} total)")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Отменить подписку; последний ушедший клиент останавливает поллер."""
+        subscription.close()
+        camera = subscription.camera
+        poller = None
+
+        with self._lock:
+            subscribers = self._subscribers.get(camera, set())
+            subscribers.discard(subscription)
+            remaining = len(subscribers)
+            _SUBSCRIBERS.labels(camera=camera).set(remaining)
+            if not remaining:
+                poller = self._pollers.pop(camera, None)
+                self._release_persist_lock(camera)
+
+        if poller:
+            poller.stop()
+
+        app_logger.info(
+            f"Stream subscriber removed for {camera} ({remaining} left, dropped {subscription.dropped} events)"
+        )
+
+    def publish(self, camera: str, measurement: Dict[str, Any]) -> None:
+        """Закодировать измерение один раз и разослать подписчикам камеры."""
+        with self._lock:
+            self._event_id += 1
+            event = (
+                f"id: {self._event_id}\n"
+                f"event: measurement\n"
+                f"data: {json.dumps(measurement, ensure_ascii=False)}\n\n"
+            )
+            self._last_event[camera] = event
+            subscribers = list(self._subscribers.get(camera, ()))
+            persist = self._store is not None and self._owns_camera(camera)
+
+        for subscription in subscribers:
+            subscription.put(event)
+
+        if persist:
+            self._store.append({**measurement, 'source': 'stream'})
+
+    def _owns_camera(self, camera: str) -> bool:
+        """Записывает ли этот процесс измерения камеры в историю (под self._lock)"""
+        if self._poller_factory is None:
+            return True
+        # Поллер, остановленный после ухода подписчиков, не должен снова захватывать блокировку
+        if camera not in self._pollers:
+            return False
+        lock = self._persist_locks.get(camera)
+        if lock is None:
+            lock = self._persist_locks[camera] = self._store.producer_lock(f"stream-{camera}")
+        return lock.acquire()
+
+    def _release_persist_lock(self, camera: str) -> None:
+        lock = self._persist_locks.pop(camera, None)
+        if lock:
+            lock.release()
+
+    def subscriber_count(self, camera: str) -> int:
+        """Количество активных подписчиков камеры."""
+        with self._lock:
+            return len(self._subscribers.get(camera, ()))
+
+    def close(self) -> None:
+        """Остановить все поллеры и закрыть подписки."""
+        with self._lock:
+            pollers = list(self._pollers.values())
+            subscriptions = [s for subs in self._subscribers.values() for s in subs]
+            self._pollers.clear()
+            self._subscribers.clear()
+            for camera in list(self._persist_locks):
+                self._release_persist_lock(camera)
+
+        for poller in pollers:
+            poller.stop()
+        for subscription in subscriptions:
+            subscription.close()
+
+
+class MeasurementPoller(threading.Thread):
+    """Фоновый поток: скриншот с Trassir → автоопределение → расчёт → публикация"""
+
+    def __init__(
+        self,
+        camera: str,
+        hub: MeasurementHub,
+        config_getter: Callable[[], Dict[str, Any]],
+        trassir_registry: Optional[TrassirRegistry] = None
+    ) -> None:
+        """
+        Args:
+            camera: Тип конуса ("ZIF1" или "ZIF2")
+            hub: Хаб для публикации измерений
+            config_getter: Функция, возвращающая актуальную конфигурацию камеры
+            trassir_registry: Общий реестр подключений Trassir
+        """
+        super().__init__(name=f"poller-{camera}", daemon=True)
+        self.camera = camera
+        self.hub = hub
+        self.config_getter = config_getter
+        self.trassir_registry = trassir_registry or TrassirRegistry()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Запросить остановку потока."""
+        self._stop_event.set()
+
+    def run(self) -> None:
+        app_logger.info(f"Measurement poller started for {self.camera}")
+        while not self._stop_event.is_set():
+            cam_config = self.config_getter() or {}
+            try:
+                measurement = self.poll_once(cam_config)
+                if measurement:
+                    self.hub.publish(self.camera, measurement)
+            except Exception as e:
+                app_logger.error(f"Measurement poller for {self.camera} failed: {e}")
+                self.trassir_registry.invalidate(cam_config.get("trassir_ip"), cam_config.get("password", "master"))
+
+            interval = cam_config.get("poll_interval_s", STREAM_POLL_INTERVAL_S)
+            self._stop_event.wait(interval)
+        app_logger.info(f"Measurement poller stopped for {self.camera}")
+
+    def poll_once(self, cam_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Выполнить один цикл измерения.
+
+        Returns:
+            Запись измерения или None, если конус не распознан
+        """
+        trassir_ip = cam_config.get("trassir_ip")
+        channel_name = cam_config.get("chanel_name")
+        password = cam_config.get("password", "master")
+
+        trassir = self.trassir_registry.get(trassir_ip, password)
+        channel = trassir.get_channel_by_name(channel_name)
+        if not channel:
+            raise ValueError(f"Channel {channel_name} not found")
+
+        # Сырые байты нужны для хэша кадра в истории измерений
+        content = trassir.get_channel_screenshot(channel['guid'], raw_img=True)
+        if content is None:
+            raise ValueError(f"Failed to get screenshot from {channel_name}")
+
+        screenshot = scale_screenshot(img_to_pillow(content))
+
+        vertices, confidence = auto_detect_triangle_with_confidence(
+            screenshot, self.camera, cam_config.get("threshold"), cam_config
+        )
+        if not vertices:
+            app_logger.warning(f"Poller: cone not detected for {self.camera}")
+            return None
+
+        measurement = build_measurement(self.camera, vertices, cam_config, confidence)
+        measurement['frame_hash'] = content_hash(content)
+        return measurement
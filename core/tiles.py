@@ -0,0 +1,164 @@
+"""
+Многоуровневая пирамида тайлов и превью изображения для веб-холста
+"""
+import io
+import math
+import threading
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, features
+
+from utils.cache import LRUCache
+from utils.logger import app_logger
+from utils.metrics import STAGE_SECONDS
+
+# Размер тайла по умолчанию, px
+TILE_SIZE = 256
+
+# Превью: качество по умолчанию и допустимые размеры стороны, px
+PREVIEW_QUALITY = 80
+PREVIEW_MIN_SIDE = 16
+PREVIEW_MAX_SIDE = 4096
+
+# Форматы превью: имя в запросе → (формат PIL, MIME-тип)
+PREVIEW_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+WEBP_SUPPORTED = features.check('webp')
+
+_PYRAMID_SECONDS = STAGE_SECONDS.labels(stage='tile_pyramid')
+_TILE_ENCODE_SECONDS = STAGE_SECONDS.labels(stage='tile_encode')
+_PREVIEW_SECONDS = STAGE_SECONDS.labels(stage='preview')
+
+
+class TilePyramid:
+    """
+    Пирамида тайлов с уровнями кратности степени двойки.
+
+    Уровень max_level — исходное разрешение, каждый следующий вниз
+    уменьшен вдвое; уровень 0 целиком помещается в один тайл.
+    Уровни строятся один раз при создании, тайлы кодируются при
+    первом запросе и кэшируются.
+    """
+
+    def __init__(self, image: Image.Image, tile_size: int = TILE_SIZE, quality: int = 85) -> None:
+        """
+        Args:
+            image: Исходное изображение
+            tile_size: Размер стороны тайла в пикселях
+            quality: Качество JPEG для тайлов
+        """
+        self.tile_size = tile_size
+        self.quality = quality
+        self.width, self.height = image.size
+        self.max_level = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+
+        with _PYRAMID_SECONDS.time():
+            level_image = image.convert('RGB')
+            levels: List[Image.Image] = [level_image]
+            for _ in range(self.max_level):
+                # reduce(2) — быстрый box-фильтр, без ресемплинга с нуля для каждого уровня
+                level_image = level_image.reduce(2)
+                levels.append(level_image)
+            levels.reverse()
+        self._levels = levels
+
+        self._tiles: Dict[tuple, bytes] = {}
+        self._previews = LRUCache(8)
+        self._lock = threading.Lock()
+
+        app_logger.debug(f"Tile pyramid built: {self.width}x{self.height}, {self.max_level + 1} levels")
+
+    def info(self) -> Dict[str, Any]:
+        """Описание пирамиды для клиента"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'tile_size': self.tile_size,
+            'max_level': self.max_level,
+            'levels': [
+                {
+                    'z': z,
+                    'width': level.width,
+                    'height': level.height,
+                    'cols': math.ceil(level.width / self.tile_size),
+                    'rows': math.ceil(level.height / self.tile_size),
+                }
+                for z, level in enumerate(self._levels)
+            ],
+        }
+
+    def has_tile(self, z: int, x: int, y: int) -> bool:
+        """Проверить, существует ли тайл с такими координатами"""
+        if not 0 <= z <= self.max_level or x < 0 or y < 0:
+            return False
+        level = self._levels[z]
+        return x * self.tile_size < level.width and y * self.tile_size < level.height
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """
+        Получить тайл в формате JPEG.
+
+        Raises:
+            KeyError: Если тайл вне пирамиды
+        """
+        key = (z, x, y)
+        data = self._tiles.get(key)
+        if data is not None:
+            return data
+
+        if not self.has_tile(z, x, y):
+            raise KeyError(key)
+
+        level = self._levels[z]
+        left = x * self.tile_size
+        top = y * self.tile_size
+        box = (left, top, min(left + self.tile_size, level.width), min(top + self.tile_size, level.height))
+
+        with _TILE_ENCODE_SECONDS.time():
+            buffer = io.BytesIO()
+            level.crop(box).save(buffer, format='JPEG', quality=self.quality)
+            data = buffer.getvalue()
+
+        with self._lock:
+            self._tiles[key] = data
+        return data
+
+    def preview(self, max_width: int, max_height: int, fmt: str = 'jpeg',
+                quality: int = PREVIEW_QUALITY) -> Tuple[bytes, Tuple[int, int]]:
+        """
+        Получить превью, вписанное в max_width x max_height (не больше оригинала).
+
+        Источником служит наименьший уровень пирамиды, не меньший
+        запрошенного размера, поэтому ресемплинг идёт не с оригинала.
+
+        Args:
+            max_width, max_height: Размер области отображения клиента
+            fmt: Формат ('jpeg' или 'webp')
+            quality: Качество кодирования 1..95
+
+        Returns:
+            (байты изображения, (ширина, высота) превью)
+        """
+        scale = min(max_width / self.width, max_height / self.height, 1.0)
+        size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+
+        key = (size, fmt, quality)
+        data = self._previews.get(key)
+        if data is not None:
+            return data, size
+
+        with _PREVIEW_SECONDS.time():
+            source = next(
+                level for level in self._levels
+                if level.width >= size[0] and level.height >= size[1]
+            )
+            image = source if source.size == size else source.resize(size, Image.Resampling.LANCZOS)
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=PREVIEW_FORMATS[fmt][0], quality=quality)
+            data = buffer.getvalue()
+
+        self._previews.put(key, data)
+        return data, size
@@ -0,0 +1,275 @@
+"""
+Таймлапс аннотированных кадров склада
+
+Кадры камеры за интервал времени декодируются, распознаются и
+аннотируются пулом процессов и по порядку записываются в видеофайл
+через cv2.VideoWriter. В обработке одновременно находится не больше
+нескольких кадров на процесс, поэтому память не зависит от длины ролика.
+"""
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.batch import (
+    STATUS_ERROR, STATUS_NOT_DETECTED, STATUS_OK, BatchProgress, collect_images, decode_frame, frame_timestamp,
+)
+from core.render import render_annotated
+from core.stream import build_measurement
+from core.vision import auto_detect_triangle_with_confidence
+from utils.constants import TIMELAPSE_FPS, TIMELAPSE_WIDTH
+from utils.logger import app_logger
+from utils.metrics import STAGE_SECONDS
+
+_ENCODE_SECONDS = STAGE_SECONDS.labels(stage='timelapse_encode')
+
+# Кодек по расширению видеофайла (FourCC)
+VIDEO_CODECS = {'.mp4': 'mp4v', '.avi': 'MJPG', '.mkv': 'XVID'}
+
+# Кадров в обработке на один рабочий процесс
+FRAMES_IN_FLIGHT_PER_WORKER = 2
+
+# Настройки, переданные рабочему процессу инициализатором пула
+_worker_settings: Dict[str, Any] = {}
+
+
+def collect_frames(inputs: Iterable[str], start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> List[str]:
+    """
+    Собрать кадры за интервал времени в хронологическом порядке.
+
+    Args:
+        inputs: Директории, glob-шаблоны или файлы кадров
+        start: Не раньше этого времени (включительно)
+        end: Раньше этого времени (не включительно)
+
+    Returns:
+        Пути к кадрам, упорядоченные по времени кадра
+    """
+    frames = []
+    for path in collect_images(inputs):
+        timestamp = frame_timestamp(path)
+        if (start and timestamp < start) or (end and timestamp >= end):
+            continue
+        frames.append((timestamp, path))
+    frames.sort()
+    return [path for _, path in frames]
+
+
+def video_size(path: str, width: int = TIMELAPSE_WIDTH) -> Tuple[int, int]:
+    """
+    Размер кадра видео по первому кадру (читается только заголовок файла).
+
+    Кодеки требуют чётных размеров, поэтому обе стороны округляются до чётных.
+    """
+    with Image.open(path) as image:
+        original_width, original_height = image.size
+    height = round(original_height * width / original_width)
+    return width - width % 2, height - height % 2
+
+
+def render_frame(path: str, camera: str, cam_config: Dict[str, Any], size: Tuple[int, int],
+                 resample: str = 'lanczos') -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """
+    Подготовить кадр таймлапса: распознавание, расчёт, аннотирование, масштабирование.
+
+    Кадр без распознанного конуса попадает в ролик только с меткой времени,
+    чтобы не было пропусков во времени.
+
+    Args:
+        path: Путь к кадру
+        camera: Тип конуса ("ZIF1" или "ZIF2")
+        cam_config: Профиль камеры
+        size: Размер кадра видео (ширина, высота)
+        resample: Фильтр приведения кадра к ширине 1920px
+
+    Returns:
+        (запись измерения, кадр BGR uint8 или None при ошибке)
+    """
+    record = {'file': path, 'camera': camera}
+    try:
+        with open(path, 'rb') as file:
+            frame = decode_frame(file.read(), resample)
+        timestamp = frame_timestamp(path)
+
+        vertices, confidence = auto_detect_triangle_with_confidence(frame, camera, cam_config=cam_config)
+        if vertices is None:
+            record.update(status=STATUS_NOT_DETECTED, confidence=confidence)
+            vertices = []
+        else:
+            record.update(build_measurement(camera, vertices, cam_config, confidence))
+            record['status'] = STATUS_OK
+        record['timestamp'] = timestamp.isoformat(timespec='seconds')
+
+        params = {
+            'pixel_size': cam_config.get('pixel_size_m', 0.1),
+            'k_vol': cam_config.get('k_vol', 1.0),
+            'k_den': cam_config.get('k_den', 1.7),
+            'cone_type': camera,
+            'timestamp': timestamp,
+        }
+        annotated = render_annotated(frame, vertices, params, record if vertices else None)
+        bgr = cv2.cvtColor(np.asarray(annotated), cv2.COLOR_RGB2BGR)
+        if (bgr.shape[1], bgr.shape[0]) != size:
+            bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+        return record, bgr
+    except Exception as e:
+        app_logger.error(f"Timelapse frame failed for {path}: {e}")
+        record.update(status=STATUS_ERROR, error=str(e))
+        return record, None
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    """Инициализатор рабочего процесса пула"""
+    global _worker_settings
+    _worker_settings = settings
+
+
+def _render_in_worker(path: str):
+    return render_frame(path, **_worker_settings)
+
+
+def annotated_frames(paths: List[str], camera: str, cam_config: Dict[str, Any], size: Tuple[int, int],
+                     workers: Optional[int] = None,
+                     resample: str = 'lanczos') -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+    """
+    Аннотированные кадры в порядке paths.
+
+    Пул процессов обрабатывает кадры параллельно, но в работу отдаётся не
+    больше FRAMES_IN_FLIGHT_PER_WORKER кадров на процесс: следующий кадр
+    ставится в очередь только после выдачи очередного готового.
+
+    Yields:
+        (запись измерения, кадр BGR или None при ошибке)
+    """
+    settings = {'camera': camera, 'cam_config': cam_config, 'size': size, 'resample': resample}
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+
+    if workers == 1:
+        for path in paths:
+            yield render_frame(path, **settings)
+        return
+
+    remaining = iter(paths)
+    with multiprocessing.Pool(workers, _init_worker, (settings,)) as pool:
+        pending = deque(
+            pool.apply_async(_render_in_worker, (path,))
+            for path in islice(remaining, workers * FRAMES_IN_FLIGHT_PER_WORKER)
+        )
+        while pending:
+            result = pending.popleft().get()
+            path = next(remaining, None)
+            if path is not None:
+                pending.append(pool.apply_async(_render_in_worker, (path,)))
+            yield result
+
+
+def write_video(frames: Iterable[Tuple[Dict[str, Any], Optional[np.ndarray]]], output_path: str,
+                size: Tuple[int, int], fps: float = TIMELAPSE_FPS, codec: Optional[str] = None,
+                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> int:
+    """
+    Записать кадры в видеофайл (атомарно: временный файл и переименование).
+
+    Args:
+        frames: Поток (запись, кадр BGR); записи без кадра пропускаются
+        output_path: Путь к видеофайлу (.mp4, .avi, .mkv)
+        size: Размер кадра (ширина, высота)
+        fps: Кадров в секунду ролика
+        codec: FourCC (по умолчанию — по расширению файла)
+        progress: Обработчик progress(запись) после каждого кадра
+
+    Returns:
+        Количество записанных кадров
+
+    Raises:
+        ValueError: Неизвестное расширение или кодек недоступен
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    codec = codec or VIDEO_CODECS.get(extension)
+    if not codec:
+        raise ValueError(f"Unsupported video extension: {extension or '(none)'}")
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    # Контейнер определяется по расширению, поэтому оно сохраняется у временного файла
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(output_path)}.", suffix=extension)
+    os.close(fd)
+
+    writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*codec), fps, size)
+    written = 0
+    try:
+        if not writer.isOpened():
+            raise ValueError(f"Video codec '{codec}' is not available for {extension}")
+        for record, frame in frames:
+            if frame is not None:
+                with _ENCODE_SECONDS.time():
+                    writer.write(frame)
+                written += 1
+            if progress:
+                progress(record)
+        writer.release()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        writer.release()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def make_timelapse(paths: List[str], camera: str, cam_config: Dict[str, Any], output_path: str,
+                   fps: float = TIMELAPSE_FPS, width: int = TIMELAPSE_WIDTH, workers: Optional[int] = None,
+                   codec: Optional[str] = None, resample: str = 'lanczos',
+                   progress: Optional[Callable[[BatchProgress, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Собрать таймлапс аннотированных кадров.
+
+    Args:
+        paths: Кадры в порядке показа (см. collect_frames)
+        camera: Тип конуса ("ZIF1" или "ZIF2")
+        cam_config: Профиль камеры
+        output_path: Путь к видеофайлу
+        fps: Кадров в секунду ролика
+        width: Ширина кадра видео (высота — по пропорциям первого кадра)
+        workers: Количество процессов (по умолчанию — число ядер; 1 — без пула)
+        codec: FourCC (по умолчанию — по расширению файла)
+        resample: Фильтр приведения кадра к ширине 1920px
+        progress: Обработчик progress(BatchProgress, запись) после каждого кадра
+
+    Returns:
+        Сводка: количество кадров, ошибок, время и скорость
+    """
+    if not paths:
+        raise ValueError("No frames for timelapse")
+
+    size = video_size(paths[0], width)
+    state = BatchProgress(len(paths))
+    app_logger.info(
+        f"Timelapse started: {len(paths)} frames, camera {camera}, {size[0]}x{size[1]} @ {fps} fps"
+    )
+
+    def on_frame(record):
+        state.update(record)
+        if progress:
+            progress(state, record)
+
+    frames = annotated_frames(paths, camera, cam_config, size, workers, resample)
+    try:
+        written = write_video(frames, output_path, size, fps, codec, on_frame)
+    finally:
+        # Останавливает пул, если запись прервана
+        frames.close()
+
+    summary = state.summary()
+    summary.update(frames=written, output=output_path)
+    app_logger.info(f"Timelapse finished: {summary}")
+    return summary
@@ -1,84 +1,213 @@
 """
 Логика работы с треугольником
 """
-from .geometry import calculate_side_length
+from contextlib import contextmanager
+
+import numpy as np
+
+from .cone_calculator import ConeCalculator
 from utils.logger import app_logger
 
 
+class TriangleChange:
+    """
+    Изменение треугольника между двумя уведомлениями.
+
+    Attributes:
+        old: Вершины до изменения
+        new: Вершины после изменения
+        indices: Индексы вершин, положение которых изменилось
+        count_changed: Изменилось ли количество вершин
+    """
+
+    def __init__(self, old, new):
+        self.old = tuple(old)
+        self.new = tuple(new)
+        self.count_changed = len(self.old) != len(self.new)
+        self.indices = frozenset(
+            i for i in range(max(len(self.old), len(self.new)))
+            if i >= len(self.old) or i >= len(self.new) or self.old[i] != self.new[i]
+        )
+
+    @property
+    def empty(self):
+        """Изменений нет"""
+        return not self.indices
+
+    def __repr__(self):
+        return f"TriangleChange(indices={sorted(self.indices)}, count_changed={self.count_changed})"
+
+
 class TriangleManager:
+    """
+    Треугольник разметки конуса.
+
+    Вершины хранятся в пикселях оригинального изображения в массиве
+    (3, 2) float64; перевод в координаты холста выполняется только при
+    отрисовке и проверке попадания. Производная геометрия
+    (длины сторон, параметры конуса) вычисляется по запросу и кэшируется
+    до изменения вершин, размера пикселя или масштаба.
+    """
+
+    __slots__ = (
+        '_points', '_count', '_vertices', '_revision', 'listeners',
+        '_batch_depth', '_batch_start', '_sides_key', '_sides', '_cone_key', '_cone'
+    )
+
     def __init__(self):
-        self.vertices = []  # Список вершин треугольника
-        self.sides = []  # Длины сторон в пикселях и мм
+        self._points = np.zeros((3, 2), dtype=np.float64)  # Вершины в пикселях оригинала
+        self._count = 0  # Количество построенных вершин
+        self._vertices = ()  # Кэш вершин в виде кортежей
+        self._revision = 0  # Номер версии вершин
         self.listeners = []  # Подписчики на изменения
+        self._batch_depth = 0  # Вложенность batch()
+        self._batch_start = ()  # Вершины на момент начала batch()
+        self._sides_key = None
+        self._sides = []
+        self._cone_key = None
+        self._cone = None
+
+    @property
+    def vertices(self):
+        """Вершины треугольника: кортеж пар (x, y)"""
+        return self._vertices
+
+    @property
+    def revision(self):
+        """Номер версии вершин, увеличивается при каждом изменении"""
+        return self._revision
+
+    @contextmanager
+    def batch(self):
+        """
+        Сгруппировать изменения вершин в одно уведомление.
+
+        Подписчики получают одно событие TriangleChange с разницей между
+        состоянием до и после блока; если вершины не изменились, событие
+        не отправляется. Вложенные блоки объединяются с внешним.
+        """
+        if self._batch_depth == 0:
+            self._batch_start = self._vertices
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                change = TriangleChange(self._batch_start, self._vertices)
+                self._batch_start = ()
+                if not change.empty:
+                    self._notify_listeners(change)
 
     def add_vertex(self, x, y):
         """Добавление вершины"""
         app_logger.debug(f"Adding vertex at ({x}, {y})")
-        self.vertices.append((x, y))
-        if len(self.vertices) > 3:
-            removed = self.vertices.pop(0)
-            app_logger.debug(f"Removed oldest vertex at {removed}")
-        self._update_sides()
-        self._notify_listeners()
-        app_logger.info(f"Triangle now has {len(self.vertices)} vertices")
+        with self.batch():
+            if self._count == 3:
+                app_logger.debug(f"Removed oldest vertex at {self._vertices[0]}")
+                self._points[:2] = self._points[1:]
+                self._count = 2
+            self._points[self._count] = (x, y)
+            self._count += 1
+            self._touch()
+        app_logger.info(f"Triangle now has {self._count} vertices")
+
+    def set_vertices(self, vertices):
+        """Замена всех вершин одним обновлением (одно уведомление подписчиков)"""
+        points = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)[-3:]
+        with self.batch():
+            self._count = len(points)
+            self._points[:self._count] = points
+            self._touch()
+        app_logger.info(f"Triangle vertices set: {self._count} vertices")
 
     def update_vertex(self, index, x, y):
         """Обновление позиции вершины"""
-        if 0 <= index < len(self.vertices):
-            self.vertices[index] = (x, y)
-            self._update_sides()
-            self._notify_listeners()
+        if 0 <= index < self._count:
+            with self.batch():
+                self._points[index] = (x, y)
+                self._touch()
 
     def clear(self):
         """Очистка треугольника"""
         app_logger.info("Clearing triangle")
-        self.vertices.clear()
-        self.sides.clear()
-        self._notify_listeners()
+        with self.batch():
+            self._count = 0
+            self._touch()
 
     def is_complete(self):
         """Проверка, построен ли полный треугольник"""
-        return len(self.vertices) == 3
+        return self._count == 3
 
     def get_vertex_at_position(self, x, y, tolerance=10):
         """
         Поиск вершины в заданной позиции
         Возвращает индекс вершины или None
         """
-        for i, (vx, vy) in enumerate(self.vertices):
-            if abs(vx - x) <= tolerance and abs(vy - y) <= tolerance:
-                return i
-        return None
-
-    def _update_sides(self, pixel_size_m=0.1, scale_factor=1.0):
-        """Обновление расчетов сторон"""
-        self.sides.clear()
-
-        if len(self.vertices) >= 2:
-            for i in range(len(self.vertices)):
-                j = (i + 1) % len(self.vertices)
-                point1 = self.vertices[i]
-                point2 = self.vertices[j]
-
-                # Вычисляем длину в пикселях отображаемого изображения
-                length_px_display, _ = calculate_side_length(point1, point2, pixel_size_m)
-                
-                # Преобразуем в пиксели оригинального изображения
-                length_px_original = length_px_display * scale_factor
-                
-                # Длина в метрах вычисляется по оригинальным пикселям
-                length_m = length_px_original * pixel_size_m
-                
-                self.sides.append({
-                    'points': (point1, point2),
-                    'length_px': length_px_original,
-                    'length_m': length_m
+        if not self._count:
+            return None
+        delta = np.abs(self._points[:self._count] - (x, y))
+        hits = np.flatnonzero((delta <= tolerance).all(axis=1))
+        return int(hits[0]) if hits.size else None
+
+    def get_sides(self, pixel_size_m=0.1):
+        """
+        Длины сторон треугольника.
+
+        Вершины хранятся в пикселях оригинального изображения, поэтому
+        масштаб отображения на результат не влияет. Результат кэшируется
+        до изменения вершин или размера пикселя.
+
+        Args:
+            pixel_size_m: Размер пикселя в метрах
+
+        Returns:
+            Список словарей {'points', 'length_px', 'length_m'}; length_px —
+            в пикселях оригинального изображения
+        """
+        key = (self._revision, pixel_size_m)
+        if key == self._sides_key:
+            return self._sides
+
+        sides = []
+        if self._count >= 2:
+            points = self._points[:self._count]
+            delta = np.roll(points, -1, axis=0) - points
+            lengths_px = np.hypot(delta[:, 0], delta[:, 1])
+            vertices = self._vertices
+            for i, length_px in enumerate(lengths_px.tolist()):
+                sides.append({
+                    'points': (vertices[i], vertices[(i + 1) % self._count]),
+                    'length_px': length_px,
+                    'length_m': length_px * pixel_size_m
                 })
 
-    def _notify_listeners(self):
+        self._sides_key = key
+        self._sides = sides
+        return sides
+
+    def get_cone_parameters(self, pixel_size_m, k_vol=1.0):
+        """
+        Параметры конуса по текущему треугольнику (см. ConeCalculator.get_cone_parameters).
+
+        Результат кэшируется до изменения вершин или параметров расчёта.
+        """
+        key = (self._revision, pixel_size_m, k_vol)
+        if key != self._cone_key:
+            # Вершины уже в пикселях оригинала — масштаб 1.0
+            self._cone = ConeCalculator.get_cone_parameters(self._vertices, pixel_size_m, 1.0, k_vol)
+            self._cone_key = key
+        return self._cone
+
+    def _touch(self):
+        """Обновить кэш вершин после изменения массива"""
+        self._vertices = tuple(map(tuple, self._points[:self._count].tolist()))
+        self._revision += 1
+
+    def _notify_listeners(self, change):
         """Уведомление подписчиков об изменениях"""
         for listener in self.listeners:
-            listener.on_triangle_changed()
+            listener.on_triangle_changed(change)
 
     def add_listener(self, listener):
         """Добавление подписчика"""
@@ -5,6 +5,18 @@ import cv2
 import numpy as np
 from PIL import Image
 from utils.logger import app_logger
+from utils.metrics import REGISTRY, STAGE_SECONDS
+
+_DETECT_SECONDS = STAGE_SECONDS.labels(stage='detect')
+_DETECTIONS = REGISTRY.counter(
+    'cone_detections_total', 'Cone detection attempts by result', labelnames=('result',)
+)
+_DETECTIONS_OK = _DETECTIONS.labels(result='ok')
+_DETECTIONS_FAILED = _DETECTIONS.labels(result='failed')
+
+# Версия алгоритма распознавания (записывается в метаданные сохранённых кадров);
+# увеличивается при изменении алгоритма или его параметров по умолчанию
+DETECTOR_VERSION = "zif-contour-1"
 
 
 def detect_cone_zif1(image: Image.Image) -> list[tuple[float, float]] | None:
@@ -49,6 +61,20 @@ def detect_cone_zif(image: Image.Image, roi_config: tuple[int, int, int, int] |
     Returns:
         Список из 3 точек [(x1, y1), (x2, y2), (x3, y3)] или None если не удалось
     """
+    triangle_points, _ = detect_cone_zif_with_confidence(image, roi_config, cone_center, threshold)
+    return triangle_points
+
+
+def detect_cone_zif_with_confidence(image: Image.Image, roi_config: tuple[int, int, int, int] | list[int], cone_center: list[int], threshold: int = 80) -> tuple[list[tuple[float, float]] | None, float]:
+    """
+    То же, что detect_cone_zif, но дополнительно возвращает уверенность распознавания.
+    
+    Уверенность — доля площади самого большого контура в суммарной площади
+    всех контуров ROI (1.0 — конус однозначно выделен, ближе к 0 — шум).
+    
+    Returns:
+        Кортеж (точки треугольника или None, уверенность 0..1)
+    """
     try:
         app_logger.info("Starting automatic cone detection for ZIF2")
         
@@ -58,7 +84,7 @@ def detect_cone_zif(image: Image.Image, roi_config: tuple[int, int, int, int] |
         # Проверяем наличие ROI координат
         if roi_config is None:
             app_logger.error("ROI configuration not provided")
-            return None
+            return None, 0.0
         
         x1, x2, y1, y2 = roi_config
         app_logger.debug(f"ROI coordinates: x1={x1}, x2={x2}, y1={y1}, y2={y2}")
@@ -91,11 +117,16 @@ def detect_cone_zif(image: Image.Image, roi_config: tuple[int, int, int, int] |
         
         if not contours:
             app_logger.warning("No contours found in ROI")
-            return None
+            return None, 0.0
         
         # Находим самый большой контур
         largest_contour = max(contours, key=cv2.contourArea)
-        app_logger.debug(f"Largest contour area: {cv2.contourArea(largest_contour)}")
+        largest_area = cv2.contourArea(largest_contour)
+        app_logger.debug(f"Largest contour area: {largest_area}")
+        
+        # Уверенность: насколько самый большой контур доминирует над остальными
+        total_area = sum(cv2.contourArea(contour) for contour in contours)
+        confidence = float(largest_area / total_area) if total_area > 0 else 0.0
         
         # Получаем все точки контура
         points = largest_contour.reshape(-1, 2)
@@ -149,15 +180,53 @@ def detect_cone_zif(image: Image.Image, roi_config: tuple[int, int, int, int] |
         # Возвращаем треугольник: [левая, правая, вершина]
         triangle_points = [left_global, right_global, peak_global]
         
-        app_logger.info(f"Triangle detected successfully: {triangle_points}")
-        return triangle_points
+        app_logger.info(f"Triangle detected successfully: {triangle_points} (confidence: {confidence:.2f})")
+        return triangle_points, confidence
         
     except Exception as e:
         app_logger.error(f"Error in cone detection: {e}", exc_info=True)
-        return None
+        return None, 0.0
 
 
 
+# Значения по умолчанию для автоопределения
+DEFAULT_DETECTION_CONFIGS = {
+    "ZIF1": {
+        "roi": [1125, 1545, 345, 615],
+        "cone_center": [45, 65],
+        "threshold": 50
+    },
+    "ZIF2": {
+        "roi": [716, 1180, 170, 360],
+        "cone_center": [40, 60],
+        "threshold": 85
+    }
+}
+
+
+def _resolve_detection_params(cone_type: str, threshold: int | None, cam_config: dict | None) -> tuple[list[int], list[int], int] | None:
+    """
+    Определить ROI, центральную зону и порог для типа конуса.
+    
+    Returns:
+        Кортеж (roi, cone_center, threshold) или None для неизвестного типа
+    """
+    if cone_type not in DEFAULT_DETECTION_CONFIGS:
+        app_logger.error(f"Unknown cone type: {cone_type}")
+        return None
+    
+    defaults = DEFAULT_DETECTION_CONFIGS[cone_type]
+    
+    # Используем переданную конфигурацию или значения по умолчанию
+    if cam_config is None:
+        cam_config = defaults
+    
+    roi = cam_config.get("roi", defaults["roi"])
+    cone_center = cam_config.get("cone_center", defaults["cone_center"])
+    thresh = threshold if threshold is not None else cam_config.get("threshold", defaults["threshold"])
+    return roi, cone_center, thresh
+
+
 def auto_detect_triangle(image: Image.Image, cone_type: str, threshold: int | None = None, cam_config: dict | None = None) -> list[tuple[float, float]] | None:
     """
     Автоматическое построение треугольника на основе типа конуса.
@@ -171,32 +240,32 @@ def auto_detect_triangle(image: Image.Image, cone_type: str, threshold: int | No
     Returns:
         Список из 3 точек [(x1, y1), (x2, y2), (x3, y3)] или None
     """
-    app_logger.info(f"Auto-detecting triangle for cone type: {cone_type}")
+    triangle_points, _ = auto_detect_triangle_with_confidence(image, cone_type, threshold, cam_config)
+    return triangle_points
+
+
+def auto_detect_triangle_with_confidence(image: Image.Image, cone_type: str, threshold: int | None = None, cam_config: dict | None = None) -> tuple[list[tuple[float, float]] | None, float]:
+    """
+    Автоматическое построение треугольника с оценкой уверенности распознавания.
     
-    # Значения по умолчанию
-    default_configs = {
-        "ZIF1": {
-            "roi": [1125, 1545, 345, 615],
-            "cone_center": [45, 65],
-            "threshold": 50
-        },
-        "ZIF2": {
-            "roi": [716, 1180, 170, 360],
-            "cone_center": [40, 60],
-            "threshold": 85
-        }
-    }
+    Args:
+        image: PIL изображение
+        cone_type: Тип конуса ("ZIF1" или "ZIF2")
+        threshold: Порог бинаризации (если None, используется значение из конфигурации)
+        cam_config: Конфигурация камеры (если None, используются значения по умолчанию)
     
-    if cone_type not in default_configs:
-        app_logger.error(f"Unknown cone type: {cone_type}")
-        return None
+    Returns:
+        Кортеж (список из 3 точек или None, уверенность 0..1)
+    """
+    app_logger.info(f"Auto-detecting triangle for cone type: {cone_type}")
     
-    # Используем переданную конфигурацию или значения по умолчанию
-    if cam_config is None:
-        cam_config = default_configs[cone_type]
+    params = _resolve_detection_params(cone_type, threshold, cam_config)
+    if params is None:
+        return None, 0.0
     
-    roi = cam_config.get("roi", default_configs[cone_type]["roi"])
-    cone_center = cam_config.get("cone_center", default_configs[cone_type]["cone_center"])
-    thresh = threshold if threshold is not None else cam_config.get("threshold", default_configs[cone_type]["threshold"])
+    roi, cone_center, thresh = params
+    with _DETECT_SECONDS.time():
+        triangle_points, confidence = detect_cone_zif_with_confidence(image, roi, cone_center, thresh)
     
-    return detect_cone_zif(image, roi, cone_center, thresh)
+    (_DETECTIONS_OK if triangle_points else _DETECTIONS_FAILED).inc()
+    return triangle_points, confidence
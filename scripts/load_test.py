@@ -0,0 +1,143 @@
+"""
+Нагрузочный тест веб-приложения
+
+Запускает сервер с разным числом рабочих процессов и измеряет пропускную
+способность и задержки, показывая масштабирование по процессам:
+
+    python scripts/load_test.py --spawn-workers 1 2 4 --endpoint detect
+
+Либо нагружает уже запущенный сервер:
+
+    python scripts/load_test.py --url http://127.0.0.1:5000 --concurrency 16
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CALCULATE_PAYLOAD = {
+    'vertices': [[1200, 580], [1480, 585], [1330, 380]],
+    'pixel_size': 0.091,
+    'k_vol': 0.8,
+    'k_den': 1.76,
+}
+
+
+def _synthetic_frame():
+    """PNG-кадр 1920x1080 с тёмным «конусом» в ROI ЗИФ1"""
+    frame = np.full((1080, 1920, 3), 200, dtype=np.uint8)
+    for row in range(380, 600):
+        half_width = int((row - 380) * 0.7)
+        frame[row, 1335 - half_width:1335 + half_width] = 20
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _prepare_session(url, endpoint):
+    """Подготовить сессию: для detect загружаем кадр, чтобы он попал в cookie-сессию"""
+    http = requests.Session()
+    if endpoint == 'detect':
+        response = http.post(f'{url}/upload', files={'file': ('frame.png', _synthetic_frame(), 'image/png')})
+        response.raise_for_status()
+    return http
+
+
+def _request(url, endpoint, cookies):
+    """Один запрос; возвращает задержку в секундах"""
+    start = time.perf_counter()
+    if endpoint == 'detect':
+        response = requests.post(f'{url}/auto_detect', json={'threshold': 50}, cookies=cookies)
+    else:
+        response = requests.post(f'{url}/calculate', json=CALCULATE_PAYLOAD, cookies=cookies)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run_load(url, endpoint, concurrency, total):
+    """
+    Выполнить total запросов в concurrency потоков.
+
+    Returns:
+        Словарь с RPS и перцентилями задержки (мс)
+    """
+    cookies = _prepare_session(url, endpoint).cookies.get_dict()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda _: _request(url, endpoint, cookies), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'rps': total / elapsed,
+        'p50': float(np.percentile(latencies_ms, 50)),
+        'p95': float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def _wait_ready(url, timeout=60):
+    """Дождаться, пока сервер начнёт отвечать"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f'{url}/config', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f'Server at {url} did not start in {timeout}s')
+
+
+def spawn_server(workers, threads, port):
+    """Запустить web_app.py с заданным числом процессов"""
+    command = [
+        sys.executable, 'web_app.py',
+        '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--threads', str(threads),
+        '--warmup', '--no-trassir-warmup',
+    ]
+    env = dict(os.environ, CONE_SECRET_KEY='load-test')
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cone web load test')
+    parser.add_argument('--url', default=None, help='Адрес уже запущенного сервера')
+    parser.add_argument('--spawn-workers', type=int, nargs='*', default=None, help='Запустить сервер с N процессами (список)')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков на процесс для --spawn-workers')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--endpoint', choices=['calculate', 'detect'], default='detect')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'rps':>10} {'p50, ms':>10} {'p95, ms':>10}")
+
+    if not args.spawn_workers:
+        url = args.url or f'http://127.0.0.1:{args.port}'
+        result = run_load(url, args.endpoint, args.concurrency, args.requests)
+        print(f"{'-':>8} {result['rps']:>10.1f} {result['p50']:>10.1f} {result['p95']:>10.1f}")
+        return
+
+    url = f'http://127.0.0.1:{args.port}'
+    for workers in args.spawn_workers:
+        server = spawn_server(workers, args.threads, args.port)
+        try:
+            _wait_ready(url)
+            result = run_load(url, args.endpoint, args.concurrency, args.requests)
+            print(f"{workers:>8} {result['rps']:>10.1f} {result['p50']:>10.1f} {result['p95']:>10.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 // Глобальные переменные
 let canvas, ctx;
-let currentImage = null;
+let currentImage = null;  // Описание изображения: { id, width, height, tileSize, maxLevel }
 let vertices = [];
 let draggingVertex = null;
 let imageScale = 1.0;
@@ -8,6 +8,15 @@ let defaultImageScale = 1.0;  // Запоминаем начальный мас
 let userZoomLevel = 1.0;  // Пользовательский масштаб (zoom)
 let imageOffset = { x: 0, y: 0 };
 
+// Кэш тайлов текущего изображения: "z/x/y" → Image
+const MAX_CACHED_TILES = 256;
+let tileCache = new Map();
+let redrawPending = false;
+
+// Превью под размер холста (для быстрой первой отрисовки и координат превью)
+let previewImage = null;
+let previewScale = { x: 0, y: 0 };  // Пикселей превью на пиксель оригинала
+
 // Инициализация при загрузке страницы
 document.addEventListener('DOMContentLoaded', function() {
     canvas = document.getElementById('main-canvas');
@@ -138,7 +147,7 @@ async function handleFileUpload(event) {
         const data = await response.json();
         
         if (data.success) {
-            loadImageToCanvas(data.image_data, data.width, data.height);
+            loadImageToCanvas(data);
             updateImageInfo(data.width, data.height, 'Локальный файл');
             updateStatus('Изображение загружено');
             clearTriangle();
@@ -163,7 +172,7 @@ async function loadTrassir(coneType) {
         const data = await response.json();
         
         if (data.success) {
-            loadImageToCanvas(data.image_data, data.width, data.height);
+            loadImageToCanvas(data);
             updateImageInfo(data.width, data.height, `Trassir ${coneType}`);
             updateStatus(`Изображение загружено с ${coneType}`);
             clearTriangle();
@@ -199,28 +208,135 @@ async function loadCameraSettings(coneType) {
     }
 }
 
-// Отображение изображения на canvas
-function loadImageToCanvas(imageSrc, originalWidth, originalHeight) {
+// Отображение изображения на canvas (по тайлам с сервера)
+function loadImageToCanvas(data) {
+    const tileSize = data.tile_size || 256;
+    currentImage = {
+        id: data.image_id,
+        width: data.width,
+        height: data.height,
+        tileSize: tileSize,
+        // Уровень maxLevel — оригинал, уровень 0 помещается в один тайл
+        maxLevel: Math.max(0, Math.ceil(Math.log2(Math.max(data.width, data.height) / tileSize)))
+    };
+    tileCache = new Map();
+    previewImage = null;
+    loadPreview();
+    
+    // Вычисляем масштаб для заполнения всего canvas
+    const scaleX = canvas.width / currentImage.width;
+    const scaleY = canvas.height / currentImage.height;
+    imageScale = Math.max(scaleX, scaleY);  // ← Используем max для заполнения
+    defaultImageScale = imageScale;  // Сохраняем начальный масштаб
+    userZoomLevel = 1.0;  // Сбрасываем zoom
+    
+    // Вычисляем смещение для центрирования
+    const scaledWidth = currentImage.width * imageScale;
+    const scaledHeight = currentImage.height * imageScale;
+    imageOffset.x = (canvas.width - scaledWidth) / 2;
+    imageOffset.y = (canvas.height - scaledHeight) / 2;
+    
+    redrawCanvas();
+}
+
+// Загрузка превью под текущий размер холста
+function loadPreview() {
+    const imageId = currentImage.id;
     const img = new Image();
     img.onload = function() {
-        currentImage = img;
-        
-        // Вычисляем масштаб для заполнения всего canvas
-        const scaleX = canvas.width / img.width;
-        const scaleY = canvas.height / img.height;
-        imageScale = Math.max(scaleX, scaleY);  // ← Используем max для заполнения
-        defaultImageScale = imageScale;  // Сохраняем начальный масштаб
-        userZoomLevel = 1.0;  // Сбрасываем zoom
-        
-        // Вычисляем смещение для центрирования
-        const scaledWidth = img.width * imageScale;
-        const scaledHeight = img.height * imageScale;
-        imageOffset.x = (canvas.width - scaledWidth) / 2;
-        imageOffset.y = (canvas.height - scaledHeight) / 2;
-        
-        redrawCanvas();
+        if (!currentImage || currentImage.id !== imageId) return;
+        previewImage = img;
+        previewScale = {
+            x: img.naturalWidth / currentImage.width,
+            y: img.naturalHeight / currentImage.height
+        };
+        scheduleRedraw();
     };
-    img.src = imageSrc;
+    // Формат (WebP/JPEG) сервер выбирает по заголовку Accept браузера
+    img.src = `/preview/${imageId}?w=${canvas.width}&h=${canvas.height}&q=80`;
+}
+
+// Координаты canvas → координаты превью
+function canvasToPreview(v) {
+    return [
+        (v.x - imageOffset.x) / imageScale * previewScale.x,
+        (v.y - imageOffset.y) / imageScale * previewScale.y
+    ];
+}
+
+// Координаты превью → координаты canvas
+function previewToCanvas(v) {
+    return {
+        x: v[0] / previewScale.x * imageScale + imageOffset.x,
+        y: v[1] / previewScale.y * imageScale + imageOffset.y
+    };
+}
+
+// Получить тайл из кэша или запросить с сервера
+function getTile(z, x, y) {
+    const key = `${z}/${x}/${y}`;
+    let tile = tileCache.get(key);
+    if (tile) {
+        // Обновляем порядок для вытеснения давно не использованных
+        tileCache.delete(key);
+        tileCache.set(key, tile);
+        return tile;
+    }
+    
+    const imageId = currentImage.id;
+    tile = new Image();
+    tile.onload = function() {
+        if (currentImage && currentImage.id === imageId) {
+            scheduleRedraw();
+        }
+    };
+    tile.src = `/tiles/${imageId}/${z}/${x}/${y}`;
+    tileCache.set(key, tile);
+    
+    if (tileCache.size > MAX_CACHED_TILES) {
+        tileCache.delete(tileCache.keys().next().value);
+    }
+    return tile;
+}
+
+// Отложенная перерисовка: несколько загруженных тайлов — один кадр
+function scheduleRedraw() {
+    if (redrawPending) return;
+    redrawPending = true;
+    requestAnimationFrame(function() {
+        redrawPending = false;
+        redrawCanvas();
+    });
+}
+
+// Отрисовка видимых тайлов уровня z
+function drawTileLevel(z) {
+    const tileSize = currentImage.tileSize;
+    const factor = Math.pow(2, currentImage.maxLevel - z);  // Пикселей оригинала на пиксель уровня
+    const span = tileSize * factor;  // Размер тайла в пикселях оригинала
+    
+    // Видимая область в координатах оригинального изображения
+    const left = Math.max(0, -imageOffset.x / imageScale);
+    const top = Math.max(0, -imageOffset.y / imageScale);
+    const right = Math.min(currentImage.width, (canvas.width - imageOffset.x) / imageScale);
+    const bottom = Math.min(currentImage.height, (canvas.height - imageOffset.y) / imageScale);
+    if (right <= left || bottom <= top) return;
+    
+    for (let ty = Math.floor(top / span); ty * span < bottom; ty++) {
+        for (let tx = Math.floor(left / span); tx * span < right; tx++) {
+            const tile = getTile(z, tx, ty);
+            if (!tile.complete || tile.naturalWidth === 0) {
+                continue;  // Ещё грузится — перерисуем по onload
+            }
+            ctx.drawImage(
+                tile,
+                imageOffset.x + tx * span * imageScale,
+                imageOffset.y + ty * span * imageScale,
+                tile.naturalWidth * factor * imageScale,
+                tile.naturalHeight * factor * imageScale
+            );
+        }
+    }
 }
 
 // Перерисовка canvas
@@ -228,9 +344,24 @@ function redrawCanvas() {
     ctx.clearRect(0, 0, canvas.width, canvas.height);
     
     if (currentImage) {
-        const scaledWidth = currentImage.width * imageScale;
-        const scaledHeight = currentImage.height * imageScale;
-        ctx.drawImage(currentImage, imageOffset.x, imageOffset.y, scaledWidth, scaledHeight);
+        // Уровень пирамиды, разрешение которого не меньше экранного
+        const levelsDown = Math.floor(Math.log2(1 / imageScale));
+        const z = Math.max(0, Math.min(currentImage.maxLevel, currentImage.maxLevel - levelsDown));
+        
+        // Превью (или грубый уровень 0) виден, пока грузятся тайлы уровня z
+        if (previewImage) {
+            ctx.drawImage(
+                previewImage, imageOffset.x, imageOffset.y,
+                currentImage.width * imageScale, currentImage.height * imageScale
+            );
+        } else if (z > 0) {
+            drawTileLevel(0);
+        }
+        
+        // Тайлы нужны, только если экрану не хватает разрешения превью
+        if (!previewImage || imageScale > previewScale.x) {
+            drawTileLevel(z);
+        }
     }
     
     // Рисуем треугольник
@@ -407,22 +538,33 @@ async function autoDetectTriangle() {
     updateStatus('Автоопределение треугольника...');
     
     const threshold = parseInt(document.getElementById('threshold').value) || 50;
+    const request = { threshold };
+    if (previewImage) {
+        // Сервер вернёт вершины в координатах превью
+        request.coords = 'preview';
+        request.image_id = currentImage.id;
+        request.preview_size = [previewImage.naturalWidth, previewImage.naturalHeight];
+    }
     
     try {
         const response = await fetch('/auto_detect', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ threshold })
+            body: JSON.stringify(request)
         });
         
         const data = await response.json();
         
         if (data.success && data.vertices) {
             // Конвертируем координаты в canvas координаты
-            vertices = data.vertices.map(v => ({
-                x: v[0] * imageScale + imageOffset.x,
-                y: v[1] * imageScale + imageOffset.y
-            }));
+            if (data.coords === 'preview') {
+                vertices = data.vertices.map(previewToCanvas);
+            } else {
+                vertices = data.vertices.map(v => ({
+                    x: v[0] * imageScale + imageOffset.x,
+                    y: v[1] * imageScale + imageOffset.y
+                }));
+            }
             
             redrawCanvas();
             updateStatus('Треугольник найден автоматически');
@@ -445,7 +587,7 @@ function clearTriangle() {
 }
 
 // Расчёт объёма
-function calculateVolume() {
+async function calculateVolume() {
     if (vertices.length !== 3) {
         alert('Постройте треугольник (3 вершины)');
         return;
@@ -456,7 +598,40 @@ function calculateVolume() {
     // Сначала обновляем информацию о сторонах (включает autoCalculateVolume)
     updateTriangleInfo();
     
-    updateStatus('Расчёт завершён');
+    if (!previewImage) {
+        updateStatus('Расчёт завершён');
+        return;
+    }
+    
+    // Окончательный расчёт на сервере: вершины передаются в координатах
+    // превью и переводятся сервером в пиксели оригинала
+    try {
+        const response = await fetch('/calculate', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                vertices: vertices.map(canvasToPreview),
+                coords: 'preview',
+                image_id: currentImage.id,
+                preview_size: [previewImage.naturalWidth, previewImage.naturalHeight],
+                pixel_size: parseFloat(document.getElementById('pixel-size').value) || 0.1,
+                k_vol: parseFloat(document.getElementById('k-vol').value) || 1.0,
+                k_den: parseFloat(document.getElementById('k-den').value) || 1.7
+            })
+        });
+        
+        const data = await response.json();
+        
+        if (data.success) {
+            displayResults(data.sides, data.cone);
+            updateStatus('Расчёт завершён');
+        } else {
+            updateStatus('Ошибка расчёта: ' + data.error);
+        }
+    } catch (error) {
+        console.error('Calculate error:', error);
+        updateStatus('Ошибка расчёта на сервере');
+    }
 }
 
 // Автоматический расчёт объёма (на стороне браузера)
@@ -0,0 +1,174 @@
+"""
+Фоновое выполнение задач для Tkinter-интерфейса
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logger import app_logger
+
+
+class BackgroundTask:
+    """
+    Задача, выполняемая в фоновом потоке.
+
+    Функция задачи получает объект BackgroundTask первым аргументом:
+    через report() она сообщает о ходе выполнения, а по свойству
+    cancelled может досрочно завершиться между этапами.
+    """
+
+    def __init__(self, runner, key):
+        self.key = key
+        self.future = None
+        self._runner = runner
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def report(self, message):
+        """Сообщить о ходе выполнения (вызывается из рабочего потока)."""
+        if not self._cancelled:
+            self._runner._queue.put((self, 'progress', message))
+
+    def cancel(self):
+        """
+        Отменить задачу.
+
+        Если функция уже выполняется, её результат будет отброшен.
+        """
+        self._cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class BackgroundRunner:
+    """
+    Пул рабочих потоков с доставкой результатов в главный поток Tk.
+
+    Рабочие потоки не обращаются к виджетам: результаты, ошибки и
+    сообщения о ходе выполнения складываются в очередь, которую главный
+    поток разбирает через root.after. Новая задача с тем же ключом
+    отменяет предыдущую, ещё не завершённую.
+    """
+
+    def __init__(self, root, max_workers=2, poll_ms=50):
+        """
+        Args:
+            root: Корневое окно Tk
+            max_workers: Количество рабочих потоков
+            poll_ms: Период опроса очереди результатов, мс
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-worker")
+        self._queue = queue.Queue()
+        self._active = {}
+        self._callbacks = {}
+        self._poll_job = None
+
+    def submit(self, key, fn, *args, on_success=None, on_error=None, on_progress=None, on_cancel=None):
+        """
+        Запустить функцию fn(task, *args) в рабочем потоке.
+
+        Обработчики вызываются в главном потоке Tk.
+
+        Args:
+            key: Ключ задачи; незавершённая задача с тем же ключом отменяется
+            fn: Функция задачи
+            on_success: Обработчик результата
+            on_error: Обработчик исключения
+            on_progress: Обработчик сообщений о ходе выполнения
+            on_cancel: Обработчик явной отмены через cancel()
+
+        Returns:
+            BackgroundTask
+        """
+        previous = self._active.get(key)
+        if previous is not None:
+            app_logger.info(f"Background task '{key}' superseded by a newer request")
+            previous.cancel()
+            self._callbacks.pop(previous, None)
+
+        task = BackgroundTask(self, key)
+        self._active[key] = task
+        self._callbacks[task] = (on_success, on_error, on_progress, on_cancel)
+        task.future = self._executor.submit(self._run, task, fn, args)
+        self._schedule_poll()
+        return task
+
+    def cancel(self, key):
+        """
+        Отменить задачу по ключу.
+
+        Returns:
+            True, если была активная задача
+        """
+        task = self._active.pop(key, None)
+        if task is None:
+            return False
+        task.cancel()
+        on_cancel = self._callbacks.pop(task, (None,) * 4)[3]
+        if on_cancel:
+            on_cancel()
+        return True
+
+    def is_running(self, key):
+        """Проверить, выполняется ли задача с ключом"""
+        return key in self._active
+
+    def shutdown(self):
+        """Отменить все задачи и остановить пул потоков"""
+        for task in list(self._active.values()):
+            task.cancel()
+        self._active.clear()
+        self._callbacks.clear()
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, args):
+        """Выполнение в рабочем потоке"""
+        try:
+            result = fn(task, *args)
+        except Exception as e:
+            self._queue.put((task, 'error', e))
+        else:
+            self._queue.put((task, 'success', result))
+
+    def _schedule_poll(self):
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        """Разобрать очередь результатов в главном потоке"""
+        self._poll_job = None
+        while True:
+            try:
+                task, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            callbacks = self._callbacks.get(task)
+            if task.cancelled or callbacks is None:
+                continue  # Результат отменённой или вытесненной задачи
+
+            on_success, on_error, on_progress, _ = callbacks
+            if kind == 'progress':
+                handler = on_progress
+            else:
+                # Задача завершена
+                self._callbacks.pop(task, None)
+                if self._active.get(task.key) is task:
+                    del self._active[task.key]
+                handler = on_success if kind == 'success' else on_error
+
+            if handler:
+                try:
+                    handler(payload)
+                except Exception as e:
+                    app_logger.error(f"Background task '{task.key}' callback failed: {e}")
+
+        if self._active or not self._queue.empty():
+            self._schedule_poll()
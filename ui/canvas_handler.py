@@ -1,13 +1,22 @@
 """
 Обработчик холста для отрисовки изображения и треугольника
 """
+import math
+import time
 import tkinter as tk
 from PIL import Image, ImageTk
 from utils.constants import (
     COLOR_TRIANGLE, COLOR_VERTEX, COLOR_HOVER, 
-    VERTEX_RADIUS, LINE_WIDTH
+    VERTEX_RADIUS, LINE_WIDTH, CANVAS_RENDER_CACHE_SIZE, CANVAS_VIEWPORT_MARGIN,
+    RENDER_FAST_RESAMPLE, RENDER_QUALITY_RESAMPLE, RENDER_QUALITY_DELAY_MS
 )
+from utils.cache import LRUCache
+from utils.imaging import resample_filter
 from utils.logger import app_logger
+from utils.metrics import STAGE_SECONDS
+
+_REDRAW_SECONDS = STAGE_SECONDS.labels(stage='canvas_redraw')
+_QUALITY_PASS_SECONDS = STAGE_SECONDS.labels(stage='canvas_quality_pass')
 
 
 class CanvasHandler:
@@ -33,6 +42,27 @@ class CanvasHandler:
         self.current_image_size = None
         self.original_image_size = None
         
+        # Элементы холста: изображение и слой разметки (создаются один раз)
+        self._image_item = None
+        self._edge_items = []
+        self._vertex_items = []
+        self._label_items = []
+        
+        # Кэш отрисованного изображения:
+        # (base_image_size, zoom_level, область, проход) -> (PIL, PhotoImage)
+        self._render_cache = LRUCache(CANVAS_RENDER_CACHE_SIZE)
+        # Отрисованная область (x0, y0, x1, y1) в координатах холста и её ключ кэша
+        self._rendered_region = None
+        self._rendered_key = None
+        self._viewport_update_pending = False
+        
+        # Двухпроходный ресемплинг: быстрый во время взаимодействия,
+        # качественный — после паузы
+        self.fast_resample = resample_filter(RENDER_FAST_RESAMPLE)
+        self.quality_resample = resample_filter(RENDER_QUALITY_RESAMPLE)
+        self.quality_delay_ms = RENDER_QUALITY_DELAY_MS
+        self._quality_job = None
+        
         # Параметры масштабирования
         self.zoom_level = 1.0
         
@@ -40,6 +70,22 @@ class CanvasHandler:
         self.dragging_vertex = None
         self.hovered_vertex = None
     
+    def configure_resampling(self, fast=None, quality=None, delay_ms=None):
+        """
+        Настроить компромисс между качеством и задержкой отрисовки.
+        
+        Args:
+            fast: Имя фильтра быстрого прохода (во время взаимодействия)
+            quality: Имя фильтра качественного прохода
+            delay_ms: Пауза после последнего действия перед качественным проходом
+        """
+        if fast is not None:
+            self.fast_resample = resample_filter(fast)
+        if quality is not None:
+            self.quality_resample = resample_filter(quality)
+        if delay_ms is not None:
+            self.quality_delay_ms = max(0, int(delay_ms))
+    
     def set_image(self, pil_image):
         """
         Установить изображение на холсте.
@@ -49,6 +95,11 @@ class CanvasHandler:
         """
         self.original_pil_image = pil_image
         self.original_image_size = pil_image.size
+        self._render_cache.clear()
+        self._rendered_key = None
+        if self._quality_job is not None:
+            self.canvas.after_cancel(self._quality_job)
+            self._quality_job = None
         
         # Получаем размер холста
         canvas_width = self.canvas.winfo_width()
@@ -86,166 +137,365 @@ class CanvasHandler:
         
         self.redraw()
     
-    def redraw(self):
-        """Перерисовать холст с изображением и треугольником"""
+    def redraw(self, indices=None, interactive=False):
+        """
+        Обновить изображение и слой разметки на холсте.
+        
+        Args:
+            indices: Индексы изменённых вершин (None — весь слой разметки)
+            interactive: Перерисовка во время взаимодействия (масштаб,
+                изменение размера) — сначала быстрый ресемплинг
+        """
         if not self.original_pil_image:
             return
         
-        # Очистить холст
-        self.canvas.delete("all")
-        
         try:
-            # Вычисляем размер изображения с учётом масштаба
-            base_width, base_height = self.base_image_size
-            new_width = int(base_width * self.zoom_level)
-            new_height = int(base_height * self.zoom_level)
+            redraw_start = time.perf_counter()
+            self._update_image(interactive)
+            self.update_overlay(indices)
+            _REDRAW_SECONDS.observe(time.perf_counter() - redraw_start)
             
-            # Изменяем размер изображения
-            resized_image = self.original_pil_image.resize(
-                (new_width, new_height),
-                Image.Resampling.LANCZOS
-            )
-            
-            # Конвертируем в PhotoImage
-            self.current_image = ImageTk.PhotoImage(resized_image)
+        except Exception as e:
+            app_logger.error(f"Failed to redraw canvas: {e}")
+    
+    def _update_image(self, interactive=False):
+        """
+        Обновить элемент изображения под текущий масштаб и видимую область.
+        
+        Отрисовывается только видимая часть холста с запасом, поэтому
+        стоимость отрисовки при большом увеличении такая же, как при
+        размере «по окну». Если видимая область уже покрыта отрисованной,
+        изображение не трогается.
+        
+        Args:
+            interactive: Сначала отрисовать быстрым фильтром, а
+                качественный проход отложить до паузы во взаимодействии
+        """
+        # Вычисляем размер изображения с учётом масштаба
+        base_width, base_height = self.base_image_size
+        new_width = int(base_width * self.zoom_level)
+        new_height = int(base_height * self.zoom_level)
+        
+        if (new_width, new_height) != self.current_image_size or self._image_item is None:
+            # Обновляем размер холста до расчёта видимой области
             self.current_image_size = (new_width, new_height)
-            
-            # Отображаем изображение на холсте
-            self.canvas.create_image(0, 0, anchor='nw', image=self.current_image)
-            
-            # Обновляем размер холста
             self.canvas.config(scrollregion=(0, 0, new_width, new_height))
-            
-            # Рисуем треугольник
-            self._draw_triangle()
-            
+        
+        visible, region = self._visible_region(new_width, new_height)
+        scale_key = (self.base_image_size, self.zoom_level)
+        
+        if (self._rendered_key and self._rendered_key[:2] == scale_key
+                and self._contains(self._rendered_region, visible)
+                and (interactive or self._rendered_key[3] == 'quality')):
+            return
+        
+        # Качественное изображение области может уже быть в кэше
+        quality_key = scale_key + (region, 'quality')
+        two_pass = interactive and self.fast_resample != self.quality_resample
+        if two_pass and quality_key not in self._render_cache:
+            render_pass = 'fast'
+            self._schedule_quality_pass()
+        else:
+            render_pass = 'quality'
+        
+        # Изображение области (из кэша, если масштаб и область не менялись)
+        photo_image = self._get_rendered_image(new_width, new_height, region, render_pass)
+        
+        if self._image_item is None:
+            self._image_item = self.canvas.create_image(
+                region[0], region[1], anchor='nw', image=photo_image, tags=('image',)
+            )
+            self.canvas.tag_lower(self._image_item)
+        else:
+            self.canvas.coords(self._image_item, region[0], region[1])
+            self.canvas.itemconfig(self._image_item, image=photo_image)
+        
+        self.current_image = photo_image
+        self._rendered_region = region
+        self._rendered_key = scale_key + (region, render_pass)
+        
+        if render_pass == 'quality':
+            # Быстрый вариант больше не нужен
+            self._render_cache.pop(scale_key + (region, 'fast'))
+    
+    def _schedule_quality_pass(self):
+        """Отложить качественный проход до паузы во взаимодействии (debounce)"""
+        if self._quality_job is not None:
+            self.canvas.after_cancel(self._quality_job)
+        self._quality_job = self.canvas.after(self.quality_delay_ms, self._apply_quality_pass)
+    
+    def _apply_quality_pass(self):
+        """Перерисовать видимую область качественным фильтром"""
+        self._quality_job = None
+        if not self.original_pil_image:
+            return
+        try:
+            with _QUALITY_PASS_SECONDS.time():
+                self._update_image()
         except Exception as e:
-            app_logger.error(f"Failed to redraw canvas: {e}")
+            app_logger.error(f"Failed to render quality pass: {e}")
     
-    def _draw_triangle(self):
-        """Отрисовать треугольник на холсте"""
-        vertices = self.triangle_manager.vertices
-        
-        if len(vertices) < 2:
-            # Рисуем только точки
-            for i, vertex in enumerate(vertices):
-                self._draw_vertex(vertex, i)
-        elif len(vertices) == 2:
-            # Рисуем линию и две точки
-            self.canvas.create_line(
-                vertices[0][0], vertices[0][1],
-                vertices[1][0], vertices[1][1],
+    def _visible_region(self, width, height):
+        """
+        Видимая область холста в координатах отображаемого изображения.
+        
+        Returns:
+            (видимая область, область отрисовки с запасом, выровненная по
+            сетке CANVAS_VIEWPORT_MARGIN) в виде (x0, y0, x1, y1)
+        """
+        view_width = self.canvas.winfo_width()
+        view_height = self.canvas.winfo_height()
+        if view_width <= 1:
+            from utils.constants import CANVAS_WIDTH, CANVAS_HEIGHT
+            view_width, view_height = CANVAS_WIDTH, CANVAS_HEIGHT
+        
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        visible = (left, top, min(width, left + view_width), min(height, top + view_height))
+        
+        # Выравнивание по сетке: небольшая прокрутка не меняет область
+        margin = CANVAS_VIEWPORT_MARGIN
+        region = (
+            max(0, (visible[0] - margin) // margin * margin),
+            max(0, (visible[1] - margin) // margin * margin),
+            min(width, math.ceil((visible[2] + margin) / margin) * margin),
+            min(height, math.ceil((visible[3] + margin) / margin) * margin),
+        )
+        return visible, region
+    
+    @staticmethod
+    def _contains(outer, inner):
+        """Проверить, что прямоугольник inner лежит внутри outer"""
+        return (
+            outer is not None
+            and outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[2] >= inner[2] and outer[3] >= inner[3]
+        )
+    
+    def _get_rendered_image(self, width, height, region, render_pass='quality'):
+        """
+        Получить PhotoImage области изображения текущего масштаба.
+        
+        Ресемплинг выполняется только из соответствующего фрагмента
+        оригинала и только при смене масштаба или области; перерисовки,
+        меняющие лишь треугольник, берут готовое изображение из кэша.
+        
+        Args:
+            width, height: Размер всего изображения при текущем масштабе
+            region: Область (x0, y0, x1, y1) в координатах этого размера
+            render_pass: 'fast' или 'quality' — фильтр ресемплинга
+        """
+        key = (self.base_image_size, self.zoom_level, region, render_pass)
+        cached = self._render_cache.get(key)
+        if cached is not None:
+            return cached[1]
+        
+        # Фрагмент оригинала, соответствующий области
+        x0, y0, x1, y1 = region
+        scale_x = self.original_image_size[0] / width
+        scale_y = self.original_image_size[1] / height
+        source_box = (x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y)
+        
+        resample = self.fast_resample if render_pass == 'fast' else self.quality_resample
+        resized_image = self.original_pil_image.resize(
+            (max(1, x1 - x0), max(1, y1 - y0)),
+            resample,
+            box=source_box
+        )
+        photo_image = ImageTk.PhotoImage(resized_image)
+        self._render_cache.put(key, (resized_image, photo_image))
+        return photo_image
+    
+    def schedule_viewport_update(self):
+        """
+        Запланировать догрузку изображения после прокрутки холста.
+        
+        Вызывается из xscrollcommand/yscrollcommand; серия событий
+        прокрутки объединяется в одно обновление в after_idle.
+        """
+        if self._viewport_update_pending or not self.original_pil_image:
+            return
+        self._viewport_update_pending = True
+        self.canvas.after_idle(self._apply_viewport_update)
+    
+    def _apply_viewport_update(self):
+        """Отрисовать изображение для новой видимой области"""
+        self._viewport_update_pending = False
+        try:
+            self._update_image(interactive=True)
+        except Exception as e:
+            app_logger.error(f"Failed to update canvas viewport: {e}")
+    
+    # ==================== Слой разметки ====================
+    
+    def _ensure_overlay(self):
+        """
+        Создать элементы слоя разметки (один раз).
+        
+        Стороны, вершины и подписи создаются скрытыми и дальше только
+        перемещаются (coords) и меняют стиль (itemconfig).
+        """
+        if self._edge_items:
+            return
+        
+        for _ in range(3):
+            self._edge_items.append(self.canvas.create_line(
+                0, 0, 0, 0,
                 fill=COLOR_TRIANGLE,
-                width=LINE_WIDTH
-            )
-            for i, vertex in enumerate(vertices):
-                self._draw_vertex(vertex, i)
+                width=LINE_WIDTH,
+                state='hidden',
+                tags=('overlay', 'edge')
+            ))
+        for _ in range(3):
+            self._vertex_items.append(self.canvas.create_oval(
+                0, 0, 0, 0,
+                fill=COLOR_VERTEX,
+                outline=COLOR_TRIANGLE,
+                state='hidden',
+                tags=('overlay', 'vertex')
+            ))
+        for _ in range(3):
+            self._label_items.append(self.canvas.create_text(
+                0, 0,
+                text='',
+                fill="white",
+                font=("Arial", 10, "bold"),
+                anchor="center",
+                state='hidden',
+                tags=('overlay', 'side_label')
+            ))
+    
+    def update_overlay(self, indices=None):
+        """
+        Обновить слой разметки по текущим вершинам.
+        
+        Args:
+            indices: Индексы изменённых вершин; None — обновить всё.
+                Затрагиваются только вершины из indices и прилежащие
+                к ним стороны и подписи.
+        """
+        self._ensure_overlay()
+        # Вершины хранятся в пикселях оригинала — переводим в координаты холста
+        vertices = [self.image_to_canvas(x, y) for x, y in self.triangle_manager.vertices]
+        count = len(vertices)
+        
+        if indices is None:
+            vertex_indices = range(3)
+            edge_indices = range(3)
         else:
-            # Рисуем полный треугольник
-            for i in range(3):
+            vertex_indices = set(indices)
+            edge_indices = {i for v in vertex_indices for i in (v, (v - 1) % 3)}
+        
+        for i in vertex_indices:
+            self._update_vertex_item(i, vertices[i] if i < count else None)
+        
+        # Для двух вершин — одна сторона AB, для трёх — все стороны
+        edge_count = 3 if count == 3 else (1 if count == 2 else 0)
+        for i in edge_indices:
+            item = self._edge_items[i]
+            if i < edge_count:
                 start = vertices[i]
-                end = vertices[(i + 1) % 3]
-                self.canvas.create_line(
-                    start[0], start[1], end[0], end[1],
-                    fill=COLOR_TRIANGLE,
-                    width=LINE_WIDTH
-                )
-            
-            for i, vertex in enumerate(vertices):
-                self._draw_vertex(vertex, i)
-            
-            # Отрисовываем подписи сторон (размеры в px и м)
-            self._draw_side_labels()
+                end = vertices[(i + 1) % count]
+                self.canvas.coords(item, start[0], start[1], end[0], end[1])
+                self.canvas.itemconfig(item, state='normal')
+            else:
+                self.canvas.itemconfig(item, state='hidden')
+        
+        # Отрисовываем подписи сторон (размеры в px и м)
+        self._update_side_labels(vertices, edge_indices if count == 3 else range(3))
     
-    def _draw_vertex(self, vertex, index):
+    def _update_vertex_item(self, index, vertex):
         """
-        Отрисовать вершину треугольника.
+        Переместить элемент вершины или скрыть его.
         
         Args:
-            vertex: Координаты вершины (x, y)
             index: Индекс вершины
+            vertex: Координаты вершины (x, y) или None
         """
-        x, y = vertex
-        color = COLOR_HOVER if index == self.hovered_vertex else COLOR_VERTEX
+        item = self._vertex_items[index]
+        if vertex is None:
+            self.canvas.itemconfig(item, state='hidden')
+            return
         
-        self.canvas.create_oval(
+        x, y = vertex
+        self.canvas.coords(
+            item,
             x - VERTEX_RADIUS, y - VERTEX_RADIUS,
-            x + VERTEX_RADIUS, y + VERTEX_RADIUS,
-            fill=color,
-            outline=COLOR_TRIANGLE
+            x + VERTEX_RADIUS, y + VERTEX_RADIUS
         )
+        self.canvas.itemconfig(item, state='normal', fill=self._vertex_color(index))
     
-    def _draw_side_labels(self):
-        """
-        Отрисовать подписи сторон треугольника (размеры в px и м).
+    def _vertex_color(self, index):
+        """Цвет вершины с учётом наведения курсора"""
+        return COLOR_HOVER if index == self.hovered_vertex else COLOR_VERTEX
+    
+    def _update_side_labels(self, vertices, indices):
         """
-        if not self.info_panel:
-            return
+        Обновить подписи сторон треугольника (размеры в px и м).
         
-        vertices = self.triangle_manager.vertices
-        if len(vertices) < 3:
+        Args:
+            vertices: Вершины в координатах холста
+            indices: Индексы сторон, подписи которых нужно обновить
+        """
+        if not self.info_panel or len(vertices) < 3:
+            for item in self._label_items:
+                self.canvas.itemconfig(item, state='hidden')
             return
         
         # Получаем информацию о сторонах
         pixel_size = self.info_panel.get_pixel_size()
-        scale_factor = self.get_scale_factor()
-        self.triangle_manager._update_sides(pixel_size, scale_factor)
-        sides = self.triangle_manager.sides
+        sides = self.triangle_manager.get_sides(pixel_size)
         
         if len(sides) < 3:
             return
         
-        # Названия сторон
-        side_names = ['AB', 'BC', 'CA']
-        
-        for i in range(3):
+        for i in indices:
+            item = self._label_items[i]
+            
             # Координаты середины стороны
             start = vertices[i]
             end = vertices[(i + 1) % 3]
             mid_x = (start[0] + end[0]) / 2
             mid_y = (start[1] + end[1]) / 2
             
-            # Текст с размерами
-            length_px = sides[i]['length_px']
-            length_m = sides[i]['length_m']
-            # label_text = f"{side_names[i]}: {length_px:.0f}px\n ({length_m:.2f}м)"
-            label_text = f"{length_px:.0f}px\n({length_m:.2f}м)"
             # Вычисляем смещение для текста (перпендикулярно стороне)
             dx = end[0] - start[0]
             dy = end[1] - start[1]
             length = (dx**2 + dy**2)**0.5
             
-            if length > 0:
-                # Нормализованный перпендикулярный вектор
-                perp_x = -dy / length
-                perp_y = dx / length
-                
-                # Смещение текста от линии
-                offset = 15
-                text_x = mid_x + perp_x * offset
-                text_y = mid_y + perp_y * offset
-                
-                # Рисуем текст с белым фоном
-                self.canvas.create_text(
-                    text_x, text_y,
-                    text=label_text,
-                    fill="white",
-                    font=("Arial", 10, "bold"),
-                    anchor="center"
-                )
+            if length == 0:
+                self.canvas.itemconfig(item, state='hidden')
+                continue
+            
+            # Нормализованный перпендикулярный вектор
+            perp_x = -dy / length
+            perp_y = dx / length
+            
+            # Смещение текста от линии
+            offset = 15
+            text_x = mid_x + perp_x * offset
+            text_y = mid_y + perp_y * offset
+            
+            # Текст с размерами
+            length_px = sides[i]['length_px']
+            length_m = sides[i]['length_m']
+            label_text = f"{length_px:.0f}px\n({length_m:.2f}м)"
+            
+            self.canvas.coords(item, text_x, text_y)
+            self.canvas.itemconfig(item, text=label_text, state='normal')
     
     def find_vertex_at(self, x, y):
         """
         Найти вершину треугольника в указанной точке.
         
         Args:
-            x, y: Координаты точки
+            x, y: Координаты точки на холсте
             
         Returns:
             Индекс вершины или None
         """
         for i, vertex in enumerate(self.triangle_manager.vertices):
-            vx, vy = vertex
+            vx, vy = self.image_to_canvas(*vertex)
             distance = ((x - vx) ** 2 + (y - vy) ** 2) ** 0.5
             if distance <= VERTEX_RADIUS:
                 return i
@@ -259,8 +509,12 @@ class CanvasHandler:
             index: Индекс вершины или None
         """
         if self.hovered_vertex != index:
+            previous = self.hovered_vertex
             self.hovered_vertex = index
-            self.redraw()
+            # Меняется только цвет двух вершин
+            for i in (previous, index):
+                if i is not None and self._vertex_items:
+                    self.canvas.itemconfig(self._vertex_items[i], fill=self._vertex_color(i))
     
     def start_drag(self, vertex_index):
         """
@@ -276,10 +530,10 @@ class CanvasHandler:
         Обновить позицию перетаскиваемой вершины.
         
         Args:
-            x, y: Новые координаты
+            x, y: Новые координаты на холсте
         """
         if self.dragging_vertex is not None:
-            self.triangle_manager.update_vertex(self.dragging_vertex, x, y)  # Передаём x и y отдельно
+            self.triangle_manager.update_vertex(self.dragging_vertex, *self.canvas_to_image(x, y))
     
     def stop_drag(self):
         """Завершить перетаскивание вершины"""
@@ -288,29 +542,22 @@ class CanvasHandler:
     def zoom_in(self):
         """Увеличить масштаб"""
         self.zoom_level = min(self.zoom_level * 1.2, 5.0)
-        self.redraw()
+        self.redraw(interactive=True)
     
     def zoom_out(self):
         """Уменьшить масштаб"""
         self.zoom_level = max(self.zoom_level / 1.2, 0.1)
-        self.redraw()
+        self.redraw(interactive=True)
     
     def resize_to_canvas(self):
         """
         Пересчитать размер изображения под текущий размер холста.
-        Сохраняет пропорции и относительные позиции вершин треугольника.
+        Сохраняет пропорции; вершины треугольника хранятся в пикселях
+        оригинала и только перерисовываются в новом масштабе.
         """
         if not self.original_pil_image:
             return
         
-        # Сохраняем текущие вершины в относительных координатах
-        relative_vertices = []
-        if self.current_image_size and len(self.triangle_manager.vertices) > 0:
-            for x, y in self.triangle_manager.vertices:
-                rel_x = x / self.current_image_size[0]
-                rel_y = y / self.current_image_size[1]
-                relative_vertices.append((rel_x, rel_y))
-        
         # Получаем новый размер холста
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
@@ -338,22 +585,38 @@ class CanvasHandler:
             f"(canvas: {canvas_width}x{canvas_height}, zoom: {self.zoom_level:.2f})"
         )
         
-        # Перерисовываем с текущим zoom
-        self.redraw()
+        # Перерисовываем с текущим zoom (быстрый проход, пока окно меняет размер)
+        self.redraw(interactive=True)
+    
+    def image_to_canvas(self, x, y):
+        """
+        Перевести координаты оригинального изображения в координаты холста.
         
-        # Восстанавливаем вершины в новых координатах
-        if relative_vertices:
-            new_vertices = []
-            for rel_x, rel_y in relative_vertices:
-                new_x = rel_x * self.current_image_size[0]
-                new_y = rel_y * self.current_image_size[1]
-                new_vertices.append((new_x, new_y))
+        Args:
+            x, y: Координаты в пикселях оригинала
             
-            # Обновляем вершины треугольника
-            self.triangle_manager.vertices = new_vertices
+        Returns:
+            (x, y) на холсте
+        """
+        if self.original_image_size and self.current_image_size:
+            x = x * self.current_image_size[0] / self.original_image_size[0]
+            y = y * self.current_image_size[1] / self.original_image_size[1]
+        return x, y
+    
+    def canvas_to_image(self, x, y):
+        """
+        Перевести координаты холста в координаты оригинального изображения.
+        
+        Args:
+            x, y: Координаты на холсте
             
-            # Перерисовываем еще раз с новыми вершинами
-            self.redraw()
+        Returns:
+            (x, y) в пикселях оригинала
+        """
+        if self.original_image_size and self.current_image_size:
+            x = x * self.original_image_size[0] / self.current_image_size[0]
+            y = y * self.original_image_size[1] / self.current_image_size[1]
+        return x, y
     
     def get_scale_factor(self):
         """
@@ -0,0 +1,67 @@
+"""
+Планировщик перерисовки с бюджетом кадра для Tkinter
+"""
+import time
+
+from utils.constants import UI_FRAME_MS
+
+
+class FrameScheduler:
+    """
+    Объединяет частые запросы обновления UI в один проход за кадр.
+
+    Обработчики событий только помечают задачу «грязной»; все задачи
+    выполняются вместе не чаще одного раза за frame_ms. Повторный запрос
+    той же задачи до выполнения кадра заменяет предыдущий, поэтому серия
+    событий движения мыши даёт одну перерисовку.
+    """
+
+    def __init__(self, widget, frame_ms=UI_FRAME_MS):
+        """
+        Args:
+            widget: Любой виджет Tk (для after/after_cancel)
+            frame_ms: Бюджет кадра в миллисекундах
+        """
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self._pending = {}
+        self._job = None
+        self._last_flush = 0.0
+
+    def request(self, name, callback):
+        """
+        Запланировать задачу на ближайший кадр.
+
+        Args:
+            name: Имя задачи (повторные запросы объединяются)
+            callback: Функция без аргументов
+        """
+        self._pending[name] = callback
+        if self._job is None:
+            elapsed_ms = (time.perf_counter() - self._last_flush) * 1000
+            delay = max(0, int(self.frame_ms - elapsed_ms))
+            self._job = self.widget.after(delay, self.flush)
+
+    def flush(self):
+        """
+        Выполнить все запланированные задачи.
+
+        Задачи, запрошенные во время кадра (например, перерисовка после
+        перемещения вершины), выполняются в этом же кадре.
+        """
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        self._last_flush = time.perf_counter()
+
+        while self._pending:
+            name = next(iter(self._pending))
+            callback = self._pending.pop(name)
+            callback()
+
+    def cancel(self):
+        """Отменить запланированные задачи"""
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        self._pending.clear()
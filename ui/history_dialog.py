@@ -0,0 +1,154 @@
+"""
+Диалоговое окно истории измерений (агрегаты массы по часам, сменам и суткам)
+"""
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime, timedelta
+
+from core.store import parse_time
+from utils.constants import HISTORY_MAX_BUCKETS
+from utils.logger import app_logger
+
+# Подписи списков выбора → значения для store.rollups()
+CAMERAS = {"Все": None, "ЗИФ-1": "ZIF1", "ЗИФ-2": "ZIF2"}
+RESOLUTIONS = {"Авто": None, "Час": "hour", "Смена": "shift", "Сутки": "day"}
+
+
+class HistoryDialog:
+    """Окно с таблицей агрегатов массы из истории измерений"""
+
+    # Ключ фоновой задачи: повторный запрос отменяет незавершённый
+    TASK_KEY = "history"
+
+    def __init__(self, parent, store, config, background):
+        """
+        Инициализация окна истории.
+
+        Args:
+            parent: Родительское окно
+            store: Хранилище истории измерений (MeasurementStore)
+            config: Объект конфигурации
+            background: BackgroundRunner главного окна
+        """
+        self.store = store
+        self.config = config
+        self.background = background
+        self.window = tk.Toplevel(parent)
+        self.window.title("История измерений")
+        self.window.geometry("760x480")
+        self.window.transient(parent)
+
+        now = datetime.now()
+        self.camera_var = tk.StringVar(value="Все")
+        self.resolution_var = tk.StringVar(value="Авто")
+        self.from_var = tk.StringVar(value=(now - timedelta(days=7)).strftime("%Y-%m-%d"))
+        self.to_var = tk.StringVar(value="")
+        self.summary_var = tk.StringVar()
+
+        self._create_widgets()
+        self.refresh()
+
+        # Центрируем окно относительно родителя
+        self.window.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - self.window.winfo_width()) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - self.window.winfo_height()) // 2
+        self.window.geometry(f"+{x}+{y}")
+
+        app_logger.info("History dialog opened")
+
+    def _create_widgets(self):
+        """Создание виджетов окна истории"""
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill='both', expand=True)
+
+        # Фильтры
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.pack(fill='x', pady=(0, 10))
+
+        ttk.Label(filter_frame, text="Камера:").pack(side='left')
+        ttk.Combobox(filter_frame, textvariable=self.camera_var, values=list(CAMERAS),
+                     state='readonly', width=8).pack(side='left', padx=(5, 10))
+
+        ttk.Label(filter_frame, text="Интервал:").pack(side='left')
+        ttk.Combobox(filter_frame, textvariable=self.resolution_var, values=list(RESOLUTIONS),
+                     state='readonly', width=8).pack(side='left', padx=(5, 10))
+
+        ttk.Label(filter_frame, text="С:").pack(side='left')
+        ttk.Entry(filter_frame, textvariable=self.from_var, width=17).pack(side='left', padx=(5, 10))
+
+        ttk.Label(filter_frame, text="По:").pack(side='left')
+        ttk.Entry(filter_frame, textvariable=self.to_var, width=17).pack(side='left', padx=(5, 10))
+
+        ttk.Button(filter_frame, text="Показать", command=self.refresh).pack(side='right')
+
+        # Таблица агрегатов
+        table_frame = ttk.Frame(main_frame)
+        table_frame.pack(fill='both', expand=True)
+
+        columns = ("bucket", "camera", "count", "min", "max", "mean", "last")
+        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings')
+        headings = ("Начало", "Камера", "Измерений", "Мин, т", "Макс, т", "Средн., т", "Послед., т")
+        for column, heading in zip(columns, headings):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=140 if column == "bucket" else 90, anchor='e')
+        self.tree.column("bucket", anchor='w')
+        self.tree.column("camera", anchor='center')
+
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+
+        # Итог и кнопка закрытия
+        bottom_frame = ttk.Frame(main_frame)
+        bottom_frame.pack(fill='x', pady=(10, 0))
+        ttk.Label(bottom_frame, textvariable=self.summary_var).pack(side='left')
+        ttk.Button(bottom_frame, text="Закрыть", command=self.window.destroy).pack(side='right')
+
+    def refresh(self):
+        """Перечитать агрегаты с текущими фильтрами"""
+        try:
+            start = parse_time(self.from_var.get().strip())
+            end = parse_time(self.to_var.get().strip())
+        except ValueError:
+            messagebox.showerror("Ошибка", "Даты указываются в формате ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ",
+                                 parent=self.window)
+            return
+
+        camera = CAMERAS[self.camera_var.get()]
+        resolution = RESOLUTIONS[self.resolution_var.get()]
+        max_buckets = self.config.get("HISTORY_MAX_BUCKETS", HISTORY_MAX_BUCKETS)
+
+        def query(task):
+            # Недавние измерения могут ещё стоять в очереди на запись
+            self.store.flush(timeout=1)
+            return self.store.rollups(camera, start, end, resolution, max_buckets)
+
+        def on_error(error):
+            app_logger.error(f"History query failed: {error}")
+            if self.window.winfo_exists():
+                self.summary_var.set("Не удалось прочитать историю")
+                messagebox.showerror("Ошибка", f"Не удалось прочитать историю:\n{error}", parent=self.window)
+
+        self.summary_var.set("Загрузка...")
+        self.background.submit(self.TASK_KEY, query, on_success=self._show, on_error=on_error)
+
+    def _show(self, result):
+        """Заполнить таблицу результатом store.rollups()"""
+        # Окно могли закрыть, пока шёл запрос
+        if not self.window.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for bucket in result['buckets']:
+            self.tree.insert('', 'end', values=(
+                bucket['bucket'].replace('T', ' ')[:16],
+                bucket['camera'],
+                bucket['count'],
+                f"{bucket['min']:.1f}",
+                f"{bucket['max']:.1f}",
+                f"{bucket['mean']:.1f}",
+                f"{bucket['last']:.1f}",
+            ))
+
+        label = next(name for name, value in RESOLUTIONS.items() if value == result['resolution'])
+        self.summary_var.set(f"Интервал: {label.lower()}; строк: {len(result['buckets'])}")
@@ -1,17 +1,21 @@
 """
 Обработчик загрузки и обработки изображений
 """
+import io
 import os
+from datetime import datetime
 from tkinter import filedialog, messagebox
 from PIL import Image
 from core.image_loader import ImageLoader
+from core.metadata import read_metadata
+from utils.imaging import content_hash
 from utils.logger import app_logger
 
 
 class ImageHandler:
     """Класс для управления загрузкой и обработкой изображений"""
     
-    def __init__(self, canvas_handler, info_panel, status_var):
+    def __init__(self, canvas_handler, info_panel, status_var, metadata_callback=None):
         """
         Инициализация обработчика изображений.
         
@@ -19,12 +23,19 @@ class ImageHandler:
             canvas_handler: Обработчик холста
             info_panel: Информационная панель
             status_var: Переменная для статусной строки
+            metadata_callback: Функция (metadata) для восстановления измерения
+                из метаданных открытого файла
         """
         self.canvas_handler = canvas_handler
         self.info_panel = info_panel
         self.status_var = status_var
+        self.metadata_callback = metadata_callback
         
         self.image_path = None
+        # Время съёмки текущего кадра (записывается в метаданные при сохранении)
+        self.captured_at = None
+        # Хэш текущего кадра (записывается в историю измерений)
+        self.frame_hash = None
     
     def open_image(self):
         """Открыть изображение из файла"""
@@ -33,7 +44,7 @@ class ImageHandler:
         file_path = filedialog.askopenfilename(
             title="Выберите изображение",
             filetypes=[
-                ("Изображения", "*.png *.jpg *.jpeg *.bmp *.gif"),
+                ("Изображения", "*.png *.jpg *.jpeg *.webp *.bmp *.gif"),
                 ("Все файлы", "*.*")
             ]
         )
@@ -51,11 +62,17 @@ class ImageHandler:
         try:
             app_logger.info(f"Loading image from file: {file_path}")
             
-            # Загружаем изображение
-            pil_image = Image.open(file_path)
+            # Загружаем изображение; хэш — по содержимому файла, как в пакетной обработке
+            with open(file_path, 'rb') as file:
+                content = file.read()
+            pil_image = Image.open(io.BytesIO(content))
+            # Блок измерения читается из заголовка, до декодирования пикселей
+            metadata = read_metadata(pil_image)
             
             # Сохраняем путь
             self.image_path = file_path
+            self.captured_at = self._captured_at(metadata, file_path)
+            self.frame_hash = content_hash(content)
             
             # Устанавливаем изображение на холсте
             self.canvas_handler.set_image(pil_image)
@@ -67,6 +84,10 @@ class ImageHandler:
             self.status_var.set(f"Загружено: {os.path.basename(file_path)}")
             app_logger.info(f"Image loaded successfully: {pil_image.size}")
             
+            if metadata and self.metadata_callback:
+                app_logger.info(f"Restoring measurement from metadata of {file_path}")
+                self.metadata_callback(metadata)
+            
         except Exception as e:
             app_logger.error(f"Failed to load image: {str(e)}")
             messagebox.showerror(
@@ -74,19 +95,22 @@ class ImageHandler:
                 f"Не удалось загрузить изображение:\n{str(e)}"
             )
     
-    def load_image_from_pil(self, pil_image, source_name="Trassir"):
+    def load_image_from_pil(self, pil_image, source_name="Trassir", frame_hash=None):
         """
         Загрузить изображение из PIL объекта.
         
         Args:
             pil_image: PIL изображение
             source_name: Название источника изображения
+            frame_hash: Хэш исходных байтов кадра (utils.imaging.content_hash)
         """
         try:
             app_logger.info(f"Loading image from {source_name}")
             
             # Очищаем путь к файлу
             self.image_path = None
+            self.captured_at = datetime.now()
+            self.frame_hash = frame_hash
             
             # Устанавливаем изображение на холсте
             self.canvas_handler.set_image(pil_image)
@@ -105,6 +129,16 @@ class ImageHandler:
                 f"Не удалось загрузить изображение:\n{str(e)}"
             )
     
+    @staticmethod
+    def _captured_at(metadata, file_path):
+        """Время съёмки: из метаданных измерения, иначе время изменения файла"""
+        if metadata:
+            try:
+                return datetime.fromisoformat(metadata['captured_at'])
+            except (KeyError, TypeError, ValueError):
+                pass
+        return datetime.fromtimestamp(os.path.getmtime(file_path))
+    
     def _update_image_info(self, pil_image, source):
         """
         Обновить информацию об изображении на панели.
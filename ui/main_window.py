@@ -2,8 +2,10 @@
 Главное окно приложения (Refactored)
 """
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import os
+import time
+from datetime import datetime
 
 from .menu import Menu
 from .toolbar import Toolbar
@@ -12,18 +14,25 @@ from .canvas_handler import CanvasHandler
 from .image_handler import ImageHandler
 from .trassir_handler import TrassirHandler
 from .save_handler import SaveHandler
+from .frame_scheduler import FrameScheduler
+from .background import BackgroundRunner
+from core.exporter import EXPORT_FORMATS, export_to_file, format_from_path, parquet_available
+from core.store import open_store
 from core.triangle import TriangleManager
-from core.cone_calculator import ConeCalculator
-from core.vision import auto_detect_triangle
-from utils.constants import COLOR_BG, CANVAS_WIDTH, CANVAS_HEIGHT
+from core.vision import auto_detect_triangle_with_confidence
+from utils.constants import COLOR_BG, CANVAS_WIDTH, CANVAS_HEIGHT, EXPORT_CHUNK_ROWS
 from utils.config import Config
 from utils.logger import app_logger
+from utils.metrics import REGISTRY
 from utils.resources import get_resource_path
 
 
 class MainWindow:
     """Главное окно приложения"""
     
+    # Ключ фоновой задачи автоопределения
+    DETECT_TASK_KEY = "auto_detect"
+    
     def __init__(self):
         """Инициализация главного окна"""
         app_logger.info("Initializing main window")
@@ -44,6 +53,7 @@ class MainWindow:
         
         # Инициализация компонентов
         self.config = Config()
+        self.store = open_store(self.config)
         self.triangle_manager = TriangleManager()
         self.triangle_manager.add_listener(self)
         
@@ -98,8 +108,8 @@ class MainWindow:
             bg=COLOR_BG,
             width=CANVAS_WIDTH,
             height=CANVAS_HEIGHT,
-            xscrollcommand=self.h_scrollbar.set,
-            yscrollcommand=self.v_scrollbar.set
+            xscrollcommand=lambda *args: self._on_canvas_scroll(self.h_scrollbar, *args),
+            yscrollcommand=lambda *args: self._on_canvas_scroll(self.v_scrollbar, *args)
         )
         self.canvas.pack(side='left', fill='both', expand=True, padx=5, pady=5)
         
@@ -112,29 +122,57 @@ class MainWindow:
         self.info_panel.pack(side='right', fill='y', padx=(0, 0))
         
         # Статус бар
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side='bottom', fill='x')
+        
         self.status_var = tk.StringVar(value="Готов к работе")
         status_bar = ttk.Label(
-            self.root, textvariable=self.status_var, relief='sunken'
+            status_frame, textvariable=self.status_var, relief='sunken'
         )
-        status_bar.pack(side='bottom', fill='x')
+        status_bar.pack(side='left', fill='x', expand=True)
+        
+        # Кнопка отмены фоновой операции (видна только во время загрузки)
+        self.cancel_button = ttk.Button(status_frame, text="Отмена", command=self.cancel_loading)
     
     def _setup_handlers(self):
         """Инициализация обработчиков"""
         # Canvas handler
         self.canvas_handler = CanvasHandler(self.canvas, self.triangle_manager, self.info_panel)
+        # Планировщик перерисовки: события мыши объединяются в один кадр
+        self.frame_scheduler = FrameScheduler(self.root)
+        self._pending_vertices = set()  # Изменённые вершины (None — все)
+        self._detection = None  # (версия вершин, уверенность) последнего автоопределения
+        self._pointer = None
+        self._drag_pointer = None
+        self._sides_key = None
+        self._cone_key = None
+        
+        self.canvas_handler.configure_resampling(
+            fast=self.config.get("RENDER_FAST_RESAMPLE"),
+            quality=self.config.get("RENDER_QUALITY_RESAMPLE"),
+            delay_ms=self.config.get("RENDER_QUALITY_DELAY_MS")
+        )
         
         # Image handler
         self.image_handler = ImageHandler(
             self.canvas_handler, 
             self.info_panel, 
-            self.status_var
+            self.status_var,
+            metadata_callback=self._restore_measurement
         )
         
+        # Фоновые задачи (загрузка с Trassir, автоопределение, сохранение):
+        # результаты возвращаются через root.after
+        self.background = BackgroundRunner(self.root)
+        
         # Trassir handler
         self.trassir_handler = TrassirHandler(
             self.config,
             self.image_handler,
-            self.info_panel
+            self.info_panel,
+            runner=self.background,
+            status_var=self.status_var,
+            busy_callback=self._set_loading
         )
         
         # Save handler
@@ -143,7 +181,9 @@ class MainWindow:
             self.image_handler,
             self.triangle_manager,
             self.info_panel,
-            self.status_var
+            self.status_var,
+            config=self.config,
+            runner=self.background
         )
     
     def _setup_bindings(self):
@@ -157,8 +197,13 @@ class MainWindow:
         
         # Обновление информации при изменении параметров
         self.info_panel.pixel_size_var_zif1.trace('w', self.on_pixel_size_changed)
-        self.info_panel.k_vol_var.trace('w', lambda *args: self.on_triangle_changed())
-        self.info_panel.k_den_var.trace('w', lambda *args: self.on_triangle_changed())
+        # Коэффициенты не влияют на холст — пересчитывается только информация
+        self.info_panel.k_vol_var.trace('w', lambda *args: self._request_info_update())
+        self.info_panel.k_den_var.trace('w', lambda *args: self._request_info_update())
+        
+        # Отмена загрузки
+        self.root.bind("<Escape>", lambda e: self.cancel_loading())
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Горячие клавиши для масштабирования
         self.root.bind("<plus>", lambda e: self.zoom_in())
@@ -182,7 +227,8 @@ class MainWindow:
         else:
             # Добавляем новую вершину
             if not self.triangle_manager.is_complete():
-                self.triangle_manager.add_vertex(x, y)  # Передаём x и y отдельно
+                # Вершины хранятся в координатах оригинального изображения
+                self.triangle_manager.add_vertex(*self.canvas_handler.canvas_to_image(x, y))
                 vertex_count = len(self.triangle_manager.vertices)
                 self.status_var.set(f"Добавлена вершина {vertex_count}/3")
                 
@@ -190,17 +236,32 @@ class MainWindow:
                     self.status_var.set("Треугольник построен")
     
     def on_canvas_drag(self, event):
-        """Обработка перетаскивания на холсте"""
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        self.canvas_handler.drag_vertex(x, y)
+        """Обработка перетаскивания на холсте (применяется раз в кадр)"""
+        self._drag_pointer = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        self.frame_scheduler.request('drag', self._apply_drag)
+    
+    def _apply_drag(self):
+        """Переместить вершину в последнюю позицию указателя"""
+        if self._drag_pointer is not None:
+            self.canvas_handler.drag_vertex(*self._drag_pointer)
+            self._drag_pointer = None
     
     def on_canvas_release(self, event):
         """Обработка отпускания кнопки мыши"""
+        # Применяем последнее перемещение до завершения перетаскивания
+        self.frame_scheduler.flush()
         self.canvas_handler.stop_drag()
     
     def on_canvas_motion(self, event):
-        """Обработка движения мыши над холстом"""
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        """Обработка движения мыши над холстом (применяется раз в кадр)"""
+        self._pointer = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        self.frame_scheduler.request('hover', self._apply_hover)
+    
+    def _apply_hover(self):
+        """Подсветить вершину под последней позицией указателя"""
+        if self._pointer is None:
+            return
+        x, y = self._pointer
         vertex_index = self.canvas_handler.find_vertex_at(x, y)
         self.canvas_handler.set_hovered_vertex(vertex_index)
         
@@ -210,6 +271,13 @@ class MainWindow:
         else:
             self.canvas.config(cursor="")
     
+    def _on_canvas_scroll(self, scrollbar, first, last):
+        """Синхронизация полосы прокрутки и догрузка видимой области холста"""
+        scrollbar.set(first, last)
+        canvas_handler = getattr(self, 'canvas_handler', None)
+        if canvas_handler:
+            canvas_handler.schedule_viewport_update()
+    
     def on_canvas_resize(self, event):
         """Обработка изменения размера холста"""
         # Проверяем, что размер действительно изменился
@@ -220,27 +288,64 @@ class MainWindow:
     
     # ==================== Обработчики изменений ====================
     
-    def on_triangle_changed(self):
-        """Обработка изменения треугольника"""
-        self.canvas_handler.redraw()
+    def on_triangle_changed(self, change=None):
+        """
+        Обработка изменения треугольника.
+        
+        Перерисовка холста и пересчёт информации откладываются до
+        ближайшего кадра, поэтому серия изменений даёт один проход.
         
-        # Обновление информации
+        Args:
+            change: TriangleChange или None (перерисовать всё)
+        """
+        if change is not None and change.empty:
+            return
+        
+        # Если число вершин не изменилось, перерисовываются только
+        # сдвинутые вершины и прилежащие стороны
+        if change is None or change.count_changed:
+            self._pending_vertices = None
+        elif self._pending_vertices is not None:
+            self._pending_vertices.update(change.indices)
+        
+        self.frame_scheduler.request('canvas', self._apply_canvas_update)
+        self._request_info_update()
+    
+    def _apply_canvas_update(self):
+        """Перерисовать изменённую часть холста"""
+        indices = self._pending_vertices
+        self._pending_vertices = set()
+        self.canvas_handler.redraw(None if indices is None else sorted(indices))
+    
+    def _request_info_update(self):
+        """Запланировать обновление панели информации"""
+        self.frame_scheduler.request('info', self._apply_info_update)
+    
+    def _apply_info_update(self):
+        """
+        Обновить информацию о треугольнике и конусе.
+        
+        Панель обновляется только если изменились вершины, размер пикселя
+        или коэффициенты; сами расчёты кэширует TriangleManager.
+        Вершины хранятся в пикселях оригинала, поэтому масштаб холста
+        на результат не влияет.
+        """
         pixel_size = self.info_panel.get_pixel_size()
-        scale_factor = self.canvas_handler.get_scale_factor()
         
         # Обновление информации о треугольниках
-        self.triangle_manager._update_sides(pixel_size, scale_factor)
-        self.info_panel.update_triangle_info(self.triangle_manager.sides)
+        sides_key = (self.triangle_manager.revision, pixel_size)
+        if sides_key != self._sides_key:
+            self._sides_key = sides_key
+            self.info_panel.update_triangle_info(self.triangle_manager.get_sides(pixel_size))
         
         # Расчет и обновление информации о конусе
         if self.triangle_manager.is_complete():
             k_vol = self.info_panel.get_k_vol()
-            cone_params = ConeCalculator.get_cone_parameters(
-                self.triangle_manager.vertices,
-                pixel_size,
-                scale_factor,
-                k_vol
-            )
+            cone_key = sides_key + (k_vol, self.info_panel.get_k_den())
+            if cone_key == self._cone_key:
+                return
+            self._cone_key = cone_key
+            cone_params = self.triangle_manager.get_cone_parameters(pixel_size, k_vol=k_vol)
             self.info_panel.update_cone_info(cone_params)
     
     def on_pixel_size_changed(self, *args):
@@ -253,6 +358,30 @@ class MainWindow:
         """Запустить главный цикл приложения"""
         self.root.mainloop()
     
+    def on_close(self):
+        """Закрытие окна: отменить фоновые задачи, записать историю и выйти"""
+        self.background.shutdown()
+        self.store.close()
+        self.root.destroy()
+    
+    def cancel_loading(self):
+        """Отменить текущую загрузку с Trassir и автоопределение"""
+        self.trassir_handler.cancel_loading()
+        self.background.cancel(self.DETECT_TASK_KEY)
+    
+    def _set_loading(self, loading):
+        """Показать/скрыть кнопку отмены фоновой операции в статусной строке"""
+        # Кнопка остаётся, пока выполняется хотя бы одна операция
+        if not loading and (self.trassir_handler.is_loading()
+                            or self.background.is_running(self.DETECT_TASK_KEY)):
+            return
+        if loading:
+            self.cancel_button.pack(side='right', padx=(5, 0))
+            self.root.config(cursor="watch")
+        else:
+            self.cancel_button.pack_forget()
+            self.root.config(cursor="")
+    
     def open_image(self):
         """Открыть изображение из файла"""
         self.image_handler.open_image()
@@ -285,6 +414,7 @@ class MainWindow:
         self.triangle_manager.clear()
         self.canvas_handler.redraw()
         self.info_panel.clear_cone_info()  # Очищаем информацию об объёме и массе
+        self._cone_key = None
         self.status_var.set("Треугольник очищен")
         app_logger.info("Triangle cleared")
     
@@ -308,73 +438,105 @@ class MainWindow:
             )
             return
         
-        try:
-            app_logger.info(f"Auto-building triangle for {current_cone_type}")
-            self.status_var.set("Автоматическое построение треугольника...")
-            
-            # Получаем порог бинаризации
-            threshold = self.info_panel.get_threshold()
-            
-            # Получаем конфигурацию камеры
-            cam_config = self.config.get(f"CAM_CONE_{current_cone_type}", {})
-            
-            # Запускаем автоопределение
-            vertices = auto_detect_triangle(
-                current_image,
-                current_cone_type,
-                threshold,
-                cam_config
-            )
-            
-            if vertices:
-                # Очищаем старый треугольник
-                self.triangle_manager.clear()
-                
-                # Преобразуем координаты с учётом масштаба изображения
-                # auto_detect_triangle() возвращает координаты для оригинального изображения
-                original_size = self.canvas_handler.original_image_size
-                current_size = self.canvas_handler.current_image_size
-                
-                if original_size and current_size:
-                    # Вычисляем коэффициент масштаба (от оригинала к отображаемому)
-                    scale_x = current_size[0] / original_size[0]
-                    scale_y = current_size[1] / original_size[1]
-                    
-                    app_logger.info(
-                        f"Scaling vertices from {original_size} to {current_size} "
-                        f"(scale_x: {scale_x:.3f}, scale_y: {scale_y:.3f})"
-                    )
-                    
-                    # Добавляем масштабированные вершины
-                    for vertex in vertices:
-                        x_orig, y_orig = vertex
-                        x_scaled = x_orig * scale_x
-                        y_scaled = y_orig * scale_y
-                        self.triangle_manager.add_vertex(x_scaled, y_scaled)
-                        app_logger.debug(f"Vertex: ({x_orig:.0f}, {y_orig:.0f}) -> ({x_scaled:.0f}, {y_scaled:.0f})")
-                else:
-                    # Если нет информации о размерах, используем координаты как есть
-                    for vertex in vertices:
-                        x, y = vertex
-                        self.triangle_manager.add_vertex(x, y)
-                
-                self.status_var.set("Треугольник построен автоматически")
-                app_logger.info("Triangle auto-built successfully")
-            else:
-                self.status_var.set("Не удалось автоматически определить треугольник")
-                messagebox.showwarning(
-                    "Предупреждение",
-                    "Не удалось автоматически определить контур конуса.\n"
-                    "Попробуйте построить треугольник вручную."
-                )
+        app_logger.info(f"Auto-building triangle for {current_cone_type}")
+        self.status_var.set("Автоматическое построение треугольника...")
         
-        except Exception as e:
-            app_logger.error(f"Failed to auto-build triangle: {str(e)}")
+        # Получаем порог бинаризации
+        threshold = self.info_panel.get_threshold()
+        
+        # Получаем конфигурацию камеры (копия — поток не должен видеть правки)
+        cam_config = dict(self.config.get(f"CAM_CONE_{current_cone_type}", {}))
+        
+        def detect(task):
+            start = time.perf_counter()
+            vertices, confidence = auto_detect_triangle_with_confidence(
+                current_image, current_cone_type, threshold, cam_config
+            )
+            return vertices, confidence, time.perf_counter() - start
+        
+        def on_success(result):
+            self._set_loading(False)
+            vertices, confidence, elapsed = result
+            # Пока шло определение, могли загрузить другое изображение
+            if self.image_handler.get_current_image() is not current_image:
+                app_logger.info("Auto-detection result discarded: image changed")
+                return
+            self._apply_detected_vertices(vertices, elapsed, confidence)
+        
+        def on_error(error):
+            self._set_loading(False)
+            app_logger.error(f"Failed to auto-build triangle: {str(error)}")
             messagebox.showerror(
                 "Ошибка",
-                f"Ошибка при автоматическом построении:\n{str(e)}"
+                f"Ошибка при автоматическом построении:\n{str(error)}"
             )
             self.status_var.set("Ошибка автопостроения")
+        
+        def on_cancel():
+            self._set_loading(False)
+            self.status_var.set("Автопостроение отменено")
+        
+        # Определение выполняется в рабочем потоке; повторный запуск отменяет предыдущий
+        self._set_loading(True)
+        self.background.submit(
+            self.DETECT_TASK_KEY, detect,
+            on_success=on_success,
+            on_error=on_error,
+            on_cancel=on_cancel
+        )
+    
+    def _apply_detected_vertices(self, vertices, elapsed, confidence=None):
+        """
+        Применить найденные вершины одним обновлением треугольника.
+        
+        Args:
+            vertices: Вершины в координатах оригинального изображения или None
+            elapsed: Время определения, с
+            confidence: Уверенность распознавания 0..1
+        """
+        if not vertices:
+            self.status_var.set(
+                f"Не удалось автоматически определить треугольник ({elapsed * 1000:.0f} мс)"
+            )
+            messagebox.showwarning(
+                "Предупреждение",
+                "Не удалось автоматически определить контур конуса.\n"
+                "Попробуйте построить треугольник вручную."
+            )
+            return
+        
+        # auto_detect_triangle_with_confidence() возвращает координаты оригинального
+        # изображения — в них же хранятся вершины треугольника
+        self.triangle_manager.set_vertices(vertices)
+        self._detection = (self.triangle_manager.revision, confidence)
+        
+        self.status_var.set(f"Треугольник построен автоматически за {elapsed * 1000:.0f} мс")
+        app_logger.info(f"Triangle auto-built successfully in {elapsed:.3f}s")
+    
+    def _restore_measurement(self, metadata):
+        """
+        Восстановить треугольник и параметры расчёта из метаданных открытого файла.
+        
+        Args:
+            metadata: Блок метаданных (см. core.metadata.read_metadata)
+        """
+        camera = metadata.get('camera')
+        if camera not in ("ZIF1", "ZIF2"):
+            camera = None
+        
+        # Параметры файла не должны перезаписывать калибровку камеры в config.json:
+        # поля заполняются до назначения типа конуса
+        self.info_panel.set_current_cone_type(None)
+        self.info_panel.set_pixel_size(metadata.get('pixel_size_m', self.info_panel.get_pixel_size()))
+        self.info_panel.set_k_vol(metadata.get('k_vol', self.info_panel.get_k_vol()))
+        self.info_panel.set_k_den(metadata.get('k_den', self.info_panel.get_k_den()))
+        self.trassir_handler.set_current_cone_type(camera)
+        
+        self.triangle_manager.set_vertices(metadata['vertices'])
+        self._detection = (self.triangle_manager.revision, metadata.get('confidence', 1.0))
+        
+        name = os.path.basename(self.image_handler.get_image_path() or "")
+        self.status_var.set(f"Загружено: {name} (измерение восстановлено из метаданных)")
     
     def copy_cone_volume(self):
         """Скопировать объём и массу конуса в буфер обмена"""
@@ -390,15 +552,9 @@ class MainWindow:
             pixel_size = self.info_panel.get_pixel_size()
             k_vol = self.info_panel.get_k_vol()
             k_den = self.info_panel.get_k_den()
-            scale_factor = self.canvas_handler.get_scale_factor()
             
             # Вычисляем параметры конуса
-            cone_params = ConeCalculator.get_cone_parameters(
-                self.triangle_manager.vertices,
-                pixel_size,
-                scale_factor,
-                k_vol
-            )
+            cone_params = self.triangle_manager.get_cone_parameters(pixel_size, k_vol=k_vol)
             
             volume = cone_params['volume']
             mass = volume * k_den
@@ -414,6 +570,23 @@ class MainWindow:
             self.status_var.set(f"Скопировано: Объём={volume:.2f} м³, Масса={mass:.2f} т")
             app_logger.info(f"Copied to clipboard: {clipboard_text}")
             
+            # Скопированное значение считается выполненным замером
+            self.store.append({
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'camera': self.trassir_handler.get_current_cone_type(),
+                'source': 'desktop',
+                'triangle': [list(vertex) for vertex in self.triangle_manager.vertices],
+                'pixel_size_m': pixel_size,
+                'k_vol': k_vol,
+                'k_den': k_den,
+                'volume': volume,
+                'mass': mass,
+                'radius_m': cone_params['radius_m'],
+                'height_m': cone_params['height_m'],
+                'confidence': self._measurement_confidence(),
+                'frame_hash': self.image_handler.frame_hash,
+            })
+            
         except Exception as e:
             app_logger.error(f"Failed to copy cone volume: {str(e)}")
             messagebox.showerror(
@@ -421,6 +594,78 @@ class MainWindow:
                 f"Ошибка при копировании:\n{str(e)}"
             )
     
+    def _measurement_confidence(self):
+        """
+        Уверенность текущего треугольника: результат автоопределения, если
+        вершины с тех пор не менялись; треугольник, построенный или
+        поправленный оператором, считается подтверждённым (1.0).
+        """
+        if self._detection and self._detection[0] == self.triangle_manager.revision:
+            return self._detection[1]
+        return 1.0
+    
+    def dump_metrics(self):
+        """Сохранить снимок метрик производительности в файл (формат Prometheus)"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = filedialog.asksaveasfilename(
+            title="Сохранить метрики",
+            initialfile=f"metrics_{timestamp}.prom",
+            defaultextension=".prom",
+            filetypes=[("Prometheus text", "*.prom *.txt"), ("Все файлы", "*.*")]
+        )
+        if not file_path:
+            return
+        
+        try:
+            REGISTRY.dump(file_path)
+            self.status_var.set(f"Метрики сохранены: {os.path.basename(file_path)}")
+            app_logger.info(f"Metrics dumped to {file_path}")
+        except OSError as e:
+            app_logger.error(f"Failed to dump metrics: {e}")
+            messagebox.showerror("Ошибка", f"Не удалось сохранить метрики:\n{e}")
+    
+    def export_history(self):
+        """Экспортировать историю измерений в CSV, JSON Lines или Parquet"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filetypes = [("CSV", "*.csv"), ("JSON Lines", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Parquet", "*.parquet"))
+        file_path = filedialog.asksaveasfilename(
+            title="Экспорт истории измерений",
+            initialfile=f"measurements_{timestamp}.csv",
+            defaultextension=".csv",
+            filetypes=filetypes
+        )
+        if not file_path:
+            return
+        
+        try:
+            fmt = format_from_path(file_path)
+        except ValueError:
+            messagebox.showerror(
+                "Ошибка",
+                f"Неизвестный формат файла. Допустимые расширения: "
+                f"{', '.join(extension for _, extension in EXPORT_FORMATS.values())}"
+            )
+            return
+        
+        chunk_rows = self.config.get("EXPORT_CHUNK_ROWS", EXPORT_CHUNK_ROWS)
+        
+        def export(task):
+            # Недавние измерения могут ещё стоять в очереди на запись
+            self.store.flush(timeout=5)
+            return export_to_file(self.store.records(), file_path, fmt, chunk_rows)
+        
+        def on_success(count):
+            self.status_var.set(f"Экспортировано измерений: {count} → {os.path.basename(file_path)}")
+        
+        def on_error(error):
+            app_logger.error(f"History export failed: {error}")
+            messagebox.showerror("Ошибка", f"Не удалось экспортировать историю:\n{error}")
+        
+        self.status_var.set("Экспорт истории измерений...")
+        self.background.submit(f"export:{file_path}", export, on_success=on_success, on_error=on_error)
+    
     def _update_zoom_info(self):
         """Обновить информацию о масштабе"""
         current_image = self.image_handler.get_current_image()
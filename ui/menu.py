@@ -5,6 +5,7 @@ import tkinter as tk
 import tkinter.messagebox
 from core.image_loader import ImageLoader
 from utils.constants import VERSION, APP_NAME, DESCRIPTION, GITHUB_URL, AUTHOR, WEBSITE, EMAIL
+from .history_dialog import HistoryDialog
 from .settings_dialog import SettingsDialog
 
 
@@ -18,6 +19,8 @@ class Menu:
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.file_menu.add_command(label="Открыть", command=self.app.open_image)
         self.file_menu.add_command(label="Сохранить", command=self.app.save_image)
+        self.file_menu.add_command(label="История измерений...", command=self.open_history)
+        self.file_menu.add_command(label="Экспорт истории...", command=self.app.export_history)
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Конус ЗИФ1", command=self.app.load_cone_zif1)
         self.file_menu.add_command(label="Конус ЗИФ2", command=self.app.load_cone_zif2)
@@ -44,6 +47,8 @@ class Menu:
 
         # Меню "Справка"
         self.help_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.help_menu.add_command(label="Сохранить метрики производительности", command=self.app.dump_metrics)
+        self.help_menu.add_separator()
         self.help_menu.add_command(label="О программе", command=self.show_about)
         self.menu_bar.add_cascade(label="Справка", menu=self.help_menu)
 
@@ -67,4 +72,8 @@ GitHub:
     
     def open_settings(self):
         """Открыть окно настроек"""
-        SettingsDialog(self.app.root, self.app.config)
\ No newline at end of file
+        SettingsDialog(self.app.root, self.app.config)
+
+    def open_history(self):
+        """Открыть окно истории измерений"""
+        HistoryDialog(self.app.root, self.app.store, self.app.config, self.app.background)
\ No newline at end of file
@@ -2,15 +2,19 @@
 Обработчик интеграции с Trassir
 """
 from tkinter import messagebox
-from PIL import Image
-from utils.trassir import Trassir
+from utils.constants import SCREENSHOT_RESAMPLE
+from utils.imaging import content_hash, resample_filter
+from utils.trassir import TrassirRegistry, img_to_pillow, scale_screenshot
 from utils.logger import app_logger
 
 
 class TrassirHandler:
     """Класс для управления интеграцией с Trassir"""
     
-    def __init__(self, config, image_handler, info_panel):
+    # Ключ фоновой задачи: новая загрузка вытесняет незавершённую
+    TASK_KEY = "trassir_load"
+    
+    def __init__(self, config, image_handler, info_panel, runner=None, status_var=None, busy_callback=None):
         """
         Инициализация обработчика Trassir.
         
@@ -18,27 +22,33 @@ class TrassirHandler:
             config: Объект конфигурации
             image_handler: Обработчик изображений
             info_panel: Информационная панель
+            runner: BackgroundRunner для загрузки в фоне (None — синхронно)
+            status_var: Переменная статусной строки для сообщений о ходе загрузки
+            busy_callback: Функция busy_callback(bool) — начало/окончание загрузки
         """
         self.config = config
         self.image_handler = image_handler
         self.info_panel = info_panel
+        self.runner = runner
+        self.status_var = status_var
+        self.busy_callback = busy_callback
         
-        self.trassir = None
+        self.trassir_registry = TrassirRegistry()
         self.current_cone_type = None
     
     def load_cone_screenshot(self, cone_type):
         """
         Загрузить скриншот конуса с Trassir.
         
+        Загрузка выполняется в рабочем потоке; окно остаётся отзывчивым,
+        а результат применяется в главном потоке. Повторный вызов во время
+        загрузки отменяет предыдущую.
+        
         Args:
             cone_type: Тип конуса ("ZIF1" или "ZIF2")
         """
         app_logger.info(f"Loading {cone_type} screenshot from Trassir")
         
-        # Устанавливаем тип конуса
-        self.current_cone_type = cone_type
-        self.info_panel.set_current_cone_type(cone_type)
-        
         # Получаем конфигурацию камеры
         cam_config = self._get_camera_config(cone_type)
         
@@ -52,7 +62,6 @@ class TrassirHandler:
         # Извлекаем параметры
         trassir_ip = cam_config.get("trassir_ip")
         channel_name = cam_config.get("chanel_name")
-        pixel_size_m = cam_config.get("pixel_size_m")
         
         if not trassir_ip or not channel_name:
             messagebox.showerror(
@@ -62,7 +71,16 @@ class TrassirHandler:
             return
         
         # Подключаемся к Trassir и загружаем скриншот
-        self._connect_and_load(trassir_ip, channel_name, pixel_size_m, cone_type, cam_config)
+        self._connect_and_load(trassir_ip, channel_name, cone_type, cam_config)
+    
+    def cancel_loading(self):
+        """Отменить текущую загрузку скриншота"""
+        if self.runner:
+            self.runner.cancel(self.TASK_KEY)
+    
+    def is_loading(self):
+        """Выполняется ли загрузка скриншота"""
+        return bool(self.runner and self.runner.is_running(self.TASK_KEY))
     
     def _get_camera_config(self, cone_type):
         """
@@ -77,68 +95,136 @@ class TrassirHandler:
         camera_key = f"CAM_CONE_{cone_type}"
         return self.config.get(camera_key, {})
     
-    def _connect_and_load(self, trassir_ip, channel_name, pixel_size_m, cone_type, cam_config):
+    def _connect_and_load(self, trassir_ip, channel_name, cone_type, cam_config):
         """
         Подключиться к Trassir и загрузить скриншот.
         
         Args:
             trassir_ip: IP адрес Trassir
             channel_name: Имя канала
-            pixel_size_m: Размер пикселя в метрах
             cone_type: Тип конуса
             cam_config: Конфигурация камеры
         """
+        # Получаем пароль из конфигурации (по умолчанию 'master')
+        password = cam_config.get("password", "master")
+        
+        def on_success(result):
+            self._set_busy(False)
+            if result is not None:
+                screenshot, frame_hash = result
+                self._apply_screenshot(screenshot, frame_hash, cone_type, channel_name, cam_config)
+        
+        def on_error(error):
+            self._set_busy(False)
+            self._on_load_failed(error, trassir_ip, password, cone_type)
+        
+        def on_cancel():
+            self._set_busy(False)
+            self._set_status(f"Загрузка {cone_type} отменена")
+            app_logger.info(f"{cone_type} screenshot loading cancelled")
+        
+        if self.runner is None:
+            try:
+                result = self._fetch_screenshot(None, trassir_ip, password, channel_name)
+            except Exception as e:
+                on_error(e)
+            else:
+                on_success(result)
+            return
+        
+        self._set_busy(True)
+        self._set_status(f"Загрузка {cone_type} с Trassir...")
+        self.runner.submit(
+            self.TASK_KEY,
+            self._fetch_screenshot, trassir_ip, password, channel_name,
+            on_success=on_success,
+            on_error=on_error,
+            on_progress=self._set_status,
+            on_cancel=on_cancel
+        )
+    
+    def _fetch_screenshot(self, task, trassir_ip, password, channel_name):
+        """
+        Получить и подготовить скриншот (выполняется в рабочем потоке).
+        
+        Не обращается к виджетам: о ходе выполнения сообщает через task.report().
+        
+        Returns:
+            (PIL изображение, хэш кадра) или None, если задача отменена
+        """
+        report = task.report if task else app_logger.debug
+        cancelled = lambda: task is not None and task.cancelled
+        
+        # Создаём или обновляем подключение к Trassir
+        report(f"Подключение к Trassir {trassir_ip}...")
+        app_logger.info(f"Connecting to Trassir at {trassir_ip}")
         try:
-            # Получаем пароль из конфигурации (по умолчанию 'master')
-            password = cam_config.get("password", "master")
-            
-            # Создаём или обновляем подключение к Trassir
-            if self.trassir is None or self.trassir.ip != trassir_ip:
-                app_logger.info(f"Connecting to Trassir at {trassir_ip} with password: {password}")
-                try:
-                    self.trassir = Trassir(ip=trassir_ip, password=password)
-                except ValueError as e:
-                    # Ошибка автентификации
-                    raise ValueError(f"Не удалось подключиться к Trassir:\n{str(e)}")
-            
-            # Обновляем кэш каналов
-            self.trassir.update_channels_cache()
-            app_logger.debug(f"Available channels: {len(self.trassir.channels)}")
-            
-            # Получаем информацию о канале по имени
-            app_logger.info(f"Getting channel info for: {channel_name}")
-            channel_info = self.trassir.get_channel_by_name(channel_name)
-            
-            if not channel_info:
-                raise ValueError(f"Канал не найден: {channel_name}")
-            
-            channel_guid = channel_info['guid']
-            app_logger.info(f"Found channel {channel_name} with GUID: {channel_guid}")
-            
-            # Получаем скриншот по GUID канала
-            app_logger.info(f"Getting screenshot from channel: {channel_name}")
-            screenshot = self.trassir.get_channel_screenshot(channel_guid)
-            
-            if screenshot is None:
-                raise ValueError(f"Не удалось получить скриншот с канала {channel_name}")
-            
-            # Масштабируем изображение до ширины 1920px
-            screenshot = self._scale_screenshot(screenshot)
-            
-            # Загружаем изображение
-            self.image_handler.load_image_from_pil(screenshot, f"{cone_type} ({channel_name})")
-            
-            # Обновляем параметры на панели информации
-            self._update_cone_parameters(cam_config)
-            
-            app_logger.info(f"{cone_type} screenshot loaded successfully")
-            
-        except Exception as e:
-            app_logger.error(f"Failed to load {cone_type} screenshot: {str(e)}")
-            messagebox.showerror(
-                "Ошибка",
-                f"Не удалось загрузить скриншот {cone_type}:\n{str(e)}"
-            )
+            trassir = self.trassir_registry.get(trassir_ip, password)
+        except ValueError as e:
+            # Ошибка автентификации
+            raise ValueError(f"Не удалось подключиться к Trassir:\n{str(e)}")
+        app_logger.debug(f"Available channels: {len(trassir.channels)}")
+        if cancelled():
+            return None
+        
+        # Получаем информацию о канале по имени
+        app_logger.info(f"Getting channel info for: {channel_name}")
+        channel_info = trassir.get_channel_by_name(channel_name)
+        
+        if not channel_info:
+            raise ValueError(f"Канал не найден: {channel_name}")
+        
+        channel_guid = channel_info['guid']
+        app_logger.info(f"Found channel {channel_name} with GUID: {channel_guid}")
+        
+        # Получаем скриншот по GUID канала
+        report(f"Получение скриншота: {channel_name}...")
+        # Сырые байты нужны для хэша кадра — так же, как в поллере веб-версии
+        content = trassir.get_channel_screenshot(channel_guid, raw_img=True)
+        
+        if content is None:
+            raise ValueError(f"Не удалось получить скриншот с канала {channel_name}")
+        if cancelled():
+            return None
+        
+        # Масштабируем изображение до ширины 1920px
+        report("Обработка изображения...")
+        return self._scale_screenshot(img_to_pillow(content)), content_hash(content)
+    
+    def _apply_screenshot(self, screenshot, frame_hash, cone_type, channel_name, cam_config):
+        """Показать загруженный скриншот (в главном потоке)"""
+        # Устанавливаем тип конуса
+        self.current_cone_type = cone_type
+        self.info_panel.set_current_cone_type(cone_type)
+        
+        # Загружаем изображение
+        self.image_handler.load_image_from_pil(screenshot, f"{cone_type} ({channel_name})", frame_hash)
+        
+        # Обновляем параметры на панели информации
+        self._update_cone_parameters(cam_config)
+        
+        app_logger.info(f"{cone_type} screenshot loaded successfully")
+    
+    def _on_load_failed(self, error, trassir_ip, password, cone_type):
+        """Обработать ошибку загрузки (в главном потоке)"""
+        app_logger.error(f"Failed to load {cone_type} screenshot: {str(error)}")
+        # Соединение могло устареть — переподключимся при следующей загрузке
+        self.trassir_registry.invalidate(trassir_ip, password)
+        self._set_status(f"Ошибка загрузки {cone_type}")
+        messagebox.showerror(
+            "Ошибка",
+            f"Не удалось загрузить скриншот {cone_type}:\n{str(error)}"
+        )
+    
+    def _set_status(self, message):
+        """Показать сообщение в статусной строке"""
+        if self.status_var is not None:
+            self.status_var.set(message)
+    
+    def _set_busy(self, busy):
+        """Сообщить окну о начале/окончании загрузки"""
+        if self.busy_callback:
+            self.busy_callback(busy)
     
     def _scale_screenshot(self, screenshot):
         """
@@ -150,16 +236,8 @@ class TrassirHandler:
         Returns:
             Масштабированное изображение
         """
-        original_width, original_height = screenshot.size
-        
-        if original_width != 1920:
-            app_logger.info(f"Scaling screenshot from {original_width}x{original_height} to 1920px width")
-            scale_factor = 1920 / original_width
-            new_height = int(original_height * scale_factor)
-            screenshot = screenshot.resize((1920, new_height), Image.Resampling.LANCZOS)
-            app_logger.info(f"Screenshot scaled to {screenshot.size}")
-        
-        return screenshot
+        resample = resample_filter(self.config.get("SCREENSHOT_RESAMPLE", SCREENSHOT_RESAMPLE))
+        return scale_screenshot(screenshot, resample=resample)
     
     def _update_cone_parameters(self, cam_config):
         """
@@ -178,6 +256,16 @@ class TrassirHandler:
         self.info_panel.set_k_den(k_den)
         self.info_panel.set_threshold(threshold)
     
+    def set_current_cone_type(self, cone_type):
+        """
+        Назначить текущий тип конуса (например, восстановленный из метаданных файла).
+        
+        Args:
+            cone_type: Тип конуса ("ZIF1", "ZIF2" или None)
+        """
+        self.current_cone_type = cone_type
+        self.info_panel.set_current_cone_type(cone_type)
+    
     def get_current_cone_type(self):
         """
         Получить текущий тип конуса.
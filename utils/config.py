@@ -27,8 +27,12 @@ class Config:
     Читает/сохраняет настройки в config.json.
     """
     
-    def __init__(self):
-        self.config_path = os.path.join(get_app_directory(), "config.json")
+    def __init__(self, config_path=None):
+        """
+        Args:
+            config_path: Путь к config.json (по умолчанию — в директории приложения)
+        """
+        self.config_path = config_path or os.path.join(get_app_directory(), "config.json")
         self.data: Dict[str, Any] = {}
         self._load_or_create_config()
         app_logger.info(f"Configuration loaded from {self.config_path}")
@@ -41,6 +45,11 @@ class Config:
             COLOR_TRIANGLE, COLOR_VERTEX, COLOR_HOVER, COLOR_TEXT, COLOR_BG,
             VERTEX_RADIUS, LINE_WIDTH, TEXT_FONT,
             DEFAULT_PIXEL_SIZE_M, CANVAS_WIDTH, CANVAS_HEIGHT,
+            RENDER_FAST_RESAMPLE, RENDER_QUALITY_RESAMPLE, RENDER_QUALITY_DELAY_MS,
+            SCREENSHOT_RESAMPLE, SAVE_DEFAULT_FORMAT, SAVE_JPEG_QUALITY, SAVE_JPEG_SUBSAMPLING,
+            SAVE_PNG_COMPRESS_LEVEL, SAVE_WEBP_LOSSLESS, SAVE_WEBP_QUALITY, SAVE_WEBP_METHOD,
+            MEASUREMENT_STORE, STORE_BATCH_SIZE, EXPORT_CHUNK_ROWS, SHIFT_START_HOURS, HISTORY_MAX_BUCKETS,
+            HISTORY_POINTS, HISTORY_MAX_POINTS, TIMELAPSE_FPS, TIMELAPSE_WIDTH,
             CAM_CONE_ZIF1, CAM_CONE_ZIF2
         )
         
@@ -66,6 +75,26 @@ class Config:
             "DEFAULT_PIXEL_SIZE_M": DEFAULT_PIXEL_SIZE_M,
             "CANVAS_WIDTH": CANVAS_WIDTH,
             "CANVAS_HEIGHT": CANVAS_HEIGHT,
+            "RENDER_FAST_RESAMPLE": RENDER_FAST_RESAMPLE,
+            "RENDER_QUALITY_RESAMPLE": RENDER_QUALITY_RESAMPLE,
+            "RENDER_QUALITY_DELAY_MS": RENDER_QUALITY_DELAY_MS,
+            "SCREENSHOT_RESAMPLE": SCREENSHOT_RESAMPLE,
+            "SAVE_DEFAULT_FORMAT": SAVE_DEFAULT_FORMAT,
+            "SAVE_JPEG_QUALITY": SAVE_JPEG_QUALITY,
+            "SAVE_JPEG_SUBSAMPLING": SAVE_JPEG_SUBSAMPLING,
+            "SAVE_PNG_COMPRESS_LEVEL": SAVE_PNG_COMPRESS_LEVEL,
+            "SAVE_WEBP_LOSSLESS": SAVE_WEBP_LOSSLESS,
+            "SAVE_WEBP_QUALITY": SAVE_WEBP_QUALITY,
+            "SAVE_WEBP_METHOD": SAVE_WEBP_METHOD,
+            "MEASUREMENT_STORE": MEASUREMENT_STORE,
+            "STORE_BATCH_SIZE": STORE_BATCH_SIZE,
+            "EXPORT_CHUNK_ROWS": EXPORT_CHUNK_ROWS,
+            "SHIFT_START_HOURS": SHIFT_START_HOURS,
+            "HISTORY_MAX_BUCKETS": HISTORY_MAX_BUCKETS,
+            "HISTORY_POINTS": HISTORY_POINTS,
+            "HISTORY_MAX_POINTS": HISTORY_MAX_POINTS,
+            "TIMELAPSE_FPS": TIMELAPSE_FPS,
+            "TIMELAPSE_WIDTH": TIMELAPSE_WIDTH,
             "CAM_CONE_ZIF1": CAM_CONE_ZIF1,
             "CAM_CONE_ZIF2": CAM_CONE_ZIF2
         }
@@ -33,9 +33,45 @@ DEFAULT_PIXEL_SIZE_M = 0.008  # размер пикселя в метрах (1 
 # WIN_HEIGHT = 768
 CANVAS_WIDTH = 1280
 CANVAS_HEIGHT = 768
+CANVAS_RENDER_CACHE_SIZE = 4  # число масштабов изображения в кэше отрисовки холста
+CANVAS_VIEWPORT_MARGIN = 256  # запас вокруг видимой области холста при отрисовке, px
+
+# Ресемплинг изображения (nearest, box, bilinear, hamming, bicubic, lanczos)
+RENDER_FAST_RESAMPLE = "bilinear"  # быстрый проход во время масштабирования/прокрутки
+RENDER_QUALITY_RESAMPLE = "lanczos"  # качественный проход после окончания взаимодействия
+RENDER_QUALITY_DELAY_MS = 150  # пауза перед качественным проходом, мс
+SCREENSHOT_RESAMPLE = "lanczos"  # приведение скриншотов Trassir к ширине 1920px
+UI_FRAME_MS = 16  # бюджет кадра: не более одной перерисовки за этот интервал, мс
+
+# Кодирование сохраняемых изображений
+SAVE_DEFAULT_FORMAT = "png"  # формат по умолчанию в диалоге сохранения: png, jpeg, webp
+SAVE_JPEG_QUALITY = 90  # 1..95
+SAVE_JPEG_SUBSAMPLING = "4:2:0"  # субдискретизация цвета: 4:4:4, 4:2:2, 4:2:0
+SAVE_PNG_COMPRESS_LEVEL = 6  # 0..9: 1 — быстро, 9 — компактно
+SAVE_WEBP_LOSSLESS = False  # WebP без потерь
+SAVE_WEBP_QUALITY = 90  # 1..100 (для lossless — усилие сжатия)
+SAVE_WEBP_METHOD = 4  # 0..6: 0 — быстро, 6 — компактно
+
+# История измерений
+MEASUREMENT_STORE = "measurements.db"  # база SQLite истории измерений (относительно директории config.json)
+STORE_BATCH_SIZE = 500  # максимум измерений в одной транзакции записи
+EXPORT_CHUNK_ROWS = 1000  # строк в порции экспорта (и в группе строк Parquet)
+SHIFT_START_HOURS = [8, 20]  # часы начала смен для агрегатов по сменам (местное время)
+HISTORY_MAX_BUCKETS = 500  # предел агрегатов на камеру при автоматическом выборе разрешения
+HISTORY_POINTS = 1000  # точек прореженного ряда массы по умолчанию (GET /history/<camera>)
+HISTORY_MAX_POINTS = 10000  # предел точек прореженного ряда по запросу
+
+# Таймлапс аннотированных кадров
+TIMELAPSE_FPS = 12  # кадров в секунду ролика
+TIMELAPSE_WIDTH = 1280  # ширина кадра видео, px (высота — по пропорциям кадра)
 
 # Настройки Trassir камер
 CAM_CONE_ZIF1 = {"chanel_name": "ЗИФ-1 19. Конус Руда", "trassir_ip": "10.100.59.10", "password":"master", "pixel_size_m": 0.091, 
                 "roi":[1125,1545,345,615], "cone_center":[45,65], "threshold":50, "k_vol":0.8, "k_den":1.76}
 CAM_CONE_ZIF2 = {"chanel_name": "ККД-2 115. Конус", "trassir_ip": "10.100.72.14", "password":"master", "pixel_size_m": 0.16, 
                 "roi":[716,1180,170,360], "cone_center":[40,60], "threshold":85, "k_vol":0.55, "k_den":1.76}
+
+# Поток измерений (SSE)
+STREAM_POLL_INTERVAL_S = 60  # период опроса камеры фоновым поллером, с
+STREAM_QUEUE_SIZE = 16  # длина очереди событий на одного клиента
+STREAM_KEEPALIVE_S = 15  # интервал keep-alive комментариев в SSE-потоке, с
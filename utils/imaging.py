@@ -0,0 +1,125 @@
+"""
+Вспомогательные функции обработки изображений
+"""
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Mapping, Optional
+
+from PIL import Image
+
+from utils import constants
+from utils.logger import app_logger
+
+# Фильтры ресемплинга по имени (для config.json)
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+
+def resample_filter(name: str, default: str = 'lanczos') -> Image.Resampling:
+    """
+    Получить фильтр ресемплинга PIL по имени.
+
+    Args:
+        name: Имя фильтра (nearest, box, bilinear, hamming, bicubic, lanczos)
+        default: Фильтр на случай неизвестного имени
+
+    Returns:
+        Константа Image.Resampling
+    """
+    resample = RESAMPLE_FILTERS.get(str(name).lower())
+    if resample is None:
+        app_logger.warning(f"Unknown resample filter '{name}', using '{default}'")
+        resample = RESAMPLE_FILTERS[default]
+    return resample
+
+
+# Форматы сохранения по расширению файла
+IMAGE_FORMATS = {
+    '.png': 'PNG',
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.webp': 'WEBP',
+    '.bmp': 'BMP',
+    '.gif': 'GIF',
+}
+
+
+def content_hash(content: bytes) -> str:
+    """Идентификатор кадра — префикс SHA-1 содержимого (как в веб-приложении)"""
+    return hashlib.sha1(content).hexdigest()[:16]
+
+
+def image_format(path: str, default: str = 'PNG') -> str:
+    """Формат PIL по расширению файла"""
+    return IMAGE_FORMATS.get(os.path.splitext(path)[1].lower(), default)
+
+
+def encoder_options(fmt: str, settings: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Параметры кодировщика PIL для формата.
+
+    Args:
+        fmt: Формат PIL (PNG, JPEG, WEBP, ...)
+        settings: Конфигурация с ключами SAVE_* (Config или dict);
+            отсутствующие ключи берутся из constants.py
+
+    Returns:
+        Аргументы для Image.save
+    """
+    settings = settings or {}
+
+    def setting(key):
+        return settings.get(key, getattr(constants, key))
+
+    fmt = fmt.upper()
+    if fmt == 'JPEG':
+        return {
+            'quality': int(setting('SAVE_JPEG_QUALITY')),
+            'subsampling': str(setting('SAVE_JPEG_SUBSAMPLING')),
+            'optimize': False,
+        }
+    if fmt == 'PNG':
+        return {'compress_level': int(setting('SAVE_PNG_COMPRESS_LEVEL'))}
+    if fmt == 'WEBP':
+        return {
+            'lossless': bool(setting('SAVE_WEBP_LOSSLESS')),
+            'quality': int(setting('SAVE_WEBP_QUALITY')),
+            'method': int(setting('SAVE_WEBP_METHOD')),
+        }
+    return {}
+
+
+def save_atomic(image: Image.Image, path: str, fmt: Optional[str] = None, **options: Any) -> None:
+    """
+    Сохранить изображение атомарно: во временный файл рядом и переименованием.
+
+    Прерванная запись не оставляет повреждённого файла по пути path.
+
+    Args:
+        image: Изображение
+        path: Путь к файлу
+        fmt: Формат PIL (по умолчанию по расширению)
+        **options: Параметры кодировщика (см. encoder_options)
+    """
+    fmt = fmt or image_format(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            image.save(file, format=fmt, **options)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,334 @@
+"""
+Лёгкий реестр метрик в формате Prometheus (без внешних зависимостей)
+
+Счётчики, измерители и гистограммы с фиксированными границами корзин.
+Счётчики и гистограммы пишут в шард текущего потока без блокировок;
+наблюдение в гистограмму — это bisect по границам и два сложения
+(доли микросекунды). Блокировка берётся только при сборе метрик.
+
+Серии с метками следует получать один раз при импорте модуля:
+
+    _DETECT_SECONDS = STAGE_SECONDS.labels(stage='detect')
+    ...
+    with _DETECT_SECONDS.time():
+        ...
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Границы по умолчанию для задержек, с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    """Форматирование числа для текстового формата Prometheus"""
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Форматирование набора меток {name="value",...}"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Timer:
+    """Контекстный менеджер для замера длительности блока"""
+
+    __slots__ = ('_series', '_start')
+
+    def __init__(self, series) -> None:
+        self._series = series
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._series.observe(time.perf_counter() - self._start)
+
+
+class _ShardedSeries:
+    """
+    Серия с отдельными счётчиками для каждого потока.
+
+    Поток пишет только в свой шард, поэтому запись не требует блокировки.
+    При сборе шарды завершившихся потоков сворачиваются в общий итог,
+    чтобы серверы, создающие поток на запрос, не накапливали шарды.
+    """
+
+    __slots__ = ('_width', '_local', '_shards', '_retired', '_lock')
+
+    def __init__(self, width: int) -> None:
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, list]] = []
+        self._retired = [0] * width
+        self._lock = threading.Lock()
+
+    def _new_shard(self) -> list:
+        shard = [0] * self._width
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def _shard(self) -> list:
+        try:
+            return self._local.shard
+        except AttributeError:
+            return self._new_shard()
+
+    def _totals(self) -> list:
+        """Суммы по всем шардам"""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    for i, value in enumerate(shard):
+                        self._retired[i] += value
+            self._shards = alive
+            totals = list(self._retired)
+        for _, shard in alive:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class _CounterSeries(_ShardedSeries):
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._totals()[0]
+
+
+class _GaugeSeries:
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self) -> None:
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _HistogramSeries(_ShardedSeries):
+    # Раскладка шарда: счётчики корзин (последняя — +Inf), затем сумма
+    __slots__ = ('_bounds',)
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        super().__init__(len(bounds) + 2)
+        self._bounds = bounds
+
+    def observe(self, value: float) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Снимок (счётчики по корзинам, сумма)"""
+        totals = self._totals()
+        return totals[:-1], totals[-1]
+
+
+class _Metric:
+    """Базовый класс метрики с поддержкой меток"""
+
+    type_name = ''
+    series_class = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_series()
+            self._series[()] = self._default
+
+    def _new_series(self):
+        return self.series_class()
+
+    def labels(self, **labels: str):
+        """Получить серию для набора меток (создаётся при первом обращении)"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def collect(self) -> List[str]:
+        """Строки текстового формата Prometheus"""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+        ]
+        for key, series in sorted(self._series.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно возрастающий счётчик"""
+
+    type_name = 'counter'
+    series_class = _CounterSeries
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Измеритель текущего значения"""
+
+    type_name = 'gauge'
+    series_class = _GaugeSeries
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def collect(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        bounds = self.buckets + (float('inf'),)
+        for key, series in sorted(self._series.items()):
+            counts, total = series.snapshot()
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """
+        Сохранить снимок метрик.
+
+        Args:
+            path: Путь к файлу (если None — только вернуть текст)
+
+        Returns:
+            Текст метрик
+        """
+        text = self.render()
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+
+# Реестр процесса по умолчанию
+REGISTRY = MetricsRegistry()
+
+# Общая гистограмма длительности этапов обработки
+STAGE_SECONDS = REGISTRY.histogram(
+    'cone_stage_seconds',
+    'Duration of processing stages (trassir, decode, detect, calculate, serialize)',
+    labelnames=('stage',)
+)
@@ -3,6 +3,7 @@ import re
 import io
 import time
 import ssl
+import threading
 import urllib3
 from typing import Optional, List, Dict, Any, Union
 from requests import session
@@ -12,10 +13,19 @@ from urllib3.util.retry import Retry
 from PIL import Image, ImageDraw, ImageFont
 
 from utils.logger import app_logger
+from utils.metrics import REGISTRY, STAGE_SECONDS
 
 # Отключение предупреждений SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Метрики обращений к Trassir
+_CHANNELS_SECONDS = STAGE_SECONDS.labels(stage='trassir_channels')
+_SCREENSHOT_SECONDS = STAGE_SECONDS.labels(stage='trassir_screenshot')
+_DECODE_SECONDS = STAGE_SECONDS.labels(stage='decode')
+_TRASSIR_ERRORS = REGISTRY.counter(
+    'cone_trassir_errors_total', 'Failed Trassir requests', labelnames=('op',)
+)
+
 
 class CustomHTTPAdapter(HTTPAdapter):
     """Кастомный HTTP адаптер с ослабленными настройками SSL"""
@@ -83,13 +93,40 @@ def img_to_pillow(image_data: bytes) -> Image.Image:
         ValueError: Если данные изображения некорректны
     """
     try:
-        image = Image.open(io.BytesIO(image_data))
-        # Создаем копию, чтобы избежать проблем с закрытием файла
-        return image.copy()
+        with _DECODE_SECONDS.time():
+            image = Image.open(io.BytesIO(image_data))
+            # Создаем копию, чтобы избежать проблем с закрытием файла
+            return image.copy()
     except Exception as e:
         raise ValueError(f"Failed to convert image data to PIL Image: {e}")
 
 
+def scale_screenshot(image: Image.Image, width: int = 1920,
+                     resample: Image.Resampling = Image.Resampling.LANCZOS) -> Image.Image:
+    """
+    Масштабирует скриншот до заданной ширины с сохранением пропорций.
+
+    Калибровочные параметры камер (ROI, размер пикселя) заданы
+    для кадров шириной 1920px.
+
+    Args:
+        image: Исходное изображение
+        width: Целевая ширина в пикселях
+        resample: Фильтр ресемплинга
+
+    Returns:
+        Масштабированное изображение (или исходное, если ширина совпадает)
+    """
+    original_width, original_height = image.size
+
+    if original_width == width:
+        return image
+
+    app_logger.info('Scaling screenshot from %sx%s to %spx width', original_width, original_height, width)
+    new_height = int(original_height * width / original_width)
+    return image.resize((width, new_height), resample)
+
+
 class Trassir:
     """Класс для работы с сервером Trassir"""
 
@@ -191,11 +228,12 @@ class Trassir:
         try:
             with _create_http_session() as http_session:
                 payload = {'password': self.password}
-                response = http_session.get(
-                    f'{self.url}/objects/',
-                    params=payload,
-                    timeout=5
-                )
+                with _CHANNELS_SECONDS.time():
+                    response = http_session.get(
+                        f'{self.url}/objects/',
+                        params=payload,
+                        timeout=5
+                    )
                 
                 # Проверяем статус ответа
                 if response.status_code == 401:
@@ -208,6 +246,7 @@ class Trassir:
                 
                 objects_text = response.text
         except RequestException as e:
+            _TRASSIR_ERRORS.labels(op='channels').inc()
             app_logger.error('Failed to fetch objects from Trassir: %s', e)
             raise ValueError(f'Не удалось подключиться к Trassir: {str(e)}')
 
@@ -251,7 +290,8 @@ class Trassir:
             with _create_http_session() as http_session:
                 payload = {'password': self.password}
                 url = f'{self.url}/screenshot/{guid}'
-                response = http_session.get(url, params=payload, timeout=5)
+                with _SCREENSHOT_SECONDS.time():
+                    response = http_session.get(url, params=payload, timeout=5)
 
                 # Проверяем статус ответа
                 if response.status_code == 401:
@@ -274,6 +314,7 @@ class Trassir:
                     )
 
         except (RequestException, ValueError, Exception) as e:
+            _TRASSIR_ERRORS.labels(op='screenshot').inc()
             app_logger.error(
                 'Failed to get screenshot for channel %s: %s', guid, e)
             return None
@@ -321,6 +362,73 @@ class Trassir:
         return sorted(channels, key=lambda channel: channel['name'])
 
 
+class TrassirRegistry:
+    """
+    Реестр подключений к серверам Trassir.
+
+    Переиспользует клиента (и его кэш каналов) для пары IP/пароль,
+    чтобы не запрашивать список каналов при каждом обращении.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[tuple, Trassir] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ip: str, password: str = 'master') -> Trassir:
+        """
+        Возвращает клиента Trassir, создавая его при первом обращении.
+
+        Args:
+            ip: IP адрес сервера
+            password: Пароль для аутентификации
+
+        Returns:
+            Клиент Trassir с актуальным кэшем каналов
+
+        Raises:
+            ValueError: При ошибке подключения или аутентификации
+        """
+        key = (ip, password)
+        with self._lock:
+            client = self._clients.get(key)
+
+        if client is None:
+            client = Trassir(ip=ip, password=password)
+            with self._lock:
+                client = self._clients.setdefault(key, client)
+        else:
+            client.update_channels_cache()
+
+        return client
+
+    def invalidate(self, ip: str, password: str = 'master') -> None:
+        """Удаляет клиента из реестра (например, после ошибки соединения)."""
+        with self._lock:
+            self._clients.pop((ip, password), None)
+
+    def warmup(self, cam_configs: List[Dict[str, Any]]) -> None:
+        """
+        Заранее загружает списки каналов для камер.
+
+        Args:
+            cam_configs: Конфигурации камер (trassir_ip, password)
+        """
+        for cam_config in cam_configs:
+            ip = cam_config.get('trassir_ip')
+            if not ip:
+                continue
+            try:
+                client = self.get(ip, cam_config.get('password', 'master'))
+                app_logger.info('Trassir %s warmed up: %s channels', ip, len(client.channels))
+            except ValueError as e:
+                app_logger.warning('Trassir warmup failed for %s: %s', ip, e)
+
+    def close(self) -> None:
+        """Очищает реестр."""
+        with self._lock:
+            self._clients.clear()
+
+
 def main() -> None:
     """Пример использования класса Trassir."""
     try:
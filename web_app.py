@@ -1,40 +1,318 @@
 """
 Flask Web Application для расчёта объёма конуса
+
+Приложение создаётся фабрикой create_app(), поэтому модуль можно
+запускать под многопроцессным WSGI-сервером (см. wsgi.py и WEB_README.md).
 """
+import argparse
+import atexit
+import hashlib
 import os
 import io
-import base64
-from flask import Flask, render_template, request, jsonify, session
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, Flask, Response, abort, current_app, g, render_template, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
 from PIL import Image
 import numpy as np
 
 # Импорты из существующих модулей
 from core.vision import auto_detect_triangle
 from core.cone_calculator import ConeCalculator
+from core.downsample import lttb_indices
 from core.geometry import calculate_side_length
+from core.exporter import EXPORT_FORMATS, export_chunks
+from core.render import annotation_key, render_annotated
+from core.store import open_store, parse_time
+from core.stream import MeasurementHub, MeasurementPoller
+from core.tiles import (
+    PREVIEW_FORMATS, PREVIEW_MAX_SIDE, PREVIEW_MIN_SIDE, PREVIEW_QUALITY,
+    TILE_SIZE, WEBP_SUPPORTED, TilePyramid
+)
+from utils.cache import LRUCache
 from utils.config import Config
+from utils.constants import (
+    EXPORT_CHUNK_ROWS, HISTORY_MAX_BUCKETS, HISTORY_MAX_POINTS, HISTORY_POINTS, STREAM_KEEPALIVE_S
+)
 from utils.logger import app_logger
-from utils.trassir import Trassir
-
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Секретный ключ для сессий
-
-# Инициализация конфигурации
-config = Config()
+from utils.metrics import REGISTRY, STAGE_SECONDS
+from utils.trassir import TrassirRegistry, img_to_pillow
 
 # Папка для временных загрузок
 UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Сколько последних загруженных кадров хранить на диске
+UPLOAD_KEEP_IMAGES = 32
+# Идентификатор изображения — префикс SHA-1 содержимого
+_IMAGE_ID_RE = re.compile(r'^[0-9a-f]{16}$')
+# Форматы аннотированного изображения: имя в запросе → (формат PIL, MIME-тип)
+ANNOTATED_FORMATS = {'png': ('PNG', 'image/png'), **PREVIEW_FORMATS}
+
+bp = Blueprint('cone', __name__)
+
+# Метрики HTTP-запросов
+_REQUEST_SECONDS = REGISTRY.histogram(
+    'cone_http_request_seconds', 'HTTP request duration by endpoint', labelnames=('endpoint',)
+)
+_REQUESTS = REGISTRY.counter(
+    'cone_http_requests_total', 'HTTP requests by endpoint and status', labelnames=('endpoint', 'status')
+)
+_SERIALIZE_SECONDS = STAGE_SECONDS.labels(stage='serialize')
+_IMAGE_CACHE_ENTRIES = REGISTRY.gauge('cone_image_cache_entries', 'Decoded images in the worker cache')
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask с замером времени сериализации ответов"""
+    
+    def response(self, *args, **kwargs):
+        with _SERIALIZE_SECONDS.time():
+            return super().response(*args, **kwargs)
+
+
+class WebResources:
+    """
+    Ресурсы одного рабочего процесса веб-приложения.
+
+    Объединяет конфигурацию, реестр подключений Trassir, кэш декодированных
+    изображений, хаб живых измерений и историю измерений; создаются в create_app() и
+    освобождаются методом close() при остановке процесса.
+    """
+    
+    def __init__(self, config, image_cache_size=8, tile_cache_size=4, annotation_cache_size=16,
+                 history_cache_size=32):
+        """
+        Args:
+            config: Объект конфигурации
+            image_cache_size: Количество декодированных изображений в кэше
+            tile_cache_size: Количество пирамид тайлов в кэше
+            annotation_cache_size: Количество закодированных аннотированных изображений в кэше
+            history_cache_size: Количество прореженных рядов массы в кэше
+        """
+        self.config = config
+        self.trassir_registry = TrassirRegistry()
+        self.image_cache = LRUCache(image_cache_size)
+        self.tile_cache = LRUCache(tile_cache_size)
+        self.annotation_cache = LRUCache(annotation_cache_size)
+        self.history_cache = LRUCache(history_cache_size)
+        self._tile_lock = threading.Lock()
+        self.store = open_store(config)
+        self.measurement_hub = MeasurementHub(poller_factory=self._create_poller, store=self.store)
+        self._closed = False
+    
+    def _create_poller(self, camera, hub):
+        """Создать фоновый поллер камеры для хаба измерений"""
+        return MeasurementPoller(
+            camera, hub,
+            lambda: self.config.get(f"CAM_CONE_{camera}", {}),
+            self.trassir_registry
+        )
+    
+    def camera_configs(self):
+        """Конфигурации всех камер"""
+        return [self.config.get(key, {}) for key in ("CAM_CONE_ZIF1", "CAM_CONE_ZIF2")]
+    
+    def load_image(self, image_path):
+        """
+        Загрузить изображение с диска через кэш декодированных кадров.
+        
+        Ключ кэша включает время изменения файла, поэтому перезаписанный
+        файл декодируется заново.
+        """
+        key = (image_path, os.stat(image_path).st_mtime_ns)
+        image = self.image_cache.get(key)
+        if image is None:
+            image = Image.open(image_path)
+            image.load()
+            self.image_cache.put(key, image)
+            _IMAGE_CACHE_ENTRIES.set(len(self.image_cache))
+        return image
+    
+    def get_pyramid(self, image_id, image_path):
+        """
+        Получить пирамиду тайлов изображения (строится один раз на id).
+        
+        Блокировка не даёт параллельным запросам тайлов одного кадра
+        строить пирамиду несколько раз.
+        """
+        pyramid = self.tile_cache.get(image_id)
+        if pyramid is None:
+            with self._tile_lock:
+                pyramid = self.tile_cache.get(image_id)
+                if pyramid is None:
+                    pyramid = TilePyramid(self.load_image(image_path))
+                    self.tile_cache.put(image_id, pyramid)
+        return pyramid
+    
+    def warmup(self, trassir=True):
+        """
+        Прогреть процесс до приёма запросов.
+        
+        Прогоняет детектор на пустом кадре (инициализация OpenCV/NumPy)
+        и при необходимости загружает списки каналов Trassir.
+        """
+        app_logger.info("Warming up web worker")
+        blank = Image.fromarray(np.zeros((720, 1920, 3), dtype=np.uint8))
+        auto_detect_triangle(blank, "ZIF1", cam_config=self.config.get("CAM_CONE_ZIF1"))
+        
+        if trassir:
+            self.trassir_registry.warmup(self.camera_configs())
+    
+    def close(self):
+        """Освободить ресурсы процесса"""
+        if self._closed:
+            return
+        self._closed = True
+        self.measurement_hub.close()
+        self.store.close()
+        self.trassir_registry.close()
+        self.image_cache.clear()
+        self.tile_cache.clear()
+        self.annotation_cache.clear()
+        self.history_cache.clear()
+        app_logger.info("Web worker resources released")
+
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+def _resources():
+    """Ресурсы текущего приложения"""
+    return current_app.extensions['cone']
 
 
-@app.route('/')
+def _image_path(image_id):
+    """Путь к сохранённому кадру по его идентификатору"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], f'{image_id}.png')
+
+
+def _prune_uploads(folder, keep):
+    """Удалить старые кадры, оставив keep последних"""
+    images = [
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.endswith('.png') and _IMAGE_ID_RE.match(name[:-4])
+    ]
+    if len(images) <= keep:
+        return
+    images.sort(key=os.path.getmtime, reverse=True)
+    for path in images[keep:]:
+        try:
+            os.remove(path)
+        except OSError as e:
+            app_logger.warning(f"Failed to remove old upload {path}: {e}")
+
+
+def _store_image(image, content):
+    """
+    Сохранить кадр на диск под идентификатором по содержимому.
+    
+    Args:
+        image: PIL изображение
+        content: Байты исходного файла (для вычисления идентификатора)
+    
+    Returns:
+        Идентификатор изображения
+    """
+    image_id = hashlib.sha1(content).hexdigest()[:16]
+    image_path = _image_path(image_id)
+    
+    if os.path.exists(image_path):
+        # Тот же кадр уже сохранён — обновляем время для очистки
+        os.utime(image_path)
+    else:
+        image.save(image_path, 'PNG')
+        _prune_uploads(current_app.config['UPLOAD_FOLDER'], UPLOAD_KEEP_IMAGES)
+    
+    # Сохраняем только путь и идентификатор в сессии
+    session['current_image_path'] = image_path
+    session['current_image_id'] = image_id
+    session['image_size'] = [image.width, image.height]
+    return image_id
+
+
+def _secret_key(config):
+    """
+    Получить секретный ключ сессий.
+    
+    Ключ должен совпадать во всех рабочих процессах, поэтому берётся из
+    переменной окружения CONE_SECRET_KEY или из config.json (генерируется
+    и сохраняется при первом запуске).
+    """
+    secret_key = os.environ.get('CONE_SECRET_KEY') or config.get('SECRET_KEY')
+    if not secret_key:
+        secret_key = secrets.token_hex(32)
+        config.set('SECRET_KEY', secret_key)
+    return secret_key
+
+
+def create_app(config_path=None, warmup=False, warmup_trassir=True):
+    """
+    Фабрика веб-приложения.
+    
+    Args:
+        config_path: Путь к config.json (по умолчанию — в директории приложения)
+        warmup: Прогреть процесс (OpenCV, списки каналов Trassir) до приёма запросов
+        warmup_trassir: Загружать ли при прогреве списки каналов Trassir
+    
+    Returns:
+        Экземпляр Flask
+    """
+    app = Flask(__name__)
+    app.json = TimedJSONProvider(app)
+    
+    config = Config(config_path)
+    app.secret_key = _secret_key(config)
+    
+    if not os.path.exists(UPLOAD_FOLDER):
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    
+    resources = WebResources(config)
+    app.extensions['cone'] = resources
+    atexit.register(resources.close)
+    
+    app.register_blueprint(bp)
+    
+    if warmup:
+        resources.warmup(trassir=warmup_trassir)
+    
+    app_logger.info("Web application created")
+    return app
+
+
+@bp.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@bp.after_request
+def _remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@bp.teardown_request
+def _observe_request(error=None):
+    # teardown выполняется и когда обработчик упал: after_request тогда не
+    # вызывается, а ответ — 500
+    if 'request_start' not in g:
+        return
+    endpoint = request.endpoint or 'unknown'
+    _REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - g.request_start)
+    _REQUESTS.labels(endpoint=endpoint, status=g.get('response_status', 500)).inc()
+
+
+@bp.route('/metrics')
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@bp.route('/')
 def index():
     """Главная страница"""
     # Загружаем настройки из конфига
+    config = _resources().config
     cam_zif1 = config.get("CAM_CONE_ZIF1", {})
     cam_zif2 = config.get("CAM_CONE_ZIF2", {})
     
@@ -43,7 +321,7 @@ def index():
                          cam_zif2=cam_zif2)
 
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_image():
     """Загрузка изображения"""
     try:
@@ -58,22 +336,18 @@ def upload_image():
         img_bytes = file.read()
         image = Image.open(io.BytesIO(img_bytes))
         
-        # Сохраняем на диск
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'current_image.png')
-        image.save(image_path, 'PNG')
-        
-        # Сохраняем только имя файла в сессии
-        session['current_image_path'] = image_path
-        session['image_size'] = [image.width, image.height]
-        
-        # Конвертируем в base64 только для отправки
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+        # Сохраняем на диск; клиент получает только идентификатор и
+        # загружает видимые тайлы через /tiles
+        image_id = _store_image(image, img_bytes)
+        # Загруженный файл не относится к камере последнего снимка Trassir
+        session.pop('current_cone_type', None)
         
-        app_logger.info(f"Image uploaded: {image.width}x{image.height}")
+        app_logger.info(f"Image uploaded: {image.width}x{image.height} (id {image_id})")
         
         return jsonify({
             'success': True,
-            'image_data': f'data:image/png;base64,{img_base64}',
+            'image_id': image_id,
+            'tile_size': TILE_SIZE,
             'width': image.width,
             'height': image.height
         })
@@ -83,13 +357,13 @@ def upload_image():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/load_trassir/<cone_type>', methods=['POST'])
+@bp.route('/load_trassir/<cone_type>', methods=['POST'])
 def load_trassir(cone_type):
     """Загрузка изображения с Trassir"""
     try:
         # Получаем настройки камеры
         cam_key = f"CAM_CONE_{cone_type.upper()}"
-        cam_config = config.get(cam_key)
+        cam_config = _resources().config.get(cam_key)
         
         if not cam_config:
             return jsonify({'error': f'Camera {cone_type} not configured'}), 400
@@ -101,40 +375,34 @@ def load_trassir(cone_type):
         
         app_logger.info(f"Connecting to Trassir at {trassir_ip} for {cone_type}")
         
-        trassir = Trassir(ip=trassir_ip, password=password)
+        trassir = _resources().trassir_registry.get(trassir_ip, password)
         channel = trassir.get_channel_by_name(channel_name)
         
         if not channel:
             app_logger.error(f"Channel {channel_name} not found")
             return jsonify({'error': f'Channel {channel_name} not found'}), 404
         
-        # Получаем скриншот
-        screenshot = trassir.get_channel_screenshot(channel['guid'])
+        # Получаем скриншот; идентификатор кадра — хэш исходных байтов, как у поллера
+        content = trassir.get_channel_screenshot(channel['guid'], raw_img=True)
         
-        if not screenshot:
+        if not content:
             app_logger.error('Failed to get screenshot')
+            _resources().trassir_registry.invalidate(trassir_ip, password)
             return jsonify({'error': 'Failed to get screenshot'}), 500
         
-        # Сохраняем на диск
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'current_image.png')
-        screenshot.save(image_path, 'PNG')
-        
-        # Сохраняем только путь в сессии
-        session['current_image_path'] = image_path
-        session['image_size'] = [screenshot.width, screenshot.height]
+        # Сохраняем на диск под идентификатором по содержимому кадра
+        screenshot = img_to_pillow(content)
+        image_id = _store_image(screenshot, content)
         session['current_cone_type'] = cone_type.upper()
         
-        # Конвертируем в base64 только для отправки
-        img_buffer = io.BytesIO()
-        screenshot.save(img_buffer, format='PNG')
-        img_bytes = img_buffer.getvalue()
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        
-        app_logger.info(f"Loaded screenshot from Trassir {cone_type}: {screenshot.width}x{screenshot.height}")
+        app_logger.info(
+            f"Loaded screenshot from Trassir {cone_type}: {screenshot.width}x{screenshot.height} (id {image_id})"
+        )
         
         return jsonify({
             'success': True,
-            'image_data': f'data:image/png;base64,{img_base64}',
+            'image_id': image_id,
+            'tile_size': TILE_SIZE,
             'width': screenshot.width,
             'height': screenshot.height,
             'cone_type': cone_type.upper()
@@ -149,7 +417,189 @@ def load_trassir(cone_type):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/auto_detect', methods=['POST'])
+def _pyramid_or_404(image_id):
+    """Пирамида тайлов по идентификатору или ответ 404"""
+    if not _IMAGE_ID_RE.match(image_id):
+        abort(404)
+    image_path = _image_path(image_id)
+    if not os.path.exists(image_path):
+        abort(404)
+    return _resources().get_pyramid(image_id, image_path)
+
+
+@bp.route('/tiles/<image_id>/info')
+def tiles_info(image_id):
+    """Описание пирамиды тайлов изображения"""
+    return jsonify(_pyramid_or_404(image_id).info())
+
+
+@bp.route('/tiles/<image_id>/<int:z>/<int:x>/<int:y>')
+def tile(image_id, z, x, y):
+    """Тайл изображения уровня z (JPEG)"""
+    pyramid = _pyramid_or_404(image_id)
+    try:
+        data = pyramid.tile(z, x, y)
+    except KeyError:
+        abort(404)
+    
+    # Идентификатор зависит от содержимого, поэтому тайл неизменяем
+    return Response(
+        data,
+        mimetype='image/jpeg',
+        headers={'Cache-Control': 'public, max-age=31536000, immutable'}
+    )
+
+
+@bp.route('/preview/<image_id>')
+def preview(image_id):
+    """
+    Превью изображения под размер области отображения клиента.
+    
+    Параметры запроса: w, h — размер области (px), format — webp|jpeg
+    (по умолчанию webp, если браузер и Pillow его поддерживают),
+    q — качество 1..95. Фактический размер превью возвращается в
+    заголовке X-Preview-Size; клиент передаёт его в /calculate и
+    /auto_detect вместе с coords="preview".
+    """
+    pyramid = _pyramid_or_404(image_id)
+    
+    try:
+        max_width = int(request.args.get('w', pyramid.width))
+        max_height = int(request.args.get('h', pyramid.height))
+        quality = int(request.args.get('q', PREVIEW_QUALITY))
+    except ValueError:
+        return jsonify({'error': 'w, h and q must be integers'}), 400
+    
+    max_width = max(PREVIEW_MIN_SIDE, min(max_width, PREVIEW_MAX_SIDE))
+    max_height = max(PREVIEW_MIN_SIDE, min(max_height, PREVIEW_MAX_SIDE))
+    quality = max(1, min(quality, 95))
+    
+    accepts_webp = 'image/webp' in request.headers.get('Accept', '')
+    fmt = request.args.get('format', 'webp' if accepts_webp else 'jpeg').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in PREVIEW_FORMATS:
+        return jsonify({'error': f'Unsupported format {fmt}'}), 400
+    if fmt == 'webp' and not WEBP_SUPPORTED:
+        fmt = 'jpeg'
+    
+    data, (width, height) = pyramid.preview(max_width, max_height, fmt, quality)
+    
+    return Response(
+        data,
+        mimetype=PREVIEW_FORMATS[fmt][1],
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Preview-Size': f'{width}x{height}',
+            'X-Image-Size': f'{pyramid.width}x{pyramid.height}'
+        }
+    )
+
+
+@bp.route('/annotated/<image_id>')
+def annotated(image_id):
+    """
+    Изображение с разметкой треугольника и метаданными.
+    
+    Параметры запроса: vertices — x1,y1,x2,y2,x3,y3 в пикселях оригинала
+    (без них — только метаданные), pixel_size, k_vol, k_den, cone_type,
+    format — png|jpeg|webp (по умолчанию png), q — качество 1..95.
+    Результат кэшируется по хэшу изображения, вершин и параметров.
+    """
+    if not _IMAGE_ID_RE.match(image_id):
+        abort(404)
+    image_path = _image_path(image_id)
+    if not os.path.exists(image_path):
+        abort(404)
+    
+    try:
+        vertices_arg = request.args.get('vertices', '')
+        coords = [float(value) for value in vertices_arg.split(',')] if vertices_arg else []
+        params = {
+            'pixel_size': float(request.args.get('pixel_size', 0.1)),
+            'k_vol': float(request.args.get('k_vol', 1.0)),
+            'k_den': float(request.args.get('k_den', 1.7)),
+        }
+        quality = max(1, min(int(request.args.get('q', 90)), 95))
+    except ValueError:
+        return jsonify({'error': 'vertices, pixel_size, k_vol, k_den and q must be numbers'}), 400
+    if len(coords) not in (0, 6):
+        return jsonify({'error': 'Need exactly 3 vertices'}), 400
+    vertices = list(zip(coords[0::2], coords[1::2]))
+    
+    cone_type = request.args.get('cone_type')
+    if cone_type:
+        params['cone_type'] = cone_type.upper()
+    
+    fmt = request.args.get('format', 'png').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in ANNOTATED_FORMATS or (fmt == 'webp' and not WEBP_SUPPORTED):
+        return jsonify({'error': f'Unsupported format {fmt}'}), 400
+    
+    # Подпись времени — время сохранения кадра, поэтому результат детерминирован
+    mtime = os.stat(image_path).st_mtime
+    key = annotation_key(image_id, vertices, {**params, 'mtime': mtime, 'format': fmt, 'q': quality})
+    headers = {'Cache-Control': 'private, max-age=3600', 'ETag': f'"{key}"'}
+    if key in request.if_none_match:
+        return Response(status=304, headers=headers)
+    
+    resources = _resources()
+    data = resources.annotation_cache.get(key)
+    if data is None:
+        params['timestamp'] = datetime.fromtimestamp(mtime)
+        image = render_annotated(resources.load_image(image_path), vertices, params)
+        buffer = io.BytesIO()
+        image.save(buffer, format=ANNOTATED_FORMATS[fmt][0], quality=quality)
+        data = buffer.getvalue()
+        resources.annotation_cache.put(key, data)
+    
+    return Response(data, mimetype=ANNOTATED_FORMATS[fmt][1], headers=headers)
+
+
+def _preview_scale(data):
+    """
+    Коэффициенты (sx, sy) перехода от координат превью к оригиналу.
+    
+    Размер превью берётся из запроса (preview_size — [ширина, высота]
+    превью, на котором клиент строил вершины), а не из сессии: ответы
+    на перекрывающиеся запросы /preview приходят в произвольном порядке.
+    
+    Args:
+        data: JSON запроса с полями image_id и preview_size
+    
+    Raises:
+        ValueError: Если размер превью не задан или изображение не текущее
+    """
+    image_id = data.get('image_id')
+    if not image_id or image_id != session.get('current_image_id'):
+        raise ValueError('Preview belongs to another image')
+    
+    preview_size = data.get('preview_size')
+    try:
+        width, height = (float(value) for value in preview_size)
+    except (TypeError, ValueError):
+        raise ValueError('preview_size must be [width, height]')
+    if not (width > 0 and height > 0):
+        raise ValueError('preview_size must be positive')
+    
+    image_width, image_height = session['image_size']
+    return image_width / width, image_height / height
+
+
+def _to_original(vertices, data):
+    """Перевести вершины из координат превью в пиксели оригинала"""
+    sx, sy = _preview_scale(data)
+    return [[float(x) * sx, float(y) * sy] for x, y in vertices]
+
+
+def _to_preview(vertices, data):
+    """Перевести вершины из пикселей оригинала в координаты превью"""
+    sx, sy = _preview_scale(data)
+    return [[float(x) / sx, float(y) / sy] for x, y in vertices]
+
+
+@bp.route('/auto_detect', methods=['POST'])
 def auto_detect():
     """Автоматическое определение треугольника"""
     try:
@@ -164,7 +614,14 @@ def auto_detect():
         if not os.path.exists(image_path):
             return jsonify({'error': 'Image file not found'}), 400
         
-        image = Image.open(image_path)
+        # Масштаб превью проверяем до запуска детектора
+        if data.get('coords') == 'preview':
+            try:
+                _preview_scale(data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        image = _resources().load_image(image_path)
         
         # Получаем тип конуса из сессии (если загружено с Trassir)
         cone_type = session.get('current_cone_type', 'ZIF1')  # По умолчанию ZIF1
@@ -178,10 +635,17 @@ def auto_detect():
         
         if vertices and len(vertices) == 3:
             app_logger.info(f"Triangle auto-detected: {vertices}")
-            return jsonify({
+            response = {
                 'success': True,
-                'vertices': vertices
-            })
+                'vertices': vertices,
+                'coords': 'original'
+            }
+            # По запросу клиента возвращаем вершины в координатах превью
+            if data.get('coords') == 'preview':
+                response['vertices'] = _to_preview(vertices, data)
+                response['original_vertices'] = vertices
+                response['coords'] = 'preview'
+            return jsonify(response)
         else:
             return jsonify({'error': 'Failed to detect triangle'}), 400
     
@@ -190,7 +654,7 @@ def auto_detect():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/calculate', methods=['POST'])
+@bp.route('/calculate', methods=['POST'])
 def calculate():
     """Расчёт объёма конуса"""
     try:
@@ -203,6 +667,19 @@ def calculate():
         if len(vertices) != 3:
             return jsonify({'error': 'Need exactly 3 vertices'}), 400
         
+        # Камера: явно из запроса (для загруженных файлов) или снимка Trassir из сессии
+        camera = (data.get('camera') or session.get('current_cone_type') or '').upper() or None
+        if camera and not _resources().config.get(f"CAM_CONE_{camera}"):
+            return jsonify({'error': f'Camera {camera} not configured'}), 400
+        
+        # Вершины в координатах превью переводим в пиксели оригинала,
+        # чтобы точность расчёта не зависела от размера превью
+        if data.get('coords') == 'preview':
+            try:
+                vertices = _to_original(vertices, data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
         # Вычисляем стороны треугольника
         sides = []
         side_names = ['AB', 'BC', 'CA']
@@ -229,8 +706,31 @@ def calculate():
         
         app_logger.info(f"Calculated: Volume={cone_params['volume']:.2f} m³, Mass={mass:.2f} т")
         
+        # Расчёт по кнопке — выполненный замер: сохраняется в историю.
+        # Замер без камеры не попал бы ни в агрегаты, ни в ряды камер, поэтому не записывается
+        recorded = camera is not None
+        if recorded:
+            _resources().store.append({
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'camera': camera,
+                'source': 'web',
+                'triangle': [[float(x), float(y)] for x, y in vertices],
+                'pixel_size_m': pixel_size,
+                'k_vol': k_vol,
+                'k_den': k_den,
+                'volume': cone_params['volume'],
+                'mass': mass,
+                'radius_m': cone_params['radius_m'],
+                'height_m': cone_params['height_m'],
+                'frame_hash': data.get('image_id') or session.get('current_image_id'),
+            })
+        else:
+            app_logger.info("Calculation without camera not recorded to history")
+        
         return jsonify({
             'success': True,
+            'recorded': recorded,
+            'vertices': vertices,
             'sides': sides,
             'cone': {
                 'volume': cone_params['volume'],
@@ -245,9 +745,158 @@ def calculate():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/config', methods=['GET', 'POST'])
+@bp.route('/stream/<camera>')
+def stream(camera):
+    """Поток измерений камеры (Server-Sent Events)"""
+    camera = camera.upper()
+    if not _resources().config.get(f"CAM_CONE_{camera}"):
+        return jsonify({'error': f'Camera {camera} not configured'}), 404
+    
+    measurement_hub = _resources().measurement_hub
+    subscription = measurement_hub.subscribe(camera)
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while not subscription.closed:
+                event = subscription.get(timeout=STREAM_KEEPALIVE_S)
+                # Комментарий keep-alive не даёт прокси закрыть соединение
+                yield event if event else ': keep-alive\n\n'
+        finally:
+            measurement_hub.unsubscribe(subscription)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _query_camera():
+    """
+    Камера из параметра camera запроса (None — все камеры).
+    
+    Raises:
+        ValueError: Если камера не настроена
+    """
+    camera = (request.args.get('camera') or '').upper() or None
+    if camera and not _resources().config.get(f"CAM_CONE_{camera}"):
+        raise ValueError(f'Camera {camera} not configured')
+    return camera
+
+
+@bp.route('/export')
+def export():
+    """
+    Выгрузка истории измерений.
+    
+    Параметры запроса: camera — ZIF1|ZIF2 (по умолчанию все), from и to —
+    границы интервала в ISO 8601 (from включительно, to не включительно),
+    format — csv|jsonl|parquet (по умолчанию csv). Ответ передаётся
+    порциями по мере чтения журнала.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    try:
+        camera = _query_camera()
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        resources = _resources()
+        records = resources.store.records(camera, start, end)
+        chunks = export_chunks(
+            records, fmt, resources.config.get('EXPORT_CHUNK_ROWS', EXPORT_CHUNK_ROWS)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"measurements_{camera or 'all'}{extension}"
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'}
+    )
+
+
+@bp.route('/history')
+def history():
+    """
+    Агрегаты массы конуса по часам, сменам или суткам.
+    
+    Параметры запроса: camera — ZIF1|ZIF2 (по умолчанию все), from и to —
+    границы интервала в ISO 8601, resolution — hour|shift|day (по умолчанию
+    выбирается по длине интервала). Читает только таблицу агрегатов.
+    """
+    try:
+        camera = _query_camera()
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        resources = _resources()
+        result = resources.store.rollups(
+            camera, start, end, request.args.get('resolution') or None,
+            resources.config.get('HISTORY_MAX_BUCKETS', HISTORY_MAX_BUCKETS)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
+
+
+@bp.route('/history/<camera>')
+def history_series(camera):
+    """
+    Прореженный ряд массы камеры для графика.
+    
+    Параметры запроса: from и to — границы интервала в ISO 8601, points —
+    количество точек (по умолчанию HISTORY_POINTS). Ряд прореживается
+    алгоритмом LTTB, который сохраняет пики и провалы. Ответы кэшируются
+    по (камера, интервал, points) до записи нового измерения.
+    """
+    camera = camera.upper()
+    resources = _resources()
+    config = resources.config
+    if not config.get(f"CAM_CONE_{camera}"):
+        return jsonify({'error': f'Camera {camera} not configured'}), 404
+    
+    try:
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        points = int(request.args.get('points', config.get('HISTORY_POINTS', HISTORY_POINTS)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    max_points = config.get('HISTORY_MAX_POINTS', HISTORY_MAX_POINTS)
+    if not 3 <= points <= max_points:
+        return jsonify({'error': f'points must be between 3 and {max_points}'}), 400
+    
+    # Номер последнего измерения меняется при любой записи, в том числе
+    # из других рабочих процессов, поэтому устаревший ряд не отдаётся
+    key = (camera, start, end, points, resources.store.last_id())
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    headers = {'Cache-Control': 'no-cache', 'ETag': f'"{etag}"'}
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    
+    data = resources.history_cache.get(key)
+    if data is None:
+        timestamps, mass = resources.store.series(camera, start, end)
+        selected = lttb_indices(timestamps, mass, points)
+        data = current_app.json.dumps({
+            'camera': camera,
+            'total': len(timestamps),
+            'points': len(selected),
+            'timestamps': [
+                datetime.fromtimestamp(ts).isoformat(timespec='seconds') for ts in timestamps[selected].tolist()
+            ],
+            'mass': mass[selected].tolist(),
+        })
+        resources.history_cache.put(key, data)
+    
+    return Response(data, mimetype='application/json', headers=headers)
+
+
+@bp.route('/config', methods=['GET', 'POST'])
 def manage_config():
     """Управление конфигурацией"""
+    config = _resources().config
     if request.method == 'GET':
         # Возвращаем текущую конфигурацию
         return jsonify({
@@ -275,6 +924,62 @@ def manage_config():
             return jsonify({'error': str(e)}), 500
 
 
-if __name__ == '__main__':
+def main():
+    """
+    Точка запуска веб-приложения.
+    
+    Однопроцессный многопоточный режим: waitress (если установлен),
+    иначе встроенный сервер Werkzeug с потоками. Многопроцессный режим
+    (--workers > 1) использует gunicorn с предзагрузкой приложения в
+    мастер-процессе, поэтому прогрев выполняется один раз до fork().
+    """
+    parser = argparse.ArgumentParser(description="Cone web application")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--config', dest='config_path', default=None, help='Путь к config.json')
+    parser.add_argument('--threads', type=int, default=8, help='Потоков на процесс')
+    parser.add_argument('--workers', type=int, default=1, help='Рабочих процессов (gunicorn)')
+    parser.add_argument('--warmup', action='store_true', help='Прогреть OpenCV и каналы Trassir до приёма запросов')
+    parser.add_argument('--no-trassir-warmup', action='store_true', help='Не загружать каналы Trassir при прогреве')
+    parser.add_argument('--debug', action='store_true', help='Режим отладки Flask (только для разработки)')
+    args = parser.parse_args()
+    
     app_logger.info("Starting Flask web application")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app = create_app(args.config_path, warmup=args.warmup, warmup_trassir=not args.no_trassir_warmup)
+    
+    if args.debug:
+        app.run(debug=True, host=args.host, port=args.port)
+        return
+    
+    if args.workers > 1:
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise SystemExit("--workers > 1 requires gunicorn (Linux); on Windows use --threads")
+        
+        class _GunicornApp(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f"{args.host}:{args.port}")
+                self.cfg.set('workers', args.workers)
+                self.cfg.set('threads', args.threads)
+                self.cfg.set('worker_class', 'gthread')
+                self.cfg.set('preload_app', True)
+            
+            def load(self):
+                return app
+        
+        _GunicornApp().run()
+        return
+    
+    try:
+        from waitress import serve
+    except ImportError:
+        app_logger.info("waitress not installed, using threaded Werkzeug server")
+        app.run(host=args.host, port=args.port, threaded=True)
+        return
+    
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
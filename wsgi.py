@@ -0,0 +1,22 @@
+"""
+Точка входа WSGI для production-серверов
+
+Gunicorn (Linux), прогрев в мастер-процессе до fork():
+    CONE_WARMUP=1 gunicorn --preload -w 4 --threads 8 -k gthread -b 0.0.0.0:5000 wsgi:app
+
+Waitress (Windows), один процесс с пулом потоков:
+    waitress-serve --threads=8 --host=0.0.0.0 --port=5000 wsgi:app
+
+Переменные окружения:
+    CONE_CONFIG      — путь к config.json
+    CONE_WARMUP      — 1, чтобы прогреть OpenCV и каналы Trassir до приёма запросов
+    CONE_SECRET_KEY  — общий для всех процессов ключ сессий
+"""
+import os
+
+from web_app import create_app
+
+app = create_app(
+    config_path=os.environ.get('CONE_CONFIG'),
+    warmup=os.environ.get('CONE_WARMUP', '0') == '1'
+)